@@ -0,0 +1,79 @@
+"""
+Approximate Nearest-Neighbour Search for Pose Matching
+
+A small inverted-file (IVF) index in pure NumPy. Pose vectors are the
+compared upper-body joints flattened to 12 numbers; k-means splits them
+into `nlist` cells, and a query only visits the `nprobe` cells whose
+centroids are closest. Candidates from those cells are then scored
+exactly by matching.PoseIndex, so approximation only affects which
+monkeys get scored, never how.
+"""
+
+import math
+from typing import Optional
+
+import numpy as np
+
+# Rows per chunk when assigning vectors to centroids (bounds peak memory)
+ASSIGN_CHUNK = 8192
+# k-means is trained on at most this many points per cell
+TRAIN_POINTS_PER_CELL = 64
+
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid for every vector (squared L2)."""
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    assignment = np.empty(len(vectors), dtype=np.intp)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = vectors[start:start + ASSIGN_CHUNK]
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, and |x|^2 doesn't change the argmin
+        distances = centroid_norms - 2.0 * chunk @ centroids.T
+        assignment[start:start + ASSIGN_CHUNK] = distances.argmin(axis=1)
+    return assignment
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; returns (k, D) centroids. Empty cells keep their old centroid."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroid(vectors, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over a fixed set of vectors."""
+
+    def __init__(self, vectors: np.ndarray, nlist: Optional[int] = None, seed: int = 0):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.size = len(vectors)
+        self.nlist = max(1, min(nlist or int(math.sqrt(self.size)), self.size))
+
+        # Train on a sample, then assign every vector once
+        rng = np.random.default_rng(seed)
+        train_size = min(self.size, self.nlist * TRAIN_POINTS_PER_CELL)
+        sample = vectors[rng.choice(self.size, size=train_size, replace=False)]
+        self.centroids = kmeans(sample, self.nlist, seed=seed)
+        assignment = _nearest_centroid(vectors, self.centroids)
+
+        # Cell c holds members[offsets[c]:offsets[c + 1]], each in ascending order
+        self.members = np.argsort(assignment, kind="stable")
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.intp)
+        np.cumsum(np.bincount(assignment, minlength=self.nlist), out=self.offsets[1:])
+
+    def search(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Positions of all vectors in the `nprobe` cells nearest to `query`, ascending."""
+        nprobe = min(max(1, nprobe), self.nlist)
+        distances = ((self.centroids - query) ** 2).sum(axis=1)
+        if nprobe < self.nlist:
+            cells = np.argpartition(distances, nprobe - 1)[:nprobe]
+        else:
+            cells = np.arange(self.nlist)
+        hits = np.concatenate([self.members[self.offsets[c]:self.offsets[c + 1]] for c in cells])
+        hits.sort()
+        return hits
@@ -0,0 +1,1076 @@
+"""
+Backend Benchmarks
+
+Offline benchmarks for the /analyze hot path. Everything runs on synthetic
+inputs, so no camera, network or monkey images are needed.
+
+Usage:
+    python benchmark.py decode [--width 4032 --height 3024 -n 20]
+    python benchmark.py decode-scale [--edges 0,1920,1280,960,640,480]
+    python benchmark.py face-roi [--edges 640,1280,0]
+    python benchmark.py face-plan [--monkeys 0 --poses 500]
+    python benchmark.py detect-mode [-n 30]
+    python benchmark.py stream [--frames 90 --fps 15]
+    python benchmark.py stream-track [--frames 600 --jitter 0.01]
+    python benchmark.py match-index [--monkeys 10000]
+    python benchmark.py match-scale [--sizes 50,1000,10000,100000]
+    python benchmark.py match-ann [--sizes 10000,100000 --nprobe 1,4,8,16 -k 10]
+    python benchmark.py dataset-load [--sizes 50,10000,100000]
+    python benchmark.py loadtest [--mode asgi|uvicorn --concurrency 1,4,16 -n 200]
+    python benchmark.py micro [--monkeys 0,10000]
+    python benchmark.py importtime [--modules main,pipeline,matching,create_dataset]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+def _photo_background(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """A photo-like (gradient + noise) BGR image."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = (x + y) / 2
+    image[..., 1] = x[::-1] * 0.8 + y * 0.2
+    image[..., 2] = y
+    image += rng.integers(0, 24, size=image.shape, dtype=np.uint8)
+    return image
+
+
+def _encode_jpeg(image: np.ndarray, quality: int = 90) -> bytes:
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Could not encode synthetic image")
+    return encoded.tobytes()
+
+
+def synthetic_jpeg(width: int, height: int, quality: int = 90, seed: int = 0) -> bytes:
+    """Encode a photo-like (gradient + noise) JPEG of the given size."""
+    return _encode_jpeg(_photo_background(width, height, seed), quality)
+
+
+# Limbs drawn for a skeleton, as MediaPipe landmark index pairs
+SKELETON_EDGES = [
+    (11, 12), (11, 13), (13, 15), (12, 14), (14, 16),  # shoulders and arms
+    (11, 23), (12, 24), (23, 24),                      # torso
+    (23, 25), (25, 27), (24, 26), (26, 28),            # legs
+    (15, 19), (16, 20), (27, 31), (28, 32),            # hands and feet
+]
+
+
+def synthetic_pose_jpeg(template: str, width: int = 960, height: int = 1280, seed: int = 0) -> bytes:
+    """
+    A stick figure in one of the generate_synthetic_poses templates, drawn
+    over a photo-like background. Whether MediaPipe finds a pose in it
+    doesn't matter for load testing: every stage still runs on a realistic
+    upload size.
+    """
+    from generate_synthetic_poses import POSE_TEMPLATES, create_base_pose, modify_pose
+
+    rng = np.random.default_rng(seed)
+    pose = modify_pose(create_base_pose(), POSE_TEMPLATES[template]) + rng.normal(0, 0.01, (33, 2))
+    return _encode_jpeg(_draw_skeleton(pose, width, height, seed))
+
+
+def _draw_skeleton(pose: np.ndarray, width: int, height: int, seed: int = 0) -> np.ndarray:
+    """A BGR image of the (33, 2) normalized `pose` as a stick figure."""
+    points = [(int(x * width), int(y * height)) for x, y in np.clip(pose, 0, 1)]
+    image = _photo_background(width, height, seed)
+    limb = max(2, width // 40)
+    skin, shirt = (150, 180, 225), (90, 60, 40)
+    for a, b in SKELETON_EDGES:
+        cv2.line(image, points[a], points[b], shirt if a in (11, 12, 23, 24) else skin, limb, cv2.LINE_AA)
+    head = int(abs(points[7][0] - points[8][0]) * 0.9) or limb
+    cv2.circle(image, points[0], head, skin, -1, cv2.LINE_AA)
+    for eye in (2, 5):
+        cv2.circle(image, points[eye], max(1, head // 8), (30, 30, 30), -1, cv2.LINE_AA)
+    return image
+
+
+def synthetic_pose_uploads(count: int, width: int = 960, height: int = 1280) -> list:
+    """`count` distinct stick-figure JPEGs cycling through every pose template."""
+    from generate_synthetic_poses import POSE_TEMPLATES
+
+    templates = list(POSE_TEMPLATES)
+    return [synthetic_pose_jpeg(templates[i % len(templates)], width, height, seed=i) for i in range(count)]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def process_tree_peak_rss_mb(pid: int) -> Optional[float]:
+    """
+    Summed peak RSS (VmHWM) of a process and its live descendants, e.g. a
+    uvicorn server and its process-pool workers. None without /proc.
+    """
+    total_kb, pending = 0, [pid]
+    try:
+        while pending:
+            current = pending.pop()
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total_kb += int(line.split()[1])
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+    except (OSError, ValueError):
+        return None if total_kb == 0 else total_kb / 1024
+    return total_kb / 1024
+
+
+def percentile(samples, pct: float) -> float:
+    return float(np.percentile(samples, pct)) if len(samples) else 0.0
+
+
+# ============================================================
+# decode: legacy double decode vs shared Frame
+# ============================================================
+
+def _decode_legacy(image_bytes: bytes):
+    """What /analyze used to do: cv2 decode for face, PIL decode for pose."""
+    import mediapipe as mp
+    from pose_detection import bytes_to_image
+
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    cv_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    cv_image_rgb = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
+    face_input = mp.Image(image_format=mp.ImageFormat.SRGB, data=cv_image_rgb)
+    pose_input = mp.Image(image_format=mp.ImageFormat.SRGB, data=bytes_to_image(image_bytes))
+    return face_input, pose_input
+
+
+def _decode_shared(image_bytes: bytes):
+    """Single decode, one mp.Image shared by both detectors."""
+    from frame import decode_frame
+
+    # Full resolution, to isolate the double-decode saving (see decode-scale)
+    frame = decode_frame(image_bytes, max_edge=0)
+    return frame.mp_image, frame.mp_image
+
+
+DECODE_VARIANTS = {
+    "legacy": _decode_legacy,
+    "shared": _decode_shared,
+}
+
+
+def _run_decode_variant(variant: str, width: int, height: int, iterations: int) -> dict:
+    image_bytes = synthetic_jpeg(width, height)
+    decode = DECODE_VARIANTS[variant]
+
+    decode(image_bytes)  # warm imports and codec tables
+    baseline_rss = peak_rss_mb()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        decode(image_bytes)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "variant": variant,
+        "upload_kb": round(len(image_bytes) / 1024, 1),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_delta_mb": round(peak_rss_mb() - baseline_rss, 1),
+    }
+
+
+def bench_decode(args):
+    """Compare per-request decode cost, each variant in a fresh process."""
+    if args.variant:
+        print(json.dumps(_run_decode_variant(args.variant, args.width, args.height, args.iterations)))
+        return
+
+    print(f"Decode benchmark: {args.width}x{args.height} JPEG, {args.iterations} iterations")
+    print(f"{'variant':<10}{'upload KB':>12}{'p50 ms':>10}{'p95 ms':>10}{'peak RSS MB':>14}{'Δ RSS MB':>10}")
+    for variant in DECODE_VARIANTS:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "decode",
+             "--variant", variant,
+             "--width", str(args.width), "--height", str(args.height),
+             "-n", str(args.iterations)],
+            check=True, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{r['variant']:<10}{r['upload_kb']:>12}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['peak_rss_mb']:>14}{r['peak_rss_delta_mb']:>10}")
+
+
+# ============================================================
+# decode-scale: downscale during decode at several target sizes
+# ============================================================
+
+def _run_decode_scale(max_edge: int, width: int, height: int, iterations: int) -> dict:
+    from frame import decode_frame
+    from face_detection import classify_face_expression
+    from pose_detection import extract_pose
+
+    image_bytes = synthetic_jpeg(width, height)
+    frame = decode_frame(image_bytes, max_edge)  # warm imports and codec tables
+    classify_face_expression(frame.mp_image)
+    extract_pose(frame.mp_image)
+    baseline_rss = peak_rss_mb()
+
+    decode_ms, detect_ms = [], []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        frame = decode_frame(image_bytes, max_edge)
+        decoded = time.perf_counter()
+        classify_face_expression(frame.mp_image)
+        extract_pose(frame.mp_image)
+        decode_ms.append((decoded - start) * 1000)
+        detect_ms.append((time.perf_counter() - decoded) * 1000)
+
+    return {
+        "max_edge": max_edge,
+        "frame": f"{frame.width}x{frame.height}",
+        "decode_p50_ms": round(percentile(decode_ms, 50), 2),
+        "decode_p95_ms": round(percentile(decode_ms, 95), 2),
+        "detect_p50_ms": round(percentile(detect_ms, 50), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_delta_mb": round(peak_rss_mb() - baseline_rss, 1),
+    }
+
+
+def bench_decode_scale(args):
+    """Decode + detection cost per target long edge, each in a fresh process."""
+    if args.edge is not None:
+        print(json.dumps(_run_decode_scale(args.edge, args.width, args.height, args.iterations)))
+        return
+
+    print(f"Decode-scale benchmark: {args.width}x{args.height} JPEG, {args.iterations} iterations "
+          f"(max edge 0 = full resolution; detect = face + pose)")
+    print(f"{'max edge':>9}{'frame':>12}{'decode p50':>12}{'decode p95':>12}{'detect p50':>12}"
+          f"{'peak RSS MB':>13}{'Δ RSS MB':>10}")
+    for edge in args.edges:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "decode-scale",
+             "--edge", str(edge),
+             "--width", str(args.width), "--height", str(args.height),
+             "-n", str(args.iterations)],
+            check=True, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{r['max_edge']:>9}{r['frame']:>12}{r['decode_p50_ms']:>12}{r['decode_p95_ms']:>12}"
+              f"{r['detect_p50_ms']:>12}{r['peak_rss_mb']:>13}{r['peak_rss_delta_mb']:>10}")
+
+
+# ============================================================
+# face-roi: face detection on the whole frame vs the pose's head ROI
+# ============================================================
+
+def bench_face_roi(args):
+    """BlazeFace cost per request, full frame vs head ROI from the template pose."""
+    from face_detection import classify_face_expression, classify_face_expression_in_roi, head_roi
+    from frame import decode_frame
+    from generate_synthetic_poses import create_base_pose
+
+    image_bytes = synthetic_pose_jpeg("hands_hips", args.width, args.height)
+    keypoints = create_base_pose()
+    print(f"Face detection, {args.width}x{args.height} stick-figure JPEG, {args.iterations} iterations")
+    print(f"{'max edge':>9}{'frame':>12}{'ROI':>10}{'full frame µs':>15}{'head ROI µs':>13}")
+    for edge in args.edges:
+        frame = decode_frame(image_bytes, edge)
+        roi = head_roi(keypoints, frame.width, frame.height)
+        full_us = time_per_call_us(classify_face_expression, [(frame.mp_image,)] * args.iterations)
+        roi_us = time_per_call_us(classify_face_expression_in_roi, [(frame.rgb, roi)] * args.iterations)
+        print(f"{edge:>9}{f'{frame.width}x{frame.height}':>12}{f'{roi[2] - roi[0]}x{roi[3] - roi[1]}':>10}"
+              f"{full_us:>15,.0f}{roi_us:>13,.0f}")
+
+
+def bench_face_plan(args):
+    """How often the face planner skips BlazeFace, and what that saves per request."""
+    from collections import Counter
+
+    from face_detection import classify_face_expression_in_roi, head_roi
+    from frame import decode_frame
+    from generate_synthetic_poses import create_base_pose
+    from pipeline import face_skip_reason
+    from pose_types import classify_pose
+
+    snapshot = _use_catalogue(args.monkeys)
+    plan = snapshot.index.expression_blind
+    poses = synthetic_user_poses(args.poses)
+    per_type = Counter()
+    skipped = Counter()
+    for keypoints in poses:
+        pose_type, _ = classify_pose(keypoints)
+        per_type[pose_type] += 1
+        if face_skip_reason(keypoints, plan):
+            skipped[pose_type] += 1
+
+    frame = decode_frame(synthetic_pose_jpeg("hands_hips"), args.edge)
+    roi = head_roi(create_base_pose(), frame.width, frame.height)
+    face_us = time_per_call_us(classify_face_expression_in_roi, [(frame.rgb, roi)] * args.iterations)
+    plan_us = time_per_call_us(face_skip_reason, [(keypoints, plan) for keypoints in poses])
+
+    print(f"Catalogue: {len(snapshot.rows)} monkeys ({snapshot.source}); "
+          f"expression-blind pose types: {', '.join(sorted(plan)) or 'none'}")
+    print(f"{'pose type':>12}{'requests':>10}{'skipped':>9}")
+    for pose_type, count in sorted(per_type.items()):
+        print(f"{pose_type:>12}{count:>10}{skipped[pose_type]:>9}")
+    skip_rate = sum(skipped.values()) / len(poses)
+    print(f"Skip rate {skip_rate:.0%} (plus every request without a pose)")
+    print(f"Face detection (head ROI, {frame.width}x{frame.height}): {face_us:,.0f} µs; planner: {plan_us:,.1f} µs")
+    print(f"Expected saving: {skip_rate * face_us - plan_us:,.0f} µs per request with a pose")
+
+
+# ============================================================
+# detect-mode: face and pose one after the other vs concurrently
+# ============================================================
+
+def bench_detect_mode(args):
+    """run_detection latency per MONKEY_DETECTION_MODE, cache off, one request at a time."""
+    import config
+    import pipeline
+    from detection_cache import DetectionCache
+
+    pipeline._cache = DetectionCache(0)
+    image_bytes = synthetic_pose_jpeg("hands_hips", args.width, args.height)
+    print(f"run_detection, {args.width}x{args.height} stick-figure JPEG, {args.iterations} iterations")
+    print(f"{'mode':>12}{'p50 ms':>9}{'p95 ms':>9}  stages (p50 ms)")
+    for mode in ("sequential", "concurrent"):
+        config.DETECTION_MODE = mode
+        pipeline.run_detection(image_bytes)  # first call builds this mode's models
+        totals, stages = [], {}
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            detection = pipeline.run_detection(image_bytes)
+            totals.append((time.perf_counter() - start) * 1000)
+            for name, elapsed_ms in detection.timings.items():
+                stages.setdefault(name, []).append(elapsed_ms)
+        breakdown = " ".join(f"{name}={np.percentile(values, 50):.1f}" for name, values in stages.items())
+        print(f"{mode:>12}{np.percentile(totals, 50):>9.1f}{np.percentile(totals, 95):>9.1f}  {breakdown}")
+
+
+# ============================================================
+# stream: per-frame detection vs VIDEO-mode tracking
+# ============================================================
+
+def synthetic_pose_clip(frames: int, width: int, height: int) -> list:
+    """JPEG frames of a stick figure moving smoothly between two templates."""
+    from generate_synthetic_poses import POSE_TEMPLATES, create_base_pose, modify_pose
+
+    base = create_base_pose()
+    start = modify_pose(base, POSE_TEMPLATES["hands_hips"])
+    end = modify_pose(base, POSE_TEMPLATES["arms_up"])
+    clip = []
+    for i in range(frames):
+        t = i / max(1, frames - 1)
+        clip.append(_encode_jpeg(_draw_skeleton((1 - t) * start + t * end, width, height)))
+    return clip
+
+
+def bench_stream(args):
+    """Pose cost per frame of a clip: IMAGE-mode detect() vs the stream's detect_for_video()."""
+    from frame import decode_frame
+    from pose_detection import create_pose_landmarker, extract_pose, extract_pose_from_video
+
+    clip = [decode_frame(jpeg).mp_image for jpeg in synthetic_pose_clip(args.frames, args.width, args.height)]
+    print(f"Pose per frame, {args.frames}-frame {args.width}x{args.height} clip")
+    print(f"{'mode':>8}{'p50 ms':>9}{'p95 ms':>9}{'found':>7}")
+    image_ms, image_found = [], 0
+    for mp_image in clip:
+        start = time.perf_counter()
+        keypoints, _, _ = extract_pose(mp_image)
+        image_ms.append((time.perf_counter() - start) * 1000)
+        image_found += keypoints is not None
+    video_ms, video_found = [], 0
+    landmarker = create_pose_landmarker(video=True)
+    try:
+        for i, mp_image in enumerate(clip):
+            start = time.perf_counter()
+            keypoints, _, _ = extract_pose_from_video(landmarker, mp_image, i * 1000 // args.fps)
+            video_ms.append((time.perf_counter() - start) * 1000)
+            video_found += keypoints is not None
+    finally:
+        landmarker.close()
+    for mode, times, found in (("image", image_ms, image_found), ("video", video_ms, video_found)):
+        print(f"{mode:>8}{np.percentile(times, 50):>9.1f}{np.percentile(times, 95):>9.1f}{found:>7}")
+
+
+def synthetic_keypoint_clip(frames: int, jitter: float, seed: int = 0) -> list:
+    """Noisy (33, 2) keypoints of a person holding each pose template in turn, like a tracker's output."""
+    from generate_synthetic_poses import POSE_TEMPLATES, create_base_pose, modify_pose
+
+    rng = np.random.default_rng(seed)
+    base = create_base_pose()
+    templates = list(POSE_TEMPLATES)
+    hold = max(1, frames // len(templates))
+    return [
+        modify_pose(base, POSE_TEMPLATES[templates[(i // hold) % len(templates)]]) + rng.normal(0, jitter, base.shape)
+        for i in range(frames)
+    ]
+
+
+def bench_stream_track(args):
+    """Per-frame guidance cost and payload: classify + match every frame vs PoseTracker."""
+    from matching import preview_match
+    from pose_types import classify_pose
+    from streaming import PoseTracker
+
+    _use_catalogue(args.monkeys)
+    clip = synthetic_keypoint_clip(args.frames, args.jitter)
+    debug = {"partial": False}
+
+    def every_frame():
+        messages, previous, flips = [], None, 0
+        for keypoints in clip:
+            pose_type, classification = classify_pose(keypoints)
+            flips += previous is not None and pose_type != previous
+            previous = pose_type
+            messages.append(json.dumps({
+                "type": "pose", "pose_detected": True, "pose_type": pose_type, "confidence": 0.9,
+                "partial": False, "classification": classification, "match": preview_match(keypoints, pose_type),
+            }))
+        return messages, len(clip), flips
+
+    def tracked():
+        tracker = PoseTracker(args.smoothing, args.rematch_distance, args.hold_frames)
+        messages, previous, flips = [], None, 0
+        for keypoints in clip:
+            event = tracker.update(keypoints, 0.9, debug)
+            if event is not None:
+                messages.append(json.dumps({"type": "pose", **event}, default=float))
+                flips += previous is not None and event["pose_type"] != previous
+                previous = event["pose_type"]
+        return messages, tracker.matches, flips
+
+    print(f"Stream guidance, {args.frames} frames, jitter {args.jitter}, "
+          f"smoothing {args.smoothing}, hold {args.hold_frames} frames, rematch distance {args.rematch_distance}")
+    print(f"{'mode':>12}{'µs/frame':>10}{'matches':>9}{'messages':>10}{'bytes':>9}{'type flips':>12}")
+    for mode, fn in (("every frame", every_frame), ("tracker", tracked)):
+        per_frame_us = time_per_call_us(fn, [()]) / len(clip)
+        messages, matches, flips = fn()
+        print(f"{mode:>12}{per_frame_us:>10,.1f}{matches:>9}{len(messages):>10}"
+              f"{sum(len(m) for m in messages):>9,}{flips:>12}")
+
+
+# ============================================================
+# Synthetic monkey catalogue
+# ============================================================
+
+SYNTHETIC_EXTRA_WORDS = ["happy", "cool", "surprised", "screaming", "sideeye", "looking_up", "victory", "monkey1"]
+
+
+def synthetic_dataset(size: int, seed: int = 0) -> list:
+    """
+    A catalogue of `size` monkeys shaped like monkey_dataset.json.
+    
+    IDs mix pose-template names with expression words, so every pose-type
+    and expression pattern in matching.py has realistic hit rates. Poses
+    are the template skeletons plus a little noise.
+    """
+    from generate_synthetic_poses import POSE_TEMPLATES, create_base_pose, modify_pose
+
+    rng = np.random.default_rng(seed)
+    templates = list(POSE_TEMPLATES)
+    base = create_base_pose()
+    dataset = []
+    for i in range(size):
+        template = templates[rng.integers(len(templates))]
+        words = [template]
+        if rng.random() < 0.3:
+            words.append(SYNTHETIC_EXTRA_WORDS[rng.integers(len(SYNTHETIC_EXTRA_WORDS))])
+        pose = np.clip(modify_pose(base, POSE_TEMPLATES[template]) + rng.normal(0, 0.02, base.shape), 0, 1)
+        dataset.append({
+            "id": f"monkey_{'_'.join(words)}_{i}",
+            "image": f"/monkeys/synthetic_{i}.jpg",
+            "species": "Synthetic Primate",
+            "pose": pose.tolist(),
+            "confidence": 0.75,
+            "has_pose": True,
+            "synthetic": True,
+        })
+    return dataset
+
+
+def synthetic_user_poses(count: int, seed: int = 1) -> list:
+    """User keypoints (33, 2) covering every pose template."""
+    from generate_synthetic_poses import POSE_TEMPLATES, create_base_pose, modify_pose
+
+    rng = np.random.default_rng(seed)
+    templates = list(POSE_TEMPLATES)
+    base = create_base_pose()
+    return [
+        modify_pose(base, POSE_TEMPLATES[templates[i % len(templates)]]) + rng.normal(0, 0.03, base.shape)
+        for i in range(count)
+    ]
+
+
+def time_per_call_us(fn, args_list, repeat: int = 3) -> float:
+    """Best-of-`repeat` mean microseconds per call over `args_list`."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in args_list:
+            fn(*args)
+        best = min(best, (time.perf_counter() - start) / len(args_list))
+    return best * 1e6
+
+
+# ============================================================
+# match-index: substring scans vs precompiled PoseIndex
+# ============================================================
+
+def _legacy_candidates(dataset: list, pose_type: str, expression: str) -> list:
+    """The per-request scans find_best_match used to do."""
+    from matching import POSE_TYPE_PATTERNS, DEFAULT_POSE_PATTERNS, EXPRESSION_PATTERNS
+
+    type_patterns = dict(POSE_TYPE_PATTERNS)  # rebuilt on every call
+    patterns = type_patterns.get(pose_type, DEFAULT_POSE_PATTERNS)
+    matches = []
+    for monkey in dataset:
+        monkey_id = monkey.get("id", "").lower()
+        for pattern in patterns:
+            if pattern in monkey_id:
+                matches.append(monkey)
+                break
+    if not matches:
+        matches = dataset
+
+    boost_patterns = EXPRESSION_PATTERNS.get(expression, [])
+    candidates = []
+    for monkey in matches:
+        monkey_id = monkey.get("id", "").lower()
+        boosted = False
+        for pattern in boost_patterns:
+            if pattern in monkey_id:
+                boosted = True
+                break
+        candidates.append((monkey, boosted))
+    return candidates
+
+
+def bench_match_index(args):
+    """Candidate selection cost on a synthetic catalogue, checked for equality."""
+    from matching import PoseIndex, POSE_TYPE_PATTERNS, EXPRESSION_PATTERNS
+
+    dataset = synthetic_dataset(args.monkeys)
+    pose_types = list(POSE_TYPE_PATTERNS) + ["not_a_pose_type"]
+    expressions = list(EXPRESSION_PATTERNS) + ["unknown"]
+    queries = [(p, e) for p in pose_types for e in expressions]
+
+    start = time.perf_counter()
+    index = PoseIndex(dataset)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    for pose_type, expression in queries:
+        legacy = _legacy_candidates(dataset, pose_type, expression)
+        indexed = index.lookup(pose_type, expression)
+        if [(id(m), b) for m, b in legacy] != [(id(m), b) for m, b in indexed]:
+            raise AssertionError(f"PoseIndex differs from legacy scan for {pose_type}/{expression}")
+
+    legacy_us = time_per_call_us(lambda p, e: _legacy_candidates(dataset, p, e), queries)
+    index_us = time_per_call_us(index.lookup, queries)
+
+    print(f"Candidate selection over {args.monkeys} monkeys, {len(queries)} pose/expression queries")
+    print(f"  results identical to legacy scan: yes")
+    print(f"  index build (once per load): {build_ms:.1f} ms")
+    print(f"  legacy substring scan:       {legacy_us:,.1f} µs/request")
+    print(f"  PoseIndex.lookup:            {index_us:,.2f} µs/request")
+
+
+# ============================================================
+# match-scale: per-monkey Python loop vs vectorized scoring
+# ============================================================
+
+def _legacy_score_loop(user_pose, candidates):
+    """The per-candidate loop find_best_match used before vectorization."""
+    from matching import calculate_pose_distance, EXPRESSION_BOOST
+
+    best_score, best_match, all_scores = 0.0, None, []
+    for monkey, boosted in candidates:
+        monkey_pose = np.array(monkey.get("pose", []))
+        score = max(0, 100 - calculate_pose_distance(user_pose, monkey_pose) * 30)
+        if boosted:
+            score = min(100, score + EXPRESSION_BOOST)
+        all_scores.append((monkey["id"], round(score, 1)))
+        if score > best_score or best_match is None:
+            best_score, best_match = score, monkey
+    return best_match, sorted(all_scores, key=lambda x: -x[1])[:3]
+
+
+def _vectorized_score(index, user_pose, candidates):
+    from matching import top_scores
+
+    scores = index.score(user_pose, candidates)
+    return candidates.monkeys[int(np.argmax(scores))], top_scores(candidates, scores)
+
+
+def bench_match_scale(args):
+    """Scoring latency as the catalogue grows, legacy loop vs broadcast."""
+    from matching import PoseIndex, classify_pose
+
+    user_poses = synthetic_user_poses(args.queries)
+    print(f"Scoring per request (pose-type candidates, best + top-3), {args.queries} queries")
+    print(f"{'monkeys':>9}{'candidates':>12}{'legacy loop µs':>16}{'vectorized µs':>15}{'same best':>11}")
+    for size in args.sizes:
+        index = PoseIndex(synthetic_dataset(size))
+        queries = [(index, pose, index.lookup(classify_pose(pose)[0], "smiling")) for pose in user_poses]
+        avg_candidates = int(np.mean([len(c) for _, _, c in queries]))
+
+        vector_us = time_per_call_us(_vectorized_score, queries)
+        if size <= args.legacy_max:
+            legacy_queries = [(pose, c) for _, pose, c in queries]
+            legacy_us = f"{time_per_call_us(_legacy_score_loop, legacy_queries, repeat=1):,.0f}"
+            same = all(
+                _legacy_score_loop(pose, c)[0] is _vectorized_score(idx, pose, c)[0]
+                for idx, pose, c in queries
+            )
+            same = "yes" if same else "NO"
+        else:
+            legacy_us, same = "skipped", "-"
+        print(f"{size:>9}{avg_candidates:>12}{legacy_us:>16}{vector_us:>15,.0f}{same:>11}")
+
+
+# ============================================================
+# match-ann: exact vs IVF search, recall@k and latency
+# ============================================================
+
+def bench_match_ann(args):
+    """Recall@k and latency of approximate search against exact scoring."""
+    import config
+    from matching import PoseIndex, classify_pose, top_scores
+
+    user_poses = synthetic_user_poses(args.queries)
+    print(f"Approximate pose search, {args.queries} queries, recall@{args.k} vs exact")
+    print(f"{'monkeys':>9}{'candidates':>12}{'build s':>9}{'nprobe':>8}{'scored':>9}"
+          f"{'recall@k':>10}{'top-1':>8}{'exact µs':>10}{'approx µs':>11}")
+    for size in args.sizes:
+        dataset = synthetic_dataset(size)
+        start = time.perf_counter()
+        index = PoseIndex(dataset, search="approximate")
+        build_s = time.perf_counter() - start
+        full_sets = [index.lookup(classify_pose(pose)[0], "unknown") for pose in user_poses]
+
+        def exact(pose, candidates):
+            return top_scores(candidates, index.score(pose, candidates), args.k)
+
+        truth = [exact(pose, c) for pose, c in zip(user_poses, full_sets)]
+        exact_us = time_per_call_us(exact, list(zip(user_poses, full_sets)))
+        avg_candidates = int(np.mean([len(c) for c in full_sets]))
+
+        for nprobe in args.nprobe:
+            def approximate(pose, candidates):
+                shortlist = index.shortlist(pose, candidates, nprobe)
+                return top_scores(shortlist, index.score(pose, shortlist), args.k), len(shortlist)
+
+            results = [approximate(pose, c) for pose, c in zip(user_poses, full_sets)]
+            recall = np.mean([
+                len({i for i, _ in found} & {i for i, _ in expected}) / max(1, len(expected))
+                for (found, _), expected in zip(results, truth)
+            ])
+            top1 = np.mean([found[0][0] == expected[0][0] for (found, _), expected in zip(results, truth)])
+            scored = int(np.mean([n for _, n in results]))
+            approx_us = time_per_call_us(approximate, list(zip(user_poses, full_sets)))
+            print(f"{size:>9}{avg_candidates:>12}{build_s:>9.1f}{nprobe:>8}{scored:>9}"
+                  f"{recall:>10.3f}{top1:>8.2f}{exact_us:>10,.0f}{approx_us:>11,.0f}")
+    print(f"(pose types with fewer than {config.ANN_MIN_CANDIDATES} candidates are always searched exactly)")
+
+
+# ============================================================
+# dataset-load: JSON parse vs memory-mapped binary
+# ============================================================
+
+def bench_dataset_load(args):
+    """Worker start-up cost of loading the catalogue, JSON vs binary."""
+    import tempfile
+    import dataset_io
+
+    print(f"{'monkeys':>9}{'JSON MB':>9}{'npy MB':>8}{'JSON load ms':>14}{'binary load ms':>16}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, "monkey_dataset.json")
+            dataset_io.save_dataset(synthetic_dataset(size), json_path)
+            poses_path, _ = dataset_io.binary_paths(json_path)
+
+            def load_json():
+                with open(json_path, "r") as f:
+                    dataset = json.load(f)
+                return dataset_io.pose_matrix(dataset)
+
+            def load_binary():
+                loaded = dataset_io.load_dataset(json_path)
+                assert loaded.source == "binary"
+                return loaded
+
+            json_ms = time_per_call_us(load_json, [()], repeat=3) / 1000
+            binary_ms = time_per_call_us(load_binary, [()], repeat=3) / 1000
+            print(f"{size:>9}{os.path.getsize(json_path) / 1e6:>9.1f}{os.path.getsize(poses_path) / 1e6:>8.1f}"
+                  f"{json_ms:>14,.1f}{binary_ms:>16,.1f}")
+
+
+# ============================================================
+# loadtest: /analyze end to end, in-process ASGI or local uvicorn
+# ============================================================
+
+async def _drive_analyze(client, uploads: list, total: int, concurrency: int) -> dict:
+    """
+    POST `total` uploads to /analyze from `concurrency` concurrent clients,
+    each keeping its own session like a returning user. Returns latency
+    percentiles (ms), throughput and a count per status code.
+    """
+    latencies, statuses = [], {}
+    issued = 0
+
+    async def user(slot: int):
+        nonlocal issued
+        session_id = f"loadtest-{slot}-{time.time_ns()}"
+        while issued < total:
+            upload = uploads[issued % len(uploads)]
+            issued += 1
+            start = time.perf_counter()
+            response = await client.post(
+                "/analyze",
+                files={"image": ("pose.jpg", upload, "image/jpeg")},
+                headers={"X-Session-ID": session_id},
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(slot) for slot in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "rps": len(latencies) / wall,
+        "statuses": statuses,
+    }
+
+
+async def _loadtest_asgi(args, uploads: list) -> list:
+    """Drive the app in this process, lifespan (pool start-up) included."""
+    import httpx
+    import main as api
+
+    results = []
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            await _drive_analyze(client, uploads, args.warmup, 1)
+            for concurrency in args.concurrency:
+                result = await _drive_analyze(client, uploads, args.requests, concurrency)
+                result["peak_rss_mb"] = process_tree_peak_rss_mb(os.getpid()) or peak_rss_mb()
+                results.append((concurrency, result))
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _loadtest_uvicorn(args, uploads: list) -> list:
+    """Start `uvicorn main:app` on a free local port and drive it over HTTP."""
+    import httpx
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.server_workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+            deadline = time.monotonic() + args.startup_timeout
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"uvicorn not healthy after {args.startup_timeout}s")
+                await asyncio.sleep(0.2)
+
+            results = []
+            await _drive_analyze(client, uploads, args.warmup, 1)
+            for concurrency in args.concurrency:
+                result = await _drive_analyze(client, uploads, args.requests, concurrency)
+                result["peak_rss_mb"] = process_tree_peak_rss_mb(server.pid)
+                results.append((concurrency, result))
+            return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def bench_loadtest(args):
+    """/analyze latency percentiles, throughput and peak RSS per concurrency level."""
+    uploads = synthetic_pose_uploads(args.images, args.width, args.height)
+    run = _loadtest_asgi if args.mode == "asgi" else _loadtest_uvicorn
+    results = asyncio.run(run(args, uploads))
+
+    avg_kb = sum(len(u) for u in uploads) / len(uploads) / 1024
+    print(f"Load test ({args.mode}): {args.requests} requests per level, {args.images} stick-figure "
+          f"{args.width}x{args.height} JPEGs (~{avg_kb:.0f} KB), {args.warmup} warm-up requests")
+    print(f"{'clients':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'peak RSS MB':>13}  statuses")
+    for concurrency, r in results:
+        rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] else "n/a"
+        statuses = " ".join(f"{code}:{count}" for code, count in sorted(r["statuses"].items()))
+        print(f"{concurrency:>8}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+              f"{r['rps']:>9.1f}{rss:>13}  {statuses}")
+
+
+# ============================================================
+# micro: classify_pose, find_best_match and the session store
+# ============================================================
+
+def _use_catalogue(size: int):
+    """Swap a synthetic catalogue of `size` monkeys in as the active snapshot (0 = shipped dataset)."""
+    import matching
+
+    if size:
+        dataset = synthetic_dataset(size)
+        matching._snapshot = matching.DatasetSnapshot(
+            matching.get_snapshot().version + 1, dataset, matching.PoseIndex(dataset), "synthetic", time.time(),
+        )
+    return matching.get_snapshot()
+
+
+def bench_micro(args):
+    """Per-call cost of the pure-Python request path, outside any server."""
+    import config
+    from entropy import (
+        SessionContext, add_entropy, create_session, get_session_stats, should_apply_mutation,
+        ENTROPY_RETRY,
+    )
+    from matching import classify_pose, find_best_match
+
+    random.seed(0)  # mutations draw from random; keep runs comparable
+    poses = synthetic_user_poses(args.queries)
+    expressions = ["smiling", "neutral", "surprised", "unknown"]
+
+    print(f"Microbenchmarks, {args.queries} synthetic poses, session backend {config.SESSION_BACKEND}")
+    print(f"  classify_pose:        {time_per_call_us(classify_pose, [(p,) for p in poses]):>10,.1f} µs/call")
+
+    for size in args.monkeys:
+        snapshot = _use_catalogue(size)
+        # Fresh sessions per pass stay out of collapse, where extra mutations run
+        calls = [
+            (pose, create_session(), 0.9, False, expressions[i % len(expressions)])
+            for i, pose in enumerate(poses)
+        ]
+        match_us = time_per_call_us(
+            lambda pose, sid, conf, partial, expr: find_best_match(pose, sid, conf, partial, expression=expr),
+            calls,
+        )
+        print(f"  find_best_match:      {match_us:>10,.1f} µs/call  ({len(snapshot.rows)} monkeys, "
+              f"{snapshot.source})")
+
+    session_ids = [create_session() for _ in range(args.queries)]
+    ids = [(sid,) for sid in session_ids]
+
+    def request_round(session_id):
+        context = SessionContext(session_id)
+        context.add_attempt()
+        context.add_entropy(ENTROPY_RETRY, "benchmark")
+        context.commit()
+        return context.stats()
+
+    print(f"  create_session:       {time_per_call_us(create_session, [()] * args.queries):>10,.1f} µs/call")
+    print(f"  add_entropy:          "
+          f"{time_per_call_us(lambda sid: add_entropy(sid, 0.0, 'benchmark'), ids):>10,.1f} µs/call")
+    print(f"  should_apply_mutation:"
+          f"{time_per_call_us(lambda sid: should_apply_mutation(sid, 'swap_joints'), ids):>10,.1f} µs/call")
+    print(f"  get_session_stats:    {time_per_call_us(get_session_stats, ids):>10,.1f} µs/call")
+    print(f"  SessionContext round: {time_per_call_us(request_round, ids):>10,.1f} µs/call"
+          f"  (attempt + entropy + commit + stats, as /analyze does)")
+
+
+# ============================================================
+# importtime: module import cost and process-worker boot
+# ============================================================
+
+def _import_profile(module: str) -> tuple:
+    """(total ms, {top-level package: self ms}) from `python -X importtime -c "import module"`."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stderr
+    total_us, by_package = 0, {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        by_package[package] = by_package.get(package, 0) + int(self_us) / 1000
+        if name.strip() == module:
+            total_us = int(cumulative_us)
+    return total_us / 1000, by_package
+
+
+def _worker_boot_s() -> float:
+    """Seconds from creating a 1-worker process pool to its models being loaded."""
+    from pipeline import load_models, worker_identity
+    from workers import InferencePool
+
+    start = time.perf_counter()
+    pool = InferencePool("process", workers=1, queue_size=0, initializer=load_models)
+    try:
+        pool.warm_up(worker_identity)
+        return time.perf_counter() - start
+    finally:
+        pool.shutdown()
+
+
+def bench_importtime(args):
+    """Cold import cost per entry point (fresh interpreter each run) and worker boot time."""
+    print(f"Cold import time, best of {args.repeat} fresh interpreters (python -X importtime)")
+    print(f"{'module':<16}{'import ms':>11}  heaviest packages (self ms)")
+    for module in args.modules:
+        runs = [_import_profile(module) for _ in range(args.repeat)]
+        total_ms, by_package = min(runs, key=lambda run: run[0])
+        heaviest = sorted(by_package.items(), key=lambda item: -item[1])[:args.top]
+        print(f"{module:<16}{total_ms:>11,.0f}  " + ", ".join(f"{name} {ms:,.0f}" for name, ms in heaviest))
+        for heavy in ("mediapipe", "cv2", "PIL"):
+            if heavy in by_package and module in args.light:
+                print(f"{'':<16}{'':>11}  ! {module} imports {heavy}")
+
+    boot = [_worker_boot_s() for _ in range(args.repeat)]
+    print(f"Process worker boot (spawn + imports + load_models): {min(boot):.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monkey Doppelgänger backend benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    decode = sub.add_parser("decode", help="Upload decode time and peak RSS")
+    decode.add_argument("--width", type=int, default=4032)
+    decode.add_argument("--height", type=int, default=3024)
+    decode.add_argument("-n", "--iterations", type=int, default=20)
+    decode.add_argument("--variant", choices=list(DECODE_VARIANTS), help=argparse.SUPPRESS)
+    decode.set_defaults(func=bench_decode)
+
+    decode_scale = sub.add_parser("decode-scale", help="Decode + detection cost at several max resolutions")
+    decode_scale.add_argument("--edges", type=lambda v: [int(x) for x in v.split(",")],
+                              default=[0, 1920, 1280, 960, 640, 480])
+    decode_scale.add_argument("--width", type=int, default=4032)
+    decode_scale.add_argument("--height", type=int, default=3024)
+    decode_scale.add_argument("-n", "--iterations", type=int, default=20)
+    decode_scale.add_argument("--edge", type=int, help=argparse.SUPPRESS)
+    decode_scale.set_defaults(func=bench_decode_scale)
+
+    face_roi = sub.add_parser("face-roi", help="Face detection: full frame vs pose head ROI")
+    face_roi.add_argument("--edges", type=lambda v: [int(x) for x in v.split(",")], default=[640, 1280, 0])
+    face_roi.add_argument("--width", type=int, default=3024)
+    face_roi.add_argument("--height", type=int, default=4032)
+    face_roi.add_argument("-n", "--iterations", type=int, default=30)
+    face_roi.set_defaults(func=bench_face_roi)
+
+    face_plan = sub.add_parser("face-plan", help="Face detection skipped by the planner: skip rate and saving")
+    face_plan.add_argument("--monkeys", type=int, default=0, help="Synthetic catalogue size (0 = shipped dataset)")
+    face_plan.add_argument("--poses", type=int, default=500)
+    face_plan.add_argument("--edge", type=int, default=640)
+    face_plan.add_argument("-n", "--iterations", type=int, default=30)
+    face_plan.set_defaults(func=bench_face_plan)
+
+    detect_mode = sub.add_parser("detect-mode", help="run_detection latency: sequential vs concurrent face/pose")
+    detect_mode.add_argument("--width", type=int, default=3024)
+    detect_mode.add_argument("--height", type=int, default=4032)
+    detect_mode.add_argument("-n", "--iterations", type=int, default=30)
+    detect_mode.set_defaults(func=bench_detect_mode)
+
+    stream = sub.add_parser("stream", help="Pose per frame: IMAGE-mode detection vs VIDEO-mode tracking")
+    stream.add_argument("--frames", type=int, default=90)
+    stream.add_argument("--fps", type=int, default=15)
+    stream.add_argument("--width", type=int, default=480)
+    stream.add_argument("--height", type=int, default=640)
+    stream.set_defaults(func=bench_stream)
+
+    stream_track = sub.add_parser("stream-track", help="Stream guidance: match every frame vs smoothed PoseTracker")
+    stream_track.add_argument("--frames", type=int, default=600)
+    stream_track.add_argument("--jitter", type=float, default=0.01)
+    stream_track.add_argument("--monkeys", type=int, default=0, help="Synthetic catalogue size (0 = shipped dataset)")
+    stream_track.add_argument("--smoothing", type=float, default=0.5)
+    stream_track.add_argument("--rematch-distance", type=float, default=0.05)
+    stream_track.add_argument("--hold-frames", type=int, default=3)
+    stream_track.set_defaults(func=bench_stream_track)
+
+    match_index = sub.add_parser("match-index", help="Candidate lookup: substring scans vs PoseIndex")
+    match_index.add_argument("--monkeys", type=int, default=10000)
+    match_index.set_defaults(func=bench_match_index)
+
+    match_scale = sub.add_parser("match-scale", help="Scoring: per-monkey loop vs vectorized")
+    match_scale.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")],
+                             default=[50, 1000, 10000, 100000])
+    match_scale.add_argument("--queries", type=int, default=40)
+    match_scale.add_argument("--legacy-max", type=int, default=10000,
+                             help="Skip the slow legacy loop above this catalogue size")
+    match_scale.set_defaults(func=bench_match_scale)
+
+    match_ann = sub.add_parser("match-ann", help="Approximate pose search: recall@k and latency")
+    match_ann.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[10000, 100000])
+    match_ann.add_argument("--nprobe", type=lambda v: [int(x) for x in v.split(",")], default=[1, 4, 8, 16])
+    match_ann.add_argument("-k", type=int, default=10)
+    match_ann.add_argument("--queries", type=int, default=40)
+    match_ann.set_defaults(func=bench_match_ann)
+
+    dataset_load = sub.add_parser("dataset-load", help="Catalogue load time: JSON vs memory-mapped binary")
+    dataset_load.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[50, 10000, 100000])
+    dataset_load.set_defaults(func=bench_dataset_load)
+
+    loadtest = sub.add_parser("loadtest", help="/analyze end to end: latency percentiles, throughput, peak RSS")
+    loadtest.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi",
+                          help="In-process ASGI transport, or a local uvicorn over HTTP")
+    loadtest.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 4, 16])
+    loadtest.add_argument("-n", "--requests", type=int, default=200, help="Requests per concurrency level")
+    loadtest.add_argument("--warmup", type=int, default=10)
+    loadtest.add_argument("--images", type=int, default=16, help="Distinct synthetic uploads to cycle through")
+    loadtest.add_argument("--width", type=int, default=960)
+    loadtest.add_argument("--height", type=int, default=1280)
+    loadtest.add_argument("--server-workers", type=int, default=1, help="uvicorn --workers (uvicorn mode)")
+    loadtest.add_argument("--startup-timeout", type=float, default=60)
+    loadtest.set_defaults(func=bench_loadtest)
+
+    micro = sub.add_parser("micro", help="classify_pose, find_best_match and session store per-call cost")
+    micro.add_argument("--monkeys", type=lambda v: [int(x) for x in v.split(",")], default=[0, 10000],
+                       help="Catalogue sizes for find_best_match (0 = shipped dataset)")
+    micro.add_argument("--queries", type=int, default=200)
+    micro.set_defaults(func=bench_micro)
+
+    importtime = sub.add_parser("importtime", help="Cold import time per module and process-worker boot time")
+    importtime.add_argument("--modules", type=lambda v: v.split(","),
+                            default=["main", "matching", "pipeline", "create_dataset", "frame"])
+    importtime.add_argument("--light", type=lambda v: v.split(","), default=["main", "matching", "create_dataset"],
+                            help="Modules that must not import MediaPipe, OpenCV or PIL")
+    importtime.add_argument("--repeat", type=int, default=3)
+    importtime.add_argument("--top", type=int, default=4)
+    importtime.set_defaults(func=bench_importtime)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
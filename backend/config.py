@@ -0,0 +1,129 @@
+"""
+Runtime Configuration
+
+Deployment tunables, read once from environment variables at import.
+Defaults suit a single dev machine; production sizes them per host.
+"""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+
+# Detection worker pool
+# "thread" shares memory and is cheapest; "process" sidesteps the GIL for
+# the Python parts of the pipeline at the cost of one model copy per process.
+POOL_KIND = _env_str("MONKEY_POOL_KIND", "thread")
+POOL_WORKERS = _env_int("MONKEY_POOL_WORKERS", os.cpu_count() or 2)
+# Requests allowed to wait for a free worker before we answer 503
+POOL_QUEUE_SIZE = _env_int("MONKEY_POOL_QUEUE_SIZE", POOL_WORKERS * 4)
+# Seconds clients are told to back off when the queue is full
+POOL_RETRY_AFTER = _env_int("MONKEY_POOL_RETRY_AFTER", 1)
+
+# Upper bound on photos per /analyze/batch request
+BATCH_MAX_IMAGES = _env_int("MONKEY_BATCH_MAX_IMAGES", 50)
+
+# Upload limits: bytes per photo, and pixels per photo (checked from the
+# image header before decoding, guards against decompression bombs)
+UPLOAD_MAX_BYTES = _env_int("MONKEY_UPLOAD_MAX_BYTES", 15 * 1024 * 1024)
+UPLOAD_MAX_PIXELS = _env_int("MONKEY_UPLOAD_MAX_PIXELS", 50_000_000)
+# Total photo bytes per /analyze/batch request (the per-photo limit times
+# BATCH_MAX_IMAGES would let one request hold far too much)
+BATCH_MAX_BYTES = _env_int("MONKEY_BATCH_MAX_BYTES", 100 * 1024 * 1024)
+
+# Uploads are decoded (at reduced JPEG scale where possible) and resized
+# so their long edge is at most this many pixels before detection
+# (0 = keep full resolution)
+DECODE_MAX_EDGE = _env_int("MONKEY_DECODE_MAX_EDGE", 640)
+
+# Detection result cache keyed by a perceptual hash of the frame
+# (entries per worker, 0 = off; seconds an entry stays valid; dHash side
+# length, so the hash has HASH_SIZE^2 bits)
+DETECTION_CACHE_SIZE = _env_int("MONKEY_DETECTION_CACHE_SIZE", 256)
+DETECTION_CACHE_TTL = _env_int("MONKEY_DETECTION_CACHE_TTL", 300)
+DETECTION_CACHE_HASH_SIZE = _env_int("MONKEY_DETECTION_CACHE_HASH_SIZE", 16)
+
+# Pose matching search: "exact" scores every candidate; "approximate"
+# uses an IVF index (ann.py) for pose types with many candidates
+MATCH_SEARCH = _env_str("MONKEY_MATCH_SEARCH", "exact")
+# Pose types with fewer candidates than this are always searched exactly
+ANN_MIN_CANDIDATES = _env_int("MONKEY_ANN_MIN_CANDIDATES", 2000)
+# IVF cells per pose type (0 = sqrt(candidates)) and cells visited per query
+ANN_NLIST = _env_int("MONKEY_ANN_NLIST", 0)
+ANN_NPROBE = _env_int("MONKEY_ANN_NPROBE", 8)
+
+# Seconds between dataset file checks for hot reload (0 = no watcher;
+# POST /admin/reload-dataset still works, for the worker that receives it)
+DATASET_WATCH_INTERVAL = _env_int("MONKEY_DATASET_WATCH_INTERVAL", 0)
+# /admin endpoints are disabled unless this is set, and then require a
+# matching X-Admin-Token header
+ADMIN_TOKEN = _env_str("MONKEY_ADMIN_TOKEN", "")
+
+# Where sessions live: "memory" (per process), "sqlite" (shared by the
+# workers of one host) or "redis" (shared across hosts)
+SESSION_BACKEND = _env_str("MONKEY_SESSION_BACKEND", "memory")
+SESSION_SQLITE_PATH = _env_str(
+    "MONKEY_SESSION_SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db")
+)
+SESSION_REDIS_URL = _env_str("MONKEY_SESSION_REDIS_URL", "redis://localhost:6379/0")
+# Session store bounds: resident sessions (least recently used evicted
+# first; redis relies on its maxmemory policy instead), idle seconds before
+# a session expires, mutation log entries kept
+SESSION_MAX = _env_int("MONKEY_SESSION_MAX", 10000)
+SESSION_TTL = _env_int("MONKEY_SESSION_TTL", 3600)
+SESSION_MUTATION_HISTORY = _env_int("MONKEY_SESSION_MUTATION_HISTORY", 5)
+
+# "auto" skips face detection when the expression can't change the match
+# (no pose, or a pose type whose candidates have no expression boost);
+# "always" runs it for every image
+FACE_DETECTION = _env_str("MONKEY_FACE_DETECTION", "auto")
+
+# How face and pose detection share a request: "sequential" (pose, then
+# face on the head ROI) or "concurrent" (both at once on the full frame,
+# face in its own thread; lower latency, more CPU per request)
+DETECTION_MODE = _env_str("MONKEY_DETECTION_MODE", "sequential")
+
+# Face detection runs on a square around the pose's head landmarks, this
+# many times the head's extent (0 = always search the full frame)
+FACE_ROI_SCALE = _env_float("MONKEY_FACE_ROI_SCALE", 2.0)
+
+# Open /stream (live pose guidance) connections allowed at once; each
+# holds its own tracking pose landmarker and thread in the API process
+STREAM_MAX_SESSIONS = _env_int("MONKEY_STREAM_MAX_SESSIONS", 8)
+# Streamed keypoints are smoothed with an exponential moving average
+# (weight of the newest frame, 1 = no smoothing), and a new pose type is
+# shown once it has held for this many frames; the match preview is
+# re-run when the shown pose type changes or the matched joints move
+# this far on average (normalized image coordinates) since the last match
+STREAM_SMOOTHING = _env_float("MONKEY_STREAM_SMOOTHING", 0.5)
+STREAM_HOLD_FRAMES = _env_int("MONKEY_STREAM_HOLD_FRAMES", 3)
+STREAM_REMATCH_DISTANCE = _env_float("MONKEY_STREAM_REMATCH_DISTANCE", 0.05)
+
+# Model files, read from local disk only: nothing is downloaded at runtime
+# (fetch them once with download_model.py when provisioning a host)
+POSE_MODEL_PATH = _env_str(
+    "MONKEY_POSE_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pose_landmarker_lite.task")
+)
+FACE_MODEL_PATH = _env_str(
+    "MONKEY_FACE_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "face_detector.task")
+)
+# Seconds the startup warm-up waits for every worker to load and run its models
+WARMUP_TIMEOUT = _env_int("MONKEY_WARMUP_TIMEOUT", 120)
+
+# Logging: level for the "monkey" loggers, and the fraction of per-request
+# DEBUG lines (match details) actually written
+LOG_LEVEL = _env_str("MONKEY_LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = _env_float("MONKEY_LOG_SAMPLE_RATE", 1.0)
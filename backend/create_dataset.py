@@ -2,12 +2,34 @@
 Monkey Dataset Creator
 
 Pre-processes monkey images to extract pose keypoints.
-Run this once to generate monkey_dataset.json
+Run this once to generate monkey_dataset.json (plus its binary copy,
+see dataset_io.py)
+
+Images are processed in parallel, one pose landmarker per worker process.
+A manifest next to the dataset (monkey_dataset.manifest.jsonl) records the
+content hash and detection result of every image as it finishes, so
+re-runs only process new or changed images and an interrupted run picks
+up where it stopped. With --synthetic, monkeys without a detected pose get
+a synthetic one (see generate_synthetic_poses.py) before the single write.
+--dry-run only reports what a run would process; MediaPipe is imported by
+the detection workers, so it never loads for a dry run.
 """
 
-import os
+import argparse
+import hashlib
 import json
-from pose_detection import extract_pose_from_file
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from dataset_io import save_dataset, binary_paths
+from generate_synthetic_poses import apply_synthetic_poses
+
+# Supported extensions
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+# extract_pose's error when the image was fine but contains no pose
+NO_POSE_ERROR = "No pose detected"
 
 # Monkey metadata (id -> species name)
 MONKEY_METADATA = {
@@ -31,64 +53,206 @@ MONKEY_METADATA = {
 }
 
 
-def create_dataset(images_dir: str, output_path: str):
+def manifest_path(output_path: str) -> str:
+    """Manifest file that belongs to a dataset JSON."""
+    return f"{os.path.splitext(output_path)[0]}.manifest.jsonl"
+
+
+def file_hash(filepath: str) -> str:
+    """SHA-256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(path: str) -> Dict[str, Dict]:
+    """filename -> {"sha256", "detection"}; later lines win."""
+    manifest = {}
+    if not os.path.exists(path):
+        return manifest
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                manifest[entry["file"]] = entry
+            except (ValueError, KeyError):
+                # A run killed mid-write leaves at most one torn line
+                continue
+    return manifest
+
+
+def write_manifest(path: str, manifest: Dict[str, Dict]):
+    """Rewrite the manifest compactly (one line per current image)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        for filename in sorted(manifest):
+            if not is_final(manifest[filename]["detection"]):
+                continue
+            f.write(json.dumps(manifest[filename]) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _init_worker():
+    from pose_detection import get_pose_landmarker
+    
+    # Build this process's landmarker before the first image arrives
+    try:
+        get_pose_landmarker()
+    except Exception as e:
+        print(f"Failed to create pose landmarker: {e}")
+
+
+def detect_image(filepath: str) -> Dict:
+    """Pose detection result for one image, in dataset-record form."""
+    from pose_detection import extract_pose_from_file
+    
+    keypoints, confidence, debug_info = extract_pose_from_file(filepath)
+    
+    if keypoints is None:
+        return {
+            "pose": [],
+            "confidence": 0,
+            "has_pose": False,
+            "error": debug_info.get("error", "unknown"),
+        }
+    return {
+        "pose": keypoints.tolist(),
+        "confidence": round(confidence, 3),
+        "has_pose": True,
+        "upper_body_conf": debug_info.get("upper_body_confidence", 0),
+        "lower_body_conf": debug_info.get("lower_body_confidence", 0),
+    }
+
+
+def is_final(detection: Optional[Dict]) -> bool:
+    """
+    Whether a detection is worth caching. Failures such as a missing model
+    or an unreadable file are retried on the next run.
+    """
+    if detection is None:
+        return False
+    return detection["has_pose"] or detection.get("error") == NO_POSE_ERROR
+
+
+def monkey_record(filename: str, detection: Dict) -> Dict:
+    """Full dataset entry for an image from its (possibly cached) detection."""
+    monkey_id = os.path.splitext(filename)[0]
+    record = {
+        "id": monkey_id,
+        "image": f"/monkeys/{filename}",
+        "species": MONKEY_METADATA.get(monkey_id, "Mystery Monkey"),
+    }
+    record.update({k: v for k, v in detection.items() if k != "error"})
+    return record
+
+
+def _detect_all(images_dir: str, filenames: List[str], workers: int):
+    """Yield (filename, detection) as images finish, in completion order."""
+    if workers <= 1:
+        _init_worker()
+        for filename in filenames:
+            yield filename, detect_image(os.path.join(images_dir, filename))
+        return
+    
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    ) as executor:
+        futures = {
+            executor.submit(detect_image, os.path.join(images_dir, filename)): filename
+            for filename in filenames
+        }
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                yield filename, future.result()
+            except Exception as e:
+                yield filename, {"pose": [], "confidence": 0, "has_pose": False, "error": str(e)}
+
+
+def create_dataset(
+    images_dir: str,
+    output_path: str,
+    workers: Optional[int] = None,
+    synthetic: bool = False,
+    force: bool = False,
+    dry_run: bool = False,
+):
     """
     Create monkey dataset by extracting poses from all images.
     
     Args:
         images_dir: Path to directory containing monkey images
         output_path: Path to save monkey_dataset.json
+        workers: Detection processes (default: CPU count, 1 = in-process)
+        synthetic: Give monkeys without a detected pose a synthetic one
+        force: Ignore the manifest and re-detect every image
+        dry_run: Only list the images a run would process; writes nothing
     """
-    dataset = []
-    
     print(f"Scanning {images_dir} for monkey images...")
     
-    # Supported extensions
-    extensions = ('.jpg', '.jpeg', '.png', '.webp')
+    filenames = sorted(
+        f for f in os.listdir(images_dir) if f.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    manifest_file = manifest_path(output_path)
+    cached = {} if force else load_manifest(manifest_file)
     
-    for filename in os.listdir(images_dir):
-        if not filename.lower().endswith(extensions):
-            continue
-            
-        filepath = os.path.join(images_dir, filename)
-        monkey_id = os.path.splitext(filename)[0]
-        
-        print(f"Processing {filename}...")
-        
-        # Extract pose
-        keypoints, confidence, debug_info = extract_pose_from_file(filepath)
-        
-        if keypoints is None:
-            print(f"  ⚠ No pose detected: {debug_info.get('error', 'unknown')}")
-            # Still include in dataset with empty pose (for random matching)
-            dataset.append({
-                "id": monkey_id,
-                "image": f"/monkeys/{filename}",
-                "species": MONKEY_METADATA.get(monkey_id, "Mystery Monkey"),
-                "pose": [],
-                "confidence": 0,
-                "has_pose": False
-            })
+    # Unchanged images (same content hash) reuse their last detection
+    manifest = {}
+    pending = []
+    for filename in filenames:
+        digest = file_hash(os.path.join(images_dir, filename))
+        entry = cached.get(filename)
+        if entry and entry.get("sha256") == digest and is_final(entry.get("detection")):
+            manifest[filename] = entry
         else:
-            print(f"  ✓ Pose detected (confidence: {confidence:.2f})")
-            dataset.append({
-                "id": monkey_id,
-                "image": f"/monkeys/{filename}",
-                "species": MONKEY_METADATA.get(monkey_id, "Mystery Monkey"),
-                "pose": keypoints.tolist(),
-                "confidence": round(confidence, 3),
-                "has_pose": True,
-                "upper_body_conf": debug_info.get("upper_body_confidence", 0),
-                "lower_body_conf": debug_info.get("lower_body_confidence", 0)
-            })
-    
-    # Save dataset
-    with open(output_path, 'w') as f:
-        json.dump(dataset, f, indent=2)
+            manifest[filename] = {"file": filename, "sha256": digest, "detection": None}
+            pending.append(filename)
+    
+    print(f"  {len(filenames)} images, {len(filenames) - len(pending)} unchanged, {len(pending)} to process")
+    
+    if dry_run:
+        for filename in pending:
+            reason = "new" if filename not in cached else "changed or not final"
+            print(f"  → {filename}: {reason}")
+        return None
+    
+    if pending:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+        print(f"  Detecting poses with {workers} worker(s)...")
+        
+        # Append each result as it lands so an interrupted run can resume
+        with open(manifest_file, "a") as log:
+            for filename, detection in _detect_all(images_dir, pending, workers):
+                manifest[filename]["detection"] = detection
+                if is_final(detection):
+                    log.write(json.dumps(manifest[filename]) + "\n")
+                    log.flush()
+                
+                if detection["has_pose"]:
+                    print(f"  ✓ {filename}: pose detected (confidence: {detection['confidence']:.2f})")
+                else:
+                    print(f"  ⚠ {filename}: no pose detected: {detection.get('error', 'unknown')}")
+    
+    # Drop images that were deleted since the last run
+    write_manifest(manifest_file, manifest)
+    
+    dataset = [monkey_record(f, manifest[f]["detection"]) for f in filenames]
+    if synthetic:
+        apply_synthetic_poses(dataset)
+    
+    # Save dataset (JSON + memory-mappable binary copy) - one write per run
+    save_dataset(dataset, output_path)
     
     print(f"\n✅ Dataset saved to {output_path}")
+    print(f"   Binary copy: {', '.join(binary_paths(output_path))}")
     print(f"   Total monkeys: {len(dataset)}")
     print(f"   With pose: {sum(1 for m in dataset if m['has_pose'])}")
+    if synthetic:
+        print(f"   Synthetic: {sum(1 for m in dataset if m.get('synthetic'))}")
     
     return dataset
 
@@ -100,15 +264,22 @@ if __name__ == "__main__":
     
     # Make paths absolute
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    images_dir = os.path.normpath(os.path.join(script_dir, IMAGES_DIR))
-    output_path = os.path.join(script_dir, OUTPUT_PATH)
+    
+    parser = argparse.ArgumentParser(description="Build monkey_dataset.json from monkey images")
+    parser.add_argument("--images-dir", default=os.path.normpath(os.path.join(script_dir, IMAGES_DIR)))
+    parser.add_argument("--output", default=os.path.join(script_dir, OUTPUT_PATH))
+    parser.add_argument("--workers", type=int, default=None, help="detection processes (default: CPU count)")
+    parser.add_argument("--synthetic", action="store_true", help="fill missing poses with synthetic ones")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest, re-detect everything")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be processed, write nothing")
+    args = parser.parse_args()
     
     print("=" * 50)
     print("MONKEY DATASET CREATOR")
     print("=" * 50)
     
-    if not os.path.exists(images_dir):
-        print(f"Error: Images directory not found: {images_dir}")
+    if not os.path.exists(args.images_dir):
+        print(f"Error: Images directory not found: {args.images_dir}")
         exit(1)
     
-    create_dataset(images_dir, output_path)
+    create_dataset(args.images_dir, args.output, args.workers, args.synthetic, args.force, args.dry_run)
@@ -0,0 +1,145 @@
+"""
+Monkey Dataset Storage
+
+monkey_dataset.json stays the editable source of truth. Next to it the
+dataset tools also write a compact binary copy:
+
+    monkey_dataset.poses.npy   (N, 33, 2) float32 pose matrix
+    monkey_dataset.meta.json   per-monkey metadata, no pose lists
+
+The matcher memory-maps the .npy, so every uvicorn worker on a host shares
+one copy in the page cache instead of each parsing nested float lists.
+If the binary files are missing or older than the JSON, the JSON is used.
+
+Run this file to (re)build the binary copy of an existing JSON dataset:
+    python dataset_io.py [monkey_dataset.json]
+"""
+
+import json
+import os
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from metrics import get_logger
+
+log = get_logger("dataset")
+
+NUM_LANDMARKS = 33
+META_VERSION = 1
+
+
+class LoadedDataset(NamedTuple):
+    rows: List[Dict]               # monkey records (no "pose" when loaded from binary)
+    poses: np.ndarray              # (N, 33, 2) float32, possibly a read-only memmap
+    pose_lengths: np.ndarray       # (N,) landmarks actually present per monkey
+    source: str                    # "binary", "json" or "missing"
+
+
+def binary_paths(json_path: str) -> Tuple[str, str]:
+    """(poses .npy path, metadata path) that belong to a dataset JSON."""
+    stem = os.path.splitext(json_path)[0]
+    return f"{stem}.poses.npy", f"{stem}.meta.json"
+
+
+def pose_matrix(dataset: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack the JSON pose lists into an (N, 33, 2) float32 matrix plus lengths."""
+    poses = np.zeros((len(dataset), NUM_LANDMARKS, 2), dtype=np.float32)
+    lengths = np.zeros(len(dataset), dtype=np.int32)
+    for row, monkey in enumerate(dataset):
+        pose = monkey.get("pose") or []
+        lengths[row] = len(pose)
+        if len(pose):
+            pose = np.asarray(pose, dtype=np.float32)[:NUM_LANDMARKS]
+            poses[row, :len(pose)] = pose
+    return poses, lengths
+
+
+def _replace_atomically(path: str, write):
+    """Write via a temp file + rename so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def save_binary(dataset: List[Dict], json_path: str):
+    """Write the .npy pose matrix and metadata table for `dataset`."""
+    poses_path, meta_path = binary_paths(json_path)
+    poses, lengths = pose_matrix(dataset)
+    rows = [
+        {**{k: v for k, v in monkey.items() if k != "pose"}, "pose_landmarks": int(length)}
+        for monkey, length in zip(dataset, lengths)
+    ]
+
+    def write_poses(path):
+        with open(path, "wb") as f:
+            np.save(f, poses)
+
+    def write_meta(path):
+        with open(path, "w") as f:
+            json.dump({"version": META_VERSION, "count": len(rows), "rows": rows}, f)
+
+    # Poses first: the metadata file is what marks the pair as complete
+    _replace_atomically(poses_path, write_poses)
+    _replace_atomically(meta_path, write_meta)
+
+
+def save_dataset(dataset: List[Dict], json_path: str):
+    """Write the JSON dataset and its binary copy."""
+    def write_json(path):
+        with open(path, "w") as f:
+            json.dump(dataset, f, indent=2)
+
+    _replace_atomically(json_path, write_json)
+    save_binary(dataset, json_path)
+
+
+def _binary_is_current(json_path: str) -> bool:
+    poses_path, meta_path = binary_paths(json_path)
+    if not (os.path.exists(poses_path) and os.path.exists(meta_path)):
+        return False
+    if not os.path.exists(json_path):
+        return True
+    # A JSON edited after the last build wins
+    return min(os.path.getmtime(poses_path), os.path.getmtime(meta_path)) >= os.path.getmtime(json_path)
+
+
+def load_dataset(json_path: str) -> LoadedDataset:
+    """Load the binary copy if it is current, else parse the JSON."""
+    if _binary_is_current(json_path):
+        try:
+            poses_path, meta_path = binary_paths(json_path)
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            poses = np.load(poses_path, mmap_mode="r")
+            rows = meta["rows"]
+            if meta.get("version") == META_VERSION and poses.shape == (len(rows), NUM_LANDMARKS, 2):
+                lengths = np.array([row.get("pose_landmarks", 0) for row in rows], dtype=np.int32)
+                return LoadedDataset(rows, poses, lengths, "binary")
+            log.warning("Ignoring inconsistent binary dataset next to %s", json_path)
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Could not load binary dataset, falling back to JSON: %s", e)
+
+    if os.path.exists(json_path):
+        with open(json_path, "r") as f:
+            dataset = json.load(f)
+        poses, lengths = pose_matrix(dataset)
+        return LoadedDataset(dataset, poses, lengths, "json")
+
+    poses, lengths = pose_matrix([])
+    return LoadedDataset([], poses, lengths, "missing")
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    json_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(script_dir, "monkey_dataset.json")
+
+    with open(json_path, "r") as f:
+        dataset = json.load(f)
+    save_binary(dataset, json_path)
+
+    poses_path, meta_path = binary_paths(json_path)
+    print(f"✅ Wrote {poses_path} ({os.path.getsize(poses_path) / 1024:.1f} KB)")
+    print(f"✅ Wrote {meta_path} ({os.path.getsize(meta_path) / 1024:.1f} KB)")
+    print(f"   Monkeys: {len(dataset)}")
@@ -0,0 +1,78 @@
+"""
+Detection Result Cache
+
+Retakes in the prank flow are often the same selfie (or a re-encoded
+copy of it), and the frontend retries on errors. Detections are cached
+under a perceptual difference hash (dHash) of the decoded frame, so a
+resubmission skips both MediaPipe models. dHash survives JPEG
+re-encoding and small brightness changes, unlike a hash of the bytes.
+
+Only detection is cached. Matching and session entropy still run for
+every request, so a cached retake still costs its attempt.
+
+The cache lives in the worker: one shared cache for the thread pool,
+one per worker process for the process pool.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import numpy as np
+
+# Errors that are real answers about the image; anything else (missing
+# model, exceptions) is not cached so it is retried next time
+CACHEABLE_ERRORS = (None, "No pose detected", "No face detected")
+# perceptual_hash subsamples to about hash_size * this many pixels a side
+PRESHRINK_FACTOR = 16
+
+
+def perceptual_hash(rgb: np.ndarray, hash_size: int = 16) -> bytes:
+    """
+    dHash of an RGB image: shrink to (hash_size + 1) x hash_size grey
+    pixels and record whether each pixel is brighter than its right-hand
+    neighbour. Returns hash_size * hash_size bits packed into bytes.
+    """
+    import cv2  # deferred: the API process imports this module but never hashes
+
+    # Strided subsample first: INTER_AREA over a full 12 MP frame costs ~50 ms,
+    # over a few hundred pixels a side it is near free and just as stable
+    step = max(1, max(rgb.shape[:2]) // (hash_size * PRESHRINK_FACTOR))
+    small = cv2.resize(rgb[::step, ::step], (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    grey = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY).astype(np.int16)
+    return np.packbits(grey[:, 1:] > grey[:, :-1]).tobytes()
+
+
+class DetectionCache:
+    """Thread-safe LRU cache with a per-entry time to live."""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable) -> Optional[object]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl > 0 and now - entry[0] > self.ttl):
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: object):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
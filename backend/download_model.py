@@ -1,29 +1,36 @@
 """
-Download MediaPipe pose landmarker model.
-Run this once before starting the backend.
+Download the MediaPipe pose landmarker and face detector models.
+Run this once before starting the backend (the server never downloads
+models itself, so air-gapped hosts get these files copied in instead).
 """
 
 import urllib.request
 import os
 
+import config
+
 MODEL_URL = "https://storage.googleapis.com/mediapipe-models/pose_landmarker/pose_landmarker_lite/float16/latest/pose_landmarker_lite.task"
-MODEL_PATH = "pose_landmarker_lite.task"
+FACE_MODEL_URL = "https://storage.googleapis.com/mediapipe-models/face_detector/blaze_face_short_range/float16/1/blaze_face_short_range.tflite"
 
-def download_model():
-    if os.path.exists(MODEL_PATH):
-        print(f"✅ Model already exists: {MODEL_PATH}")
+def download(name, url, path):
+    if os.path.exists(path):
+        print(f"✅ {name} model already exists: {path}")
         return
     
-    print(f"⬇️ Downloading pose landmarker model...")
-    print(f"   From: {MODEL_URL}")
+    print(f"⬇️ Downloading {name} model...")
+    print(f"   From: {url}")
     
     try:
-        urllib.request.urlretrieve(MODEL_URL, MODEL_PATH)
-        print(f"✅ Model downloaded: {MODEL_PATH}")
+        urllib.request.urlretrieve(url, path)
+        print(f"✅ Model downloaded: {path}")
     except Exception as e:
         print(f"❌ Download failed: {e}")
         print("   Please download manually from:")
-        print(f"   {MODEL_URL}")
+        print(f"   {url}")
+
+def download_model():
+    download("Pose landmarker", MODEL_URL, config.POSE_MODEL_PATH)
+    download("Face detector", FACE_MODEL_URL, config.FACE_MODEL_PATH)
 
 if __name__ == "__main__":
     download_model()
@@ -8,21 +8,11 @@ Entropy accumulates per session and causes the system to degrade:
 - 0.8-1.0: Full chaos mode (random mutations)
 """
 
-import uuid
-import time
-from typing import Dict, List, Optional
-from dataclasses import dataclass, field
-
-@dataclass
-class SessionState:
-    entropy: float = 0.0
-    attempts: int = 0
-    mutations: List[str] = field(default_factory=list)
-    created_at: float = field(default_factory=time.time)
-    collapsed: bool = False
-
-# In-memory session storage (no persistence - thematic!)
-_sessions: Dict[str, SessionState] = {}
+from typing import List, Optional
+
+from session_store import (
+    SessionRules, SessionState, SessionStore, apply_ops, create_store, new_session_id
+)
 
 # Entropy increments
 ENTROPY_RETRY = 0.1
@@ -32,81 +22,106 @@ ENTROPY_DETECTION_FAILURE = 0.2
 
 # Collapse threshold
 COLLAPSE_ATTEMPTS = 5
+COLLAPSE_ENTROPY = 0.3
 MAX_ENTROPY = 1.0
 
+# Session storage: per-process memory by default (no persistence -
+# thematic!), see session_store.py for the shared backends
+_sessions: SessionStore = create_store(
+    SessionRules(ENTROPY_RETRY, COLLAPSE_ATTEMPTS, COLLAPSE_ENTROPY, MAX_ENTROPY)
+)
+
 
 def create_session() -> str:
     """Create new session with fresh entropy state."""
-    session_id = str(uuid.uuid4())[:8]
-    _sessions[session_id] = SessionState()
-    return session_id
+    return _sessions.create()
 
 
 def get_session(session_id: str) -> Optional[SessionState]:
-    """Get session state, create if doesn't exist."""
-    if session_id not in _sessions:
-        _sessions[session_id] = SessionState()
-    return _sessions[session_id]
+    """Get session state, create if doesn't exist. Read-only snapshot."""
+    return _sessions.load(session_id)
+
+
+def reset_entropy(session_id: str) -> SessionState:
+    """Put a session back to zero entropy (for testing)."""
+    return _sessions.apply(session_id, [["reset"]])
+
+
+def session_store_stats() -> dict:
+    """Session backend, resident session count and eviction counters."""
+    return _sessions.stats()
 
 
 def add_entropy(session_id: str, amount: float, reason: str) -> float:
     """Add entropy to session and log the mutation."""
-    session = get_session(session_id)
-    old_entropy = session.entropy
-    session.entropy = min(MAX_ENTROPY, session.entropy + amount)
-    session.mutations.append(f"[{reason}] +{amount:.2f} entropy ({old_entropy:.2f} → {session.entropy:.2f})")
-    return session.entropy
+    return _sessions.apply(session_id, [["entropy", amount, reason]]).entropy
 
 
 def increment_attempt(session_id: str) -> int:
-    """Increment attempt counter and add retry entropy."""
-    session = get_session(session_id)
-    session.attempts += 1
-    add_entropy(session_id, ENTROPY_RETRY, "retry_attempt")
+    """Increment attempt counter and add retry entropy (collapses at COLLAPSE_ATTEMPTS)."""
+    return _sessions.apply(session_id, [["attempt"]]).attempts
+
+
+class SessionContext:
+    """
+    One request's view of a session.
+    
+    Entropy changes are staged in memory and written back with a single
+    commit() at the end of the request, so a request costs one store round
+    trip however many deltas it adds (retry, low confidence, partial body,
+    detection failure...). The state is only fetched if something reads it
+    before the commit; commit() itself returns the authoritative state.
+    """
+    
+    def __init__(self, session_id: str, store: Optional[SessionStore] = None):
+        self.session_id = session_id
+        self._store = store or _sessions
+        self._state: Optional[SessionState] = None
+        self._ops: List[List] = []
+    
+    @property
+    def state(self) -> SessionState:
+        """Current state including staged changes (loads on first use)."""
+        if self._state is None:
+            self._state = apply_ops(self._store.load(self.session_id), self._ops, self._store.rules)
+        return self._state
+    
+    def _stage(self, op: List):
+        self._ops.append(op)
+        if self._state is not None:
+            apply_ops(self._state, [op], self._store.rules)
     
-    # Check for collapse event
-    if session.attempts >= COLLAPSE_ATTEMPTS and not session.collapsed:
-        session.collapsed = True
-        add_entropy(session_id, 0.3, "COLLAPSE_EVENT")
-        session.mutations.append("⚠️ SYSTEM COLLAPSE TRIGGERED ⚠️")
+    def add_entropy(self, amount: float, reason: str):
+        self._stage(["entropy", amount, reason])
     
-    return session.attempts
+    def add_attempt(self):
+        self._stage(["attempt"])
+    
+    def commit(self) -> SessionState:
+        """Write staged changes in one atomic store call; returns the new state."""
+        if self._ops:
+            self._state = self._store.apply(self.session_id, self._ops)
+            self._ops = []
+        return self.state
+    
+    def stats(self) -> dict:
+        return session_stats(self.session_id, self.state)
 
 
-def get_entropy_level(session_id: str) -> str:
-    """Get human-readable entropy level."""
-    session = get_session(session_id)
-    e = session.entropy
-    
-    if e < 0.3:
+def entropy_level(entropy: float) -> str:
+    """Human-readable level for an entropy value."""
+    if entropy < 0.3:
         return "STABLE"
-    elif e < 0.6:
+    elif entropy < 0.6:
         return "DEGRADING"
-    elif e < 0.8:
+    elif entropy < 0.8:
         return "UNSTABLE"
     else:
         return "CRITICAL"
 
 
-def should_apply_mutation(session_id: str, mutation_type: str) -> bool:
-    """Check if a specific mutation should apply based on entropy."""
-    session = get_session(session_id)
-    e = session.entropy
-    
-    mutations = {
-        "ignore_legs": e >= 0.3,
-        "swap_joints": e >= 0.6,
-        "random_weights": e >= 0.8,
-        "dataset_shuffle": session.collapsed,
-        "score_lies": e >= 0.5,
-    }
-    
-    return mutations.get(mutation_type, False)
-
-
-def get_collapse_warnings(session_id: str) -> List[str]:
-    """Get fake system warnings based on entropy level."""
-    session = get_session(session_id)
+def collapse_warnings(session: SessionState) -> List[str]:
+    """Fake system warnings for a session state."""
     warnings = []
     
     if session.entropy >= 0.3:
@@ -122,17 +137,46 @@ def get_collapse_warnings(session_id: str) -> List[str]:
     return warnings
 
 
-def get_session_stats(session_id: str) -> dict:
-    """Get full session statistics for API response."""
-    session = get_session(session_id)
-    
+def session_stats(session_id: str, session: SessionState) -> dict:
+    """Session statistics for an API response, from an already loaded state."""
     return {
         "session_id": session_id,
         "entropy": round(session.entropy, 3),
-        "entropy_level": get_entropy_level(session_id),
+        "entropy_level": entropy_level(session.entropy),
         "attempts": session.attempts,
         "collapsed": session.collapsed,
-        "mutations": session.mutations[-5:],  # Last 5 mutations
-        "warnings": get_collapse_warnings(session_id),
+        "mutations": list(session.mutations)[-5:],  # Last 5 mutations
+        "warnings": collapse_warnings(session),
         "system_unstable": session.entropy >= 0.6
     }
+
+
+def get_entropy_level(session_id: str) -> str:
+    """Get human-readable entropy level."""
+    return entropy_level(get_session(session_id).entropy)
+
+
+def should_apply_mutation(session_id: str, mutation_type: str) -> bool:
+    """Check if a specific mutation should apply based on entropy."""
+    session = get_session(session_id)
+    e = session.entropy
+    
+    mutations = {
+        "ignore_legs": e >= 0.3,
+        "swap_joints": e >= 0.6,
+        "random_weights": e >= 0.8,
+        "dataset_shuffle": session.collapsed,
+        "score_lies": e >= 0.5,
+    }
+    
+    return mutations.get(mutation_type, False)
+
+
+def get_collapse_warnings(session_id: str) -> List[str]:
+    """Get fake system warnings based on entropy level."""
+    return collapse_warnings(get_session(session_id))
+
+
+def get_session_stats(session_id: str) -> dict:
+    """Get full session statistics for API response (one store lookup)."""
+    return session_stats(session_id, get_session(session_id))
@@ -3,12 +3,22 @@ Face Detection Module
 
 Uses MediaPipe Face Mesh to detect facial landmarks and expressions.
 Combined with pose detection for better matching.
+
+When pose detection already found the head, the face detector only looks
+at a small square around pose landmarks 0-10 (nose, eyes, ears, mouth)
+instead of the whole frame; see head_roi().
 """
 
 import os
+import threading
 import numpy as np
 import cv2
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, Union
+
+import config
+from metrics import get_logger
+
+log = get_logger("face")
 
 # Try to import MediaPipe
 try:
@@ -18,47 +28,47 @@ try:
     MEDIAPIPE_AVAILABLE = True
 except ImportError:
     MEDIAPIPE_AVAILABLE = False
-    print("Warning: MediaPipe not available for face detection")
+    log.warning("MediaPipe not available for face detection")
 
-# Model path for face detector
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "face_detector.task")
-MODEL_URL = "https://storage.googleapis.com/mediapipe-models/face_detector/blaze_face_short_range/float16/1/blaze_face_short_range.tflite"
+# Local model file (python download_model.py, or MONKEY_FACE_MODEL_PATH)
+MODEL_PATH = config.FACE_MODEL_PATH
 
-_face_detector = None
+# One detector per worker thread (see pose_detection._local)
+_local = threading.local()
 
-def download_face_model():
-    """Download face detector model if not present."""
-    if not os.path.exists(MODEL_PATH):
-        import urllib.request
-        print(f"Downloading face detection model...")
-        urllib.request.urlretrieve(MODEL_URL, MODEL_PATH)
-        print(f"Model saved to {MODEL_PATH}")
-    return MODEL_PATH
+# Pose landmarks 0-10: nose, eyes, ears and mouth corners
+HEAD_LANDMARKS = slice(0, 11)
+# Head ROIs smaller than this (pixels a side) are not worth cropping
+MIN_ROI_SIZE = 32
 
 def get_face_detector():
-    """Get or create face detector instance."""
-    global _face_detector
-    
+    """Get this thread's face detector, creating it on first use."""
     if not MEDIAPIPE_AVAILABLE:
         return None
     
-    if _face_detector is None:
+    detector = getattr(_local, "face_detector", None)
+    if detector is None:
+        if not os.path.exists(MODEL_PATH):
+            # Hosts may be air-gapped: reported per request, never downloaded here
+            return None
         try:
-            model_path = download_face_model()
-            base_options = python.BaseOptions(model_asset_path=model_path)
+            base_options = python.BaseOptions(model_asset_path=MODEL_PATH)
             options = vision.FaceDetectorOptions(base_options=base_options)
-            _face_detector = vision.FaceDetector.create_from_options(options)
+            detector = vision.FaceDetector.create_from_options(options)
+            _local.face_detector = detector
         except Exception as e:
-            print(f"Failed to create face detector: {e}")
+            log.warning("Failed to create face detector: %s", e)
             return None
     
-    return _face_detector
+    return detector
 
 
-def detect_face(image: np.ndarray) -> Tuple[Optional[Dict], float]:
+def detect_face(image: Union[np.ndarray, "mp.Image"]) -> Tuple[Optional[Dict], float]:
     """
     Detect face in image and extract features.
     
+    Accepts an RGB array or a shared mp.Image (used as-is, no copy).
+    
     Returns:
         face_data: Dict with face bounding box and keypoints
         confidence: Detection confidence (0-1)
@@ -69,8 +79,11 @@ def detect_face(image: np.ndarray) -> Tuple[Optional[Dict], float]:
         return None, 0.0
     
     try:
-        # Convert to MediaPipe Image
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+        # Convert to MediaPipe Image (unless the caller already shares one)
+        if isinstance(image, mp.Image):
+            mp_image = image
+        else:
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
         
         # Detect faces
         results = detector.detect(mp_image)
@@ -107,7 +120,7 @@ def detect_face(image: np.ndarray) -> Tuple[Optional[Dict], float]:
         return face_data, face.categories[0].score if face.categories else 0.8
         
     except Exception as e:
-        print(f"Face detection error: {e}")
+        log.warning("Face detection error: %s", e)
         return None, 0.0
 
 
@@ -140,7 +153,7 @@ def analyze_expression(face_data: Dict, image: np.ndarray) -> Dict:
     return features
 
 
-def classify_face_expression(image: np.ndarray) -> Tuple[str, float, Dict]:
+def classify_face_expression(image: Union[np.ndarray, "mp.Image"]) -> Tuple[str, float, Dict]:
     """
     Detect face and classify expression.
     
@@ -149,6 +162,9 @@ def classify_face_expression(image: np.ndarray) -> Tuple[str, float, Dict]:
         confidence: Detection confidence
         debug_info: Additional debug information
     """
+    if get_face_detector() is None:
+        return "unknown", 0.0, {"error": "Face model not found (run: python download_model.py)"}
+    
     face_data, confidence = detect_face(image)
     
     if face_data is None:
@@ -166,6 +182,46 @@ def classify_face_expression(image: np.ndarray) -> Tuple[str, float, Dict]:
     return features.get("expression", "neutral"), confidence, debug_info
 
 
+def head_roi(
+    keypoints: Optional[np.ndarray],
+    width: int,
+    height: int,
+    scale: float = config.FACE_ROI_SCALE,
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Pixel box (x0, y0, x1, y1) to search for the face, from normalized
+    pose keypoints: a square `scale` times the extent of the head
+    landmarks, centred on them and clipped to the frame. None when there
+    is no pose, ROIs are disabled, or the box would be too small.
+    """
+    if keypoints is None or scale <= 0 or len(keypoints) < HEAD_LANDMARKS.stop:
+        return None
+    head = np.asarray(keypoints[HEAD_LANDMARKS], dtype=np.float64) * (width, height)
+    (left, top), (right, bottom) = head.min(axis=0), head.max(axis=0)
+    half = max(right - left, bottom - top) * scale / 2
+    cx, cy = (left + right) / 2, (top + bottom) / 2
+    x0, y0 = max(0, int(cx - half)), max(0, int(cy - half))
+    x1, y1 = min(width, int(np.ceil(cx + half))), min(height, int(np.ceil(cy + half)))
+    if x1 - x0 < MIN_ROI_SIZE or y1 - y0 < MIN_ROI_SIZE:
+        return None
+    return x0, y0, x1, y1
+
+
+def classify_face_expression_in_roi(rgb: np.ndarray, roi: Tuple[int, int, int, int]) -> Tuple[str, float, Dict]:
+    """
+    classify_face_expression on a slice of the frame. The slice is a view;
+    only the small ROI is copied, into the detector's input image. The
+    reported bbox is in full-frame pixels, as without an ROI.
+    """
+    x0, y0, x1, y1 = roi
+    expression, confidence, debug_info = classify_face_expression(rgb[y0:y1, x0:x1])
+    if "bbox" in debug_info:
+        bbox = debug_info["bbox"]
+        debug_info["bbox"] = {**bbox, "x": bbox["x"] + x0, "y": bbox["y"] + y0}
+    debug_info["roi"] = [x0, y0, x1, y1]
+    return expression, confidence, debug_info
+
+
 def extract_face_from_file(filepath: str) -> Tuple[str, float, Dict]:
     """Extract face expression from an image file."""
     try:
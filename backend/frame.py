@@ -0,0 +1,111 @@
+"""
+Shared Frame Decoding
+
+Decodes an upload exactly once and hands the same pixels to every detector.
+Face and pose detection both consume the frame's MediaPipe image, so a
+request pays for one JPEG decode and one RGB buffer instead of two.
+
+Uploads are shrunk while decoding: the lite pose model and short-range
+face model only look at a few hundred pixels, so a 12 MP selfie is decoded
+at 1/2, 1/4 or 1/8 scale (libjpeg scales in the DCT domain, which is much
+cheaper than a full decode) and then resized to `max_edge`. Landmarks are
+normalized to the frame, so matching does not change.
+"""
+
+import io
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+import mediapipe as mp
+from PIL import Image
+
+import config
+from image_header import ImageHeader, probe_image_header
+
+# cv2.imdecode flags for decoding at 1/factor scale, largest factor first
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def reduced_decode_flag(header: Optional[ImageHeader], max_edge: int) -> int:
+    """Largest IMREAD_REDUCED_* scale that still leaves at least `max_edge` pixels."""
+    if header is None or max_edge <= 0:
+        return cv2.IMREAD_COLOR
+    long_edge = max(header.width, header.height)
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if long_edge // factor >= max_edge:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def fit_long_edge(image: np.ndarray, max_edge: int) -> np.ndarray:
+    """Resize so the long edge is at most `max_edge` (no-op if already small)."""
+    height, width = image.shape[:2]
+    long_edge = max(height, width)
+    if max_edge <= 0 or long_edge <= max_edge:
+        return image
+    scale = max_edge / long_edge
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+@dataclass
+class Frame:
+    """A decoded RGB image shared by face and pose detection."""
+    mp_image: mp.Image
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """Read-only (H, W, 3) view of the MediaPipe buffer (no copy)."""
+        return self.mp_image.numpy_view()
+
+    @property
+    def width(self) -> int:
+        return self.mp_image.width
+
+    @property
+    def height(self) -> int:
+        return self.mp_image.height
+
+
+def frame_from_rgb(rgb: np.ndarray) -> Frame:
+    """Wrap an RGB array in a Frame (MediaPipe takes its own copy once)."""
+    return Frame(mp_image=mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb))
+
+
+def decode_frame(image_bytes: bytes, max_edge: Optional[int] = None) -> Optional[Frame]:
+    """
+    Decode image bytes into a Frame whose long edge is at most `max_edge`
+    (default config.DECODE_MAX_EDGE, 0 = full resolution).
+
+    OpenCV does the decode, at reduced scale when the header says the image
+    is large; the BGR buffer is converted to RGB in place and then wrapped,
+    so no second full-size array is allocated. Formats OpenCV can't read
+    (e.g. GIF) fall back to PIL.
+
+    Returns None if the bytes are not a decodable image.
+    """
+    if max_edge is None:
+        max_edge = config.DECODE_MAX_EDGE
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    image = cv2.imdecode(nparr, reduced_decode_flag(probe_image_header(image_bytes), max_edge))
+
+    if image is None:
+        try:
+            pil_image = Image.open(io.BytesIO(image_bytes))
+            if max_edge > 0:
+                pil_image.draft('RGB', (max_edge, max_edge))  # JPEG-only, no-op otherwise
+            image = np.asarray(pil_image.convert('RGB'))
+        except Exception:
+            return None
+        image = fit_long_edge(image, max_edge)
+    else:
+        image = fit_long_edge(image, max_edge)
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+    return frame_from_rgb(image)
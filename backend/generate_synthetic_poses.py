@@ -10,6 +10,8 @@ import json
 import os
 import numpy as np
 
+from dataset_io import save_dataset
+
 # Define pose templates for different pose types
 # Each template is a list of 33 landmarks (x, y) normalized 0-1
 # Based on MediaPipe's POSE_LANDMARKS
@@ -287,13 +289,8 @@ def generate_pose_for_monkey(monkey_id):
     
     return pose.tolist()
 
-def update_dataset_with_synthetic_poses(dataset_path):
-    """Update existing dataset with synthetic poses for all monkeys."""
-    
-    # Load existing dataset
-    with open(dataset_path, 'r') as f:
-        dataset = json.load(f)
-    
+def apply_synthetic_poses(dataset):
+    """Fill in synthetic poses, in place, for monkeys without a detected pose."""
     updated_count = 0
     
     for monkey in dataset:
@@ -306,9 +303,19 @@ def update_dataset_with_synthetic_poses(dataset_path):
             updated_count += 1
             print(f"  ✓ Generated pose for {monkey['id']}")
     
-    # Save updated dataset
-    with open(dataset_path, 'w') as f:
-        json.dump(dataset, f, indent=2)
+    return updated_count
+
+def update_dataset_with_synthetic_poses(dataset_path):
+    """Update existing dataset with synthetic poses for all monkeys."""
+    
+    # Load existing dataset
+    with open(dataset_path, 'r') as f:
+        dataset = json.load(f)
+    
+    updated_count = apply_synthetic_poses(dataset)
+    
+    # Save updated dataset (JSON + memory-mappable binary copy)
+    save_dataset(dataset, dataset_path)
     
     print(f"\n✅ Updated {updated_count} monkeys with synthetic poses")
     print(f"   All {len(dataset)} monkeys now have pose data!")
@@ -0,0 +1,84 @@
+"""
+Image Header Probing
+
+Format and pixel size of an upload, read from its first bytes with the
+standard library only. Kept apart from frame.py so the API process can
+vet uploads without importing OpenCV or MediaPipe.
+"""
+
+import struct
+from typing import NamedTuple, Optional
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, ...)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class ImageHeader(NamedTuple):
+    format: str     # "jpeg", "png" or "webp"
+    width: int
+    height: int
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """"jpeg", "png" or "webp" from the file signature alone, else None."""
+    if data[:8] == _PNG_SIGNATURE:
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:2] == b"\xff\xd8":
+        return "jpeg"
+    return None
+
+
+def probe_image_header(data: bytes) -> Optional[ImageHeader]:
+    """
+    Format and pixel size from the first bytes of a JPEG, PNG or WebP,
+    without decoding. Returns None for other formats or when the size
+    isn't in `data` (a truncated header, or a JPEG whose frame header
+    comes after more metadata than was read); sniff_format() tells the
+    two apart.
+    """
+    if data[:8] == _PNG_SIGNATURE and len(data) >= 24 and data[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", data[16:24])
+        return ImageHeader("png", width, height)
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = bytes(data[12:16])
+        if chunk == b"VP8X":
+            width = 1 + int.from_bytes(data[24:27], "little")
+            height = 1 + int.from_bytes(data[27:30], "little")
+        elif chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            width, height = 1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF)
+        elif chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            width, height = width & 0x3FFF, height & 0x3FFF
+        else:
+            return None
+        return ImageHeader("webp", width, height)
+
+    if data[:2] != b"\xff\xd8":
+        return None
+    # Walk the JPEG segments up to the start-of-frame header
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # no length field
+            pos += 2
+            continue
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return ImageHeader("jpeg", width, height)
+        if marker == 0xDA:  # start of scan without a frame header
+            return None
+        pos += 2 + length
+    return None
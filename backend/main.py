@@ -7,28 +7,111 @@ The system gets worse the more you use it!
 Now with FACE DETECTION for expression matching!
 """
 
-from fastapi import FastAPI, File, UploadFile, Header
+from fastapi import FastAPI, File, UploadFile, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import Optional
+from fastapi.responses import JSONResponse, PlainTextResponse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Dict, List, Optional
+import asyncio
 import time
-import cv2
-import numpy as np
 
 from entropy import (
-    create_session, get_session, increment_attempt, 
-    get_session_stats, add_entropy, ENTROPY_DETECTION_FAILURE
+    create_session, new_session_id, reset_entropy, session_store_stats,
+    get_session_stats, session_stats, SessionContext, ENTROPY_DETECTION_FAILURE
 )
-from pose_detection import extract_pose_from_bytes
-from matching import find_best_match, productive_failure, MONKEY_DATASET
-from face_detection import classify_face_expression
+from matching import (
+    find_best_match, productive_failure, get_snapshot, reload_dataset, warm_up_matching, DatasetWatcher
+)
+from metrics import get_logger, setup_logging
+from pipeline import Detection, run_detection, load_models, shutdown_face_executor, warm_up_worker
+from streaming import PoseStream
+from timing import StageTimer
+from uploads import UploadLimitMiddleware, UploadRejected, read_upload, rejection_response, upload_limits
+from workers import InferencePool, PoolSaturated
+import config
+import metrics
+
+setup_logging()
+log = get_logger("api")
+
+# Decode + MediaPipe run here, never on the event loop (created at startup)
+detection_pool: Optional[InferencePool] = None
+# /stream connections' landmarkers run here, one thread per open stream
+stream_executor: Optional[ThreadPoolExecutor] = None
+open_streams: Dict[int, PoseStream] = {}
+
+# Startup warm-up progress, served by /ready
+readiness: Dict = {"ready": False, "detail": "warming up", "workers": [], "dataset": None}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the detection pool and warm it up; /ready reports when it's done."""
+    global detection_pool, stream_executor
+    readiness.update(ready=False, detail="warming up", workers=[], dataset=None)
+    detection_pool = InferencePool.from_config(initializer=load_models)
+    stream_executor = ThreadPoolExecutor(max(1, config.STREAM_MAX_SESSIONS), thread_name_prefix="stream")
+    # Warm up in the background: the port opens at once (liveness, /health)
+    # while /ready keeps the load balancer away until models are hot
+    warm_up_task = asyncio.create_task(warm_up())
+    watcher = None
+    if config.DATASET_WATCH_INTERVAL > 0:
+        watcher = DatasetWatcher(config.DATASET_WATCH_INTERVAL)
+        watcher.start()
+    try:
+        yield
+    finally:
+        # Stop taking new traffic before the pool goes away
+        readiness.update(ready=False, detail="shutting down")
+        warm_up_task.cancel()
+        if watcher:
+            watcher.stop()
+        detection_pool.shutdown()
+        stream_executor.shutdown(cancel_futures=True)
+        shutdown_face_executor()
+
+
+async def warm_up():
+    """
+    Load and run both models on every worker, then warm the matcher.
+    Marks the app ready only if every worker came up with working models.
+    """
+    try:
+        # Every worker builds its landmarker + face detector (pool
+        # initializer) and runs one dummy inference
+        warmed = await asyncio.to_thread(detection_pool.warm_up, warm_up_worker, config.WARMUP_TIMEOUT)
+        readiness["workers"] = warmed
+        log.info("Detection pool warm: %d/%d %s workers", len(warmed), detection_pool.workers, detection_pool.kind)
+        readiness["dataset"] = await asyncio.to_thread(warm_up_matching)
+    except Exception as e:
+        log.exception("Warm-up failed")
+        readiness["detail"] = f"warm-up failed: {e}"
+        return
+    
+    model_errors = sorted({f"{model}: {error}" for w in warmed for model, error in w["model_errors"].items()})
+    if len(warmed) < detection_pool.workers:
+        readiness["detail"] = f"only {len(warmed)}/{detection_pool.workers} workers warmed up"
+    elif model_errors:
+        readiness["detail"] = "; ".join(model_errors)
+    else:
+        readiness.update(ready=True, detail="ready")
+    if not readiness["ready"]:
+        log.error("Not ready: %s", readiness["detail"])
+
 
 app = FastAPI(
     title="Monkey Doppelgänger API",
     description="Pose-matching with System Collapse mechanics",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Refuse oversized upload bodies before they are parsed (added first so
+# the CORS middleware wraps it and browsers can read the 413)
+app.add_middleware(UploadLimitMiddleware, limits=upload_limits())
+
 # CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -47,20 +130,52 @@ async def root():
         "version": "1.0.0",
         "status": "operational",
         "warning": "System stability not guaranteed",
-        "monkeys_loaded": len(MONKEY_DATASET)
+        "monkeys_loaded": len(get_snapshot().rows)
     }
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
+    snapshot = get_snapshot()
     return {
         "status": "ok",
-        "monkeys_loaded": len(MONKEY_DATASET),
+        "monkeys_loaded": len(snapshot.rows),
+        "dataset": snapshot.info(),
+        "pool": detection_pool.stats(),
+        "sessions": session_store_stats(),
+        "streams": {"open": len(open_streams), "max": config.STREAM_MAX_SESSIONS},
+        "detection_cache": {
+            # Counted here, so process-pool workers' separate caches add up
+            "hits": int(metrics.DETECTION_CACHE.value(result="hit")),
+            "misses": int(metrics.DETECTION_CACHE.value(result="miss")),
+            "max_entries_per_worker": config.DETECTION_CACHE_SIZE,
+            "ttl_seconds": config.DETECTION_CACHE_TTL,
+        },
         "timestamp": time.time()
     }
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until every worker's models are loaded and warm."""
+    return JSONResponse(
+        status_code=200 if readiness["ready"] else 503,
+        content={**readiness, "dataset_version": get_snapshot().version},
+    )
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latencies, cache and rejection counters in Prometheus text format."""
+    metrics.POOL_IN_FLIGHT.set(detection_pool.stats()["in_flight"])
+    metrics.STREAMS_OPEN.set(len(open_streams))
+    resident = session_store_stats().get("resident")
+    if resident is not None:
+        metrics.SESSIONS_RESIDENT.set(resident)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/session")
 async def create_new_session():
     """Create a new session with fresh entropy."""
@@ -94,71 +209,225 @@ async def analyze_pose(
     Returns:
         Monkey match with entropy-dependent mutations applied
     """
-    # Get or create session
-    session_id = x_session_id or create_session()
+    timer = StageTimer()
     
-    # Increment attempt (adds entropy)
-    attempt_num = increment_attempt(session_id)
+    # Get or create session; entropy is staged and written once at the end
+    # (the commit creates the session, so a new id needs no extra write)
+    session_id = x_session_id or new_session_id()
+    session = SessionContext(session_id)
     
-    # Read image
+    # Read image (size, format and pixel limits are enforced while reading)
     try:
-        image_bytes = await image.read()
+        with timer.stage("read"):
+            image_bytes = await read_upload(image)
+    except UploadRejected as e:
+        metrics.REJECTED_REQUESTS.inc(reason=e.error)
+        return e.response()
     except Exception as e:
         # Productive failure - never crash!
-        result = productive_failure(session_id, "image_error")
-        stats = get_session_stats(session_id)
-        return {
-            **result,
-            "session": stats,
-            "attempt": attempt_num
-        }
+        session.add_attempt()
+        result = productive_failure(session_id, "image_error", session)
+        return finish_response(result, session, timer)
     
-    # Convert to numpy array for face detection
+    # Queue detection before touching the session, so a 503 costs no entropy
+    submitted_at = time.perf_counter()
     try:
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        cv_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if cv_image is not None:
-            cv_image_rgb = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
-            # Detect face expression
-            expression, face_confidence, face_debug = classify_face_expression(cv_image_rgb)
-        else:
-            expression = "unknown"
-            face_confidence = 0.0
-            face_debug = {"error": "Could not decode image"}
-    except Exception as e:
-        expression = "unknown"
-        face_confidence = 0.0
-        face_debug = {"error": str(e)}
+        pending = detection_pool.submit(run_detection, image_bytes, face_plan())
+    except PoolSaturated:
+        return overloaded_response()
+    
+    # Count the attempt (adds entropy)
+    session.add_attempt()
+    
+    # Decode + face + pose in the worker pool
+    detection = await collect_detection(pending, submitted_at, timer)
+    
+    response = build_match_response(session, detection, timer)
+    return finish_response(response, session, timer)
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(
+    images: List[UploadFile] = File(...),
+    x_session_id: Optional[str] = Header(None, alias="X-Session-ID")
+):
+    """
+    Analyze several photos in one request (group events, kiosk imports).
     
-    # Extract pose
-    keypoints, confidence, debug_info = extract_pose_from_bytes(image_bytes)
+    Reading, decode and detection for all images run concurrently on the
+    worker pool; the batch keeps at most one job per worker in flight so it
+    can't starve single /analyze calls or hold every upload in memory.
+    Session entropy is then applied once per image, strictly in upload
+    order, so the outcome doesn't depend on which detection finished first.
+    
+    Returns:
+        Per-image results in upload order plus the final session state
+    """
+    if len(images) > config.BATCH_MAX_IMAGES:
+        metrics.REJECTED_REQUESTS.inc(reason="too_many_images")
+        return JSONResponse(
+            status_code=413,
+            content={
+                "success": False,
+                "error": "too_many_images",
+                "max_images": config.BATCH_MAX_IMAGES,
+            },
+        )
+    
+    # The photos' total size, in upload order (the middleware has already
+    # capped the body, multipart overhead included)
+    total_bytes = 0
+    for image in images:
+        total_bytes += image.size or 0
+        if total_bytes > config.BATCH_MAX_BYTES:
+            metrics.REJECTED_REQUESTS.inc(reason="upload_too_large")
+            return rejection_response(
+                413, "upload_too_large",
+                f"Photos total more than {config.BATCH_MAX_BYTES} bytes",
+                max_bytes=config.BATCH_MAX_BYTES,
+            )
+    
+    timer = StageTimer()
+    session_id = x_session_id or new_session_id()
+    session = SessionContext(session_id)
+    
+    # Each upload is read inside its detection job, so only about one
+    # payload per worker is in memory at once (None skips an unreadable
+    # one). Files refused by the upload limits are answered as /analyze
+    # would: no attempt, no entropy
+    rejected: Dict[int, UploadRejected] = {}
+    
+    async def read(i: int) -> Optional[bytearray]:
+        try:
+            with timer.stage("read"):
+                return await read_upload(images[i])
+        except UploadRejected as e:
+            metrics.REJECTED_REQUESTS.inc(reason=e.error)
+            rejected[i] = e
+        except Exception:
+            pass
+        return None
+    
+    # Fan out; only the first admission may 503, before any entropy is added
+    with timer.stage("detect"):
+        try:
+            detections = await detection_pool.map(
+                partial(run_detection, face_plan=face_plan()),
+                list(range(len(images))),
+                window=detection_pool.workers,
+                prepare=read,
+            )
+        except PoolSaturated:
+            return overloaded_response()
+    by_index = {i: detection for i, detection in enumerate(detections) if detection is not None}
+    for detection in by_index.values():
+        count_cache_result(detection)
+    
+    # Stage session entropy in upload order, then write it all at once
+    results = []
+    attempted = []
+    for i in range(len(images)):
+        if i in rejected:
+            results.append({"success": False, "error": rejected[i].error, "detail": rejected[i].detail})
+            continue
+        session.add_attempt()
+        attempted.append(len(results))
+        if i not in by_index:
+            results.append(productive_failure(session_id, "image_error", session))
+            continue
+        image_timer = StageTimer()
+        image_timer.merge(by_index[i].timings)
+        results.append(build_match_response(session, by_index[i], image_timer))
+    with timer.stage("session"):
+        state = session.commit()
+    metrics.observe_stages("analyze_batch", timer.stages, timer.elapsed_ms())
+    
+    # The batch's attempts are the last len(attempted) of the session
+    first_attempt = state.attempts - len(attempted) + 1
+    for n, i in enumerate(attempted):
+        results[i]["attempt"] = first_attempt + n
+    
+    return {
+        "success": True,
+        "count": len(results),
+        "results": results,
+        "session": session.stats(),
+        "timings": timer.as_dict()
+    }
+
+
+async def collect_detection(pending, submitted_at: float, timer: StageTimer) -> Detection:
+    """Await a pool job and fold its stage timings (plus queue wait) into `timer`."""
+    detection = await asyncio.wrap_future(pending)
+    count_cache_result(detection)
+    timer.merge(detection.timings)
+    timer.add("queue", max(0.0, (time.perf_counter() - submitted_at) * 1000 - sum(detection.timings.values())))
+    return detection
+
+
+def count_cache_result(detection: Detection):
+    """Tally a detection that went through the cache lookup (had a "hash" stage)."""
+    if "hash" in detection.timings:
+        metrics.DETECTION_CACHE.inc(result="hit" if detection.cache_hit else "miss")
+
+
+def face_plan() -> Optional[frozenset]:
+    """What run_detection needs to skip face detection (None = never skip)."""
+    if config.FACE_DETECTION == "always" or config.DETECTION_MODE == "concurrent":
+        return None
+    return get_snapshot().index.expression_blind
+
+
+def finish_response(response: dict, session: SessionContext, timer: StageTimer) -> dict:
+    """
+    Write the request's staged entropy (timed as the "session" stage), add
+    "session"/"attempt" to `response` and record its stage metrics.
+    """
+    with timer.stage("session"):
+        state = session.commit()
+    response["session"] = session.stats()
+    response["attempt"] = state.attempts
+    response["stages_run"] = list(timer.stages)
+    response["timings"] = timer.as_dict()
+    metrics.observe_stages("analyze", timer.stages, timer.elapsed_ms())
+    return response
+
+
+def build_match_response(session: SessionContext, detection: Detection, timer: StageTimer) -> dict:
+    """
+    Turn one image's detection into a match response, staging session
+    entropy on `session`. The caller commits and adds "session"/"attempt".
+    """
+    keypoints, confidence, debug_info = detection.keypoints, detection.confidence, detection.pose_debug
+    expression, face_debug = detection.expression, detection.face_debug
     
     # Handle no pose detection (productive failure)
     if keypoints is None:
-        add_entropy(session_id, ENTROPY_DETECTION_FAILURE, "detection_failure")
-        result = productive_failure(session_id, "no_pose")
-        stats = get_session_stats(session_id)
+        session.add_entropy(ENTROPY_DETECTION_FAILURE, "detection_failure")
+        result = productive_failure(session.session_id, "no_pose", session)
         return {
             **result,
-            "session": stats,
-            "attempt": attempt_num,
             "pose_debug": debug_info,
             "face_expression": expression,
-            "face_debug": face_debug
+            "detection_cached": detection.cache_hit,
+            "face_debug": face_debug,
+            "stages_run": list(timer.stages),
+            "stages_skipped": detection.skipped,
+            "timings": timer.as_dict()
         }
     
     # Find best match with entropy mutations (now includes expression)
     partial_body = debug_info.get("partial", False)
-    match_result = find_best_match(
-        keypoints, 
-        session_id, 
-        confidence, 
-        partial_body,
-        expression=expression  # Pass face expression!
-    )
-    
-    # Get session stats
-    stats = get_session_stats(session_id)
+    with timer.stage("match"):
+        match_result = find_best_match(
+            keypoints, 
+            session.session_id, 
+            confidence, 
+            partial_body,
+            expression=expression,  # Pass face expression!
+            session=session,
+            timer=timer
+        )
     
     # Build response
     monkey = match_result["monkey"]
@@ -175,13 +444,30 @@ async def analyze_pose(
         "chaos_message": match_result.get("chaos_message"),
         "pose_type": match_result.get("pose_type", "unknown"),
         "face_expression": expression,
-        "session": stats,
-        "attempt": attempt_num,
+        "detection_cached": detection.cache_hit,
         "pose_debug": debug_info,
-        "face_debug": face_debug
+        "face_debug": face_debug,
+        "stages_run": list(timer.stages),
+        "stages_skipped": detection.skipped,
+        "timings": timer.as_dict()
     }
 
 
+def overloaded_response() -> JSONResponse:
+    """503 with Retry-After when the detection queue is full."""
+    metrics.REJECTED_REQUESTS.inc(reason="overloaded")
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(config.POOL_RETRY_AFTER)},
+        content={
+            "success": False,
+            "error": "overloaded",
+            "chaos_message": "Too many primates in the queue. Try again in a moment.",
+            "retry_after": config.POOL_RETRY_AFTER,
+        },
+    )
+
+
 def get_match_quality(score: float) -> str:
     """Get fun match quality label."""
     if score >= 95:
@@ -196,34 +482,148 @@ def get_match_quality(score: float) -> str:
         return "CURIOUS"
 
 
+@app.websocket("/stream")
+async def pose_stream(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    Live pose guidance: send camera frames as binary messages (one image
+    each), receive {"type": "pose", "pose_type": ..., "match": ...}
+    whenever the guidance changes. Frames that arrive while the previous
+    one is still being tracked are dropped. See streaming.py.
+    """
+    await websocket.accept()
+    if len(open_streams) >= config.STREAM_MAX_SESSIONS:
+        metrics.REJECTED_REQUESTS.inc(reason="streams_full")
+        await websocket.send_json({"type": "error", "error": "overloaded", "detail": "Too many open streams"})
+        await websocket.close(code=1013)  # try again later
+        return
+    
+    loop = asyncio.get_running_loop()
+    stream = PoseStream(session_id)
+    open_streams[id(stream)] = stream
+    try:
+        try:
+            await loop.run_in_executor(stream_executor, stream.open)
+        except Exception as e:
+            await websocket.send_json({"type": "error", "error": "pose_model_unavailable", "detail": str(e)})
+            await websocket.close(code=1011)
+            return
+        
+        await websocket.send_json({"type": "ready", "session_id": session_id, "max_bytes": config.UPLOAD_MAX_BYTES})
+        pending: Optional[asyncio.Task] = None
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if data is None:
+                    await websocket.send_json({"type": "error", "error": "expected_binary_frame"})
+                    continue
+                stream.received += 1
+                if pending is not None and not pending.done():
+                    stream.dropped += 1
+                    metrics.STREAM_FRAMES.inc(result="dropped")
+                    continue
+                pending = asyncio.create_task(send_stream_result(websocket, stream, data, stream.received))
+        except WebSocketDisconnect:
+            pass
+        if pending is not None:
+            await asyncio.wait([pending])
+        log.info("Stream closed: %s", stream.stats())
+    finally:
+        open_streams.pop(id(stream), None)
+        await loop.run_in_executor(stream_executor, stream.close)
+
+
+async def send_stream_result(websocket: WebSocket, stream: PoseStream, data: bytes, frame_number: int):
+    """Process one streamed frame off the event loop and send its event, if it has one."""
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        result, stages = await loop.run_in_executor(stream_executor, stream.process, data, frame_number)
+    except Exception as e:
+        log.exception("Stream frame failed")
+        result, stages = {"type": "error", "frame": frame_number, "error": "stream_error", "detail": str(e)}, {}
+    if result is None or result["type"] == "pose":
+        metrics.STREAM_FRAMES.inc(result="unchanged" if result is None else "changed")
+        metrics.observe_stages("stream", stages, (time.perf_counter() - started) * 1000)
+    else:
+        metrics.STREAM_FRAMES.inc(result="rejected")
+    if result is None:
+        return
+    try:
+        await websocket.send_json(result)
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # client went away mid-frame
+
+
 @app.get("/monkeys")
 async def list_monkeys():
     """List all available monkeys in dataset."""
+    snapshot = get_snapshot()
     return {
-        "count": len(MONKEY_DATASET),
+        "count": len(snapshot.rows),
+        "dataset_version": snapshot.version,
         "monkeys": [
             {
                 "id": m.get("id"),
                 "image": m.get("image"),
                 "species": m.get("species")
             }
-            for m in MONKEY_DATASET
+            for m in snapshot.rows
         ]
     }
 
 
+@app.post("/admin/reload-dataset")
+async def reload_monkey_dataset(
+    x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")
+):
+    """
+    Reload monkey_dataset.json (or its binary copy) without a restart.
+    
+    The new catalogue and indexes are built on a background thread and
+    swapped in atomically; requests already matching finish on the old
+    version.
+    
+    Only the worker process that receives the request reloads. With
+    several uvicorn workers, update the dataset files and let each
+    worker's watcher (MONKEY_DATASET_WATCH_INTERVAL) pick them up.
+    
+    Disabled unless MONKEY_ADMIN_TOKEN is set.
+    """
+    if not config.ADMIN_TOKEN:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "not_found", "detail": "Set MONKEY_ADMIN_TOKEN to enable /admin endpoints"},
+        )
+    if x_admin_token != config.ADMIN_TOKEN:
+        return JSONResponse(status_code=403, content={"error": "forbidden"})
+    
+    previous = get_snapshot().version
+    try:
+        snapshot = await asyncio.to_thread(reload_dataset)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": "reload_failed", "detail": str(e), "dataset_version": previous},
+        )
+    
+    return {
+        "message": "Dataset reloaded",
+        "previous_version": previous,
+        "dataset": snapshot.info(),
+    }
+
+
 @app.post("/reset/{session_id}")
 async def reset_session(session_id: str):
     """Reset session entropy (for testing)."""
-    session = get_session(session_id)
-    session.entropy = 0.0
-    session.attempts = 0
-    session.collapsed = False
-    session.mutations = ["SESSION_RESET"]
+    state = reset_entropy(session_id)
     
     return {
         "message": "Session reset. Stability restored.",
-        "session": get_session_stats(session_id)
+        "session": session_stats(session_id, state)
     }
 
 
@@ -6,143 +6,395 @@ Focus on clear, distinct pose types for reliable matching.
 """
 
 import numpy as np
-import json
 import os
 import random
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
 from typing import List, Dict, Tuple, Optional
-from entropy import should_apply_mutation, add_entropy, get_session, ENTROPY_LOW_CONFIDENCE, ENTROPY_PARTIAL_BODY
+from ann import IVFIndex
+import config
+import dataset_io
+from dataset_io import pose_matrix
+from entropy import should_apply_mutation, SessionContext, ENTROPY_LOW_CONFIDENCE, ENTROPY_PARTIAL_BODY
+from metrics import get_logger, sampled
+from pose_types import classify_pose
+from timing import StageTimer
 
-# Load monkey dataset
+log = get_logger("matching")
+
+# Monkey dataset (loaded into a DatasetSnapshot below)
 DATASET_PATH = os.path.join(os.path.dirname(__file__), "monkey_dataset.json")
 
-def load_dataset() -> List[Dict]:
-    """Load pre-processed monkey poses."""
-    if os.path.exists(DATASET_PATH):
-        with open(DATASET_PATH, 'r') as f:
-            return json.load(f)
-    return []
+def load_dataset() -> dataset_io.LoadedDataset:
+    """Load pre-processed monkey poses (memory-mapped binary copy if current)."""
+    return dataset_io.load_dataset(DATASET_PATH)
 
-MONKEY_DATASET = load_dataset()
+# Mapping from pose types to monkey ID patterns
+POSE_TYPE_PATTERNS = {
+    "arms_up": ["arms_up", "fist_pump", "waving", "victory"],
+    "arms_crossed": ["arms_crossed", "cool"],
+    "praying": ["praying", "yoga"],
+    "shrug": ["shrug", "surprised"],
+    "selfie": ["selfie", "duck_face", "head_tilt", "tongue_out", "influencer"],
+    "waving": ["waving", "peace", "happy"],
+    "peace": ["peace", "waving", "happy"],
+    "flexing": ["flexing", "gymbro", "fist_pump"],
+    "thinking": ["think", "thinker", "hand_face", "chin_up"],
+    "hands_hips": ["hands_hips", "cool", "arms_crossed"],
+    "pointing": ["pointing", "looking_side"],
+    "neutral": ["monkey1", "monkey2", "monkey3", "monkey4", "monkey5"],
+}
+DEFAULT_POSE_PATTERNS = ["monkey"]
 
-# Pose type categories based on arm positions
-def classify_pose(keypoints: np.ndarray) -> Tuple[str, Dict]:
-    """
-    Classify a pose into a category based on arm positions.
-    Returns pose type and debug info.
+# Monkeys whose ID matches these get a boost for the user's face expression
+EXPRESSION_PATTERNS = {
+    "smiling": ["happy", "waving", "peace", "selfie", "cool"],
+    "surprised": ["surprised", "screaming", "shrug", "looking_up"],
+    "neutral": ["think", "thinker", "cool", "pointing", "sideeye"],
+}
+EXPRESSION_BOOST = 10
+
+
+# Joints compared by calculate_pose_distance: shoulders, elbows, wrists
+MATCH_JOINTS = [11, 12, 13, 14, 15, 16]
+MIN_POSE_LANDMARKS = 17
+NO_POSE_DISTANCE = 999.0
+
+
+def _id_matches(monkey: Dict, patterns: List[str]) -> bool:
+    monkey_id = monkey.get("id", "").lower()
+    return any(pattern in monkey_id for pattern in patterns)
+
+
+@dataclass
+class CandidateSet:
+    """Monkeys to score for one (pose_type, expression), in dataset order."""
+    monkeys: List[Dict]
+    rows: np.ndarray        # (M,) positions into PoseIndex.poses
+    boosted: np.ndarray     # (M,) expression boost flags
+    joints_x: np.ndarray    # (M, 6) MATCH_JOINTS x coordinates, contiguous
+    joints_y: np.ndarray    # (M, 6) MATCH_JOINTS y coordinates, contiguous
+    comparable: np.ndarray  # (M,) pose has enough landmarks to compare
+    has_pose: np.ndarray    # (M,) pose data present at all
+    ann: Optional[IVFIndex] = None              # over the comparable rows only
+    ann_positions: Optional[np.ndarray] = None  # ANN vector i -> candidate position
+    ann_always: Optional[np.ndarray] = None     # positions outside the ANN index
+    
+    def __len__(self) -> int:
+        return len(self.monkeys)
+    
+    def subset(self, positions: np.ndarray) -> "CandidateSet":
+        """The candidates at `positions` (ascending), without the ANN index."""
+        return CandidateSet(
+            monkeys=[self.monkeys[i] for i in positions.tolist()],
+            rows=self.rows[positions],
+            boosted=self.boosted[positions],
+            joints_x=self.joints_x[positions],
+            joints_y=self.joints_y[positions],
+            comparable=self.comparable[positions],
+            has_pose=self.has_pose[positions],
+        )
+    
+    def __iter__(self):
+        """(monkey, boosted) pairs, like the old per-monkey loop."""
+        return zip(self.monkeys, self.boosted.tolist())
+
+
+class PoseIndex:
     """
-    if keypoints is None or len(keypoints) < 17:
-        return "neutral", {}
-    
-    keypoints = np.array(keypoints)
-    
-    # Get key points
-    nose_y = keypoints[0][1]
-    left_shoulder = keypoints[11]
-    right_shoulder = keypoints[12]
-    left_elbow = keypoints[13]
-    right_elbow = keypoints[14]
-    left_wrist = keypoints[15]
-    right_wrist = keypoints[16]
-    
-    shoulder_y = (left_shoulder[1] + right_shoulder[1]) / 2
-    shoulder_center_x = (left_shoulder[0] + right_shoulder[0]) / 2
-    
-    # Calculate arm positions relative to shoulders
-    left_wrist_rel_y = left_wrist[1] - shoulder_y  # negative = above
-    right_wrist_rel_y = right_wrist[1] - shoulder_y
-    
-    left_wrist_rel_x = left_wrist[0] - shoulder_center_x  # positive = left
-    right_wrist_rel_x = right_wrist[0] - shoulder_center_x  # negative = right
-    
-    debug = {
-        "left_wrist_y": round(left_wrist_rel_y, 3),
-        "right_wrist_y": round(right_wrist_rel_y, 3),
-        "left_wrist_x": round(left_wrist_rel_x, 3),
-        "right_wrist_x": round(right_wrist_rel_x, 3),
-    }
-    
-    # Classification rules (check from most specific to least)
-    
-    # Both arms raised high (y < -0.1 means above shoulders)
-    if left_wrist_rel_y < -0.15 and right_wrist_rel_y < -0.15:
-        return "arms_up", debug
+    Pose-type, expression and pose lookups precomputed from a dataset.
     
-    # Both hands near center/chest (crossed or praying)
-    if abs(left_wrist_rel_x - right_wrist_rel_x) < 0.15 and abs(left_wrist_rel_y) < 0.15:
-        if left_wrist_rel_y < 0:
-            return "praying", debug
-        return "arms_crossed", debug
+    All substring matching of monkey IDs happens once here, at load time.
+    A request then gets its candidates with a dict lookup:
+    lookup(pose_type, expression) returns a CandidateSet in dataset order,
+    already falling back to the whole dataset when no monkey matches the
+    pose type.
     
-    # Shrug - both elbows out, wrists up
-    if left_wrist_rel_y < 0 and right_wrist_rel_y < 0 and abs(left_wrist_rel_x) > 0.15:
-        return "shrug", debug
+    Poses are held as one contiguous (N, 33, 2) float32 array, so scoring
+    never touches the JSON lists again. Pass `poses` / `pose_lengths` from
+    dataset_io to use a memory-mapped matrix instead of the rows' lists.
     
-    # Left arm only raised (selfie, waving)
-    if left_wrist_rel_y < -0.1 and right_wrist_rel_y > 0:
-        if left_wrist_rel_x > 0.2:  # arm extended out
-            return "selfie", debug
-        return "waving", debug
+    With search="approximate", pose types with at least
+    config.ANN_MIN_CANDIDATES candidates also get an IVF index, and
+    shortlist() narrows a CandidateSet to the cells nearest the user pose.
     
-    # Right arm only raised (mirror selfie, peace)
-    if right_wrist_rel_y < -0.1 and left_wrist_rel_y > 0:
-        if right_wrist_rel_x < -0.2:
-            return "selfie", debug
-        return "peace", debug
-    
-    # Arms flexed (elbows up, wrists near shoulders)
-    left_elbow_rel_y = left_elbow[1] - shoulder_y
-    right_elbow_rel_y = right_elbow[1] - shoulder_y
-    if left_elbow_rel_y < 0 and right_elbow_rel_y < 0:
-        return "flexing", debug
+    expression_blind lists the pose types none of whose candidates match an
+    expression pattern: for those the face expression cannot change the
+    match, so detection workers may skip face detection.
+    """
     
-    # Hand near face (thinking)
-    if (left_wrist_rel_y < 0 and abs(left_wrist_rel_x) < 0.1) or \
-       (right_wrist_rel_y < 0 and abs(right_wrist_rel_x) < 0.1):
-        if left_wrist[1] < nose_y + 0.1 or right_wrist[1] < nose_y + 0.1:
-            return "thinking", debug
+    def __init__(
+        self,
+        dataset: List[Dict],
+        search: str = config.MATCH_SEARCH,
+        poses: Optional[np.ndarray] = None,
+        pose_lengths: Optional[np.ndarray] = None,
+    ):
+        if search not in ("exact", "approximate"):
+            raise ValueError(f"Unknown match search mode: {search!r} (expected 'exact' or 'approximate')")
+        self.dataset = dataset
+        self.search = search
+        
+        # (N, 33, 2) pose matrix; rows too short to compare are flagged
+        if poses is None:
+            poses, pose_lengths = pose_matrix(dataset)
+        self.poses = poses
+        self.has_pose = pose_lengths > 0
+        self.comparable = pose_lengths >= MIN_POSE_LANDMARKS
+        
+        # pose_type -> matching rows (None = unknown type, "monkey" pattern)
+        rows_by_type = {
+            pose_type: [row for row, m in enumerate(dataset) if _id_matches(m, patterns)]
+            for pose_type, patterns in POSE_TYPE_PATTERNS.items()
+        }
+        rows_by_type[None] = [row for row, m in enumerate(dataset) if _id_matches(m, DEFAULT_POSE_PATTERNS)]
+        self.by_pose_type: Dict[Optional[str], List[Dict]] = {
+            pose_type: [dataset[row] for row in rows]
+            for pose_type, rows in rows_by_type.items()
+        }
+        
+        # expression (None = no boost) -> per-row boost flags
+        boosted_rows = {
+            expression: np.array([_id_matches(m, patterns) for m in dataset], dtype=bool)
+            for expression, patterns in EXPRESSION_PATTERNS.items()
+        }
+        boosted_rows[None] = np.zeros(len(dataset), dtype=bool)
+        
+        # Per pose type, the compared joints are gathered once into x / y
+        # planes so scoring is pure elementwise math on contiguous memory
+        self._candidates: Dict[Tuple[Optional[str], Optional[str]], CandidateSet] = {}
+        for pose_type, rows in rows_by_type.items():
+            # Fallback to all monkeys
+            rows = np.array(rows or range(len(dataset)), dtype=np.intp)
+            monkeys = [dataset[row] for row in rows]
+            joints = self.poses[rows][:, MATCH_JOINTS]
+            joints_x = np.ascontiguousarray(joints[..., 0])
+            joints_y = np.ascontiguousarray(joints[..., 1])
+            ann, ann_positions, ann_always = self._build_ann(joints_x, joints_y, self.comparable[rows])
+            for expression, boosted in boosted_rows.items():
+                self._candidates[(pose_type, expression)] = CandidateSet(
+                    monkeys, rows, boosted[rows], joints_x, joints_y,
+                    self.comparable[rows], self.has_pose[rows],
+                    ann, ann_positions, ann_always,
+                )
+        
+        self.expression_blind = frozenset(
+            pose_type for pose_type in POSE_TYPE_PATTERNS
+            if not any(self._candidates[(pose_type, expression)].boosted.any() for expression in EXPRESSION_PATTERNS)
+        )
+    
+    def _build_ann(self, joints_x: np.ndarray, joints_y: np.ndarray, comparable: np.ndarray):
+        """IVF index over one pose type's comparable poses, if worth having."""
+        if self.search != "approximate" or comparable.sum() < config.ANN_MIN_CANDIDATES:
+            return None, None, None
+        positions = np.flatnonzero(comparable)
+        vectors = np.hstack([joints_x[positions], joints_y[positions]])
+        return IVFIndex(vectors, nlist=config.ANN_NLIST or None), positions, np.flatnonzero(~comparable)
+    
+    def monkeys_for(self, pose_type: str) -> List[Dict]:
+        """Monkeys whose ID matches the pose type (no fallback)."""
+        key = pose_type if pose_type in POSE_TYPE_PATTERNS else None
+        return self.by_pose_type[key]
+    
+    def lookup(self, pose_type: str, expression: str) -> CandidateSet:
+        """Candidates (with expression boost flags) for a classified pose."""
+        pose_key = pose_type if pose_type in POSE_TYPE_PATTERNS else None
+        expression_key = expression if expression in EXPRESSION_PATTERNS else None
+        return self._candidates[(pose_key, expression_key)]
+    
+    def candidate_sets(self) -> List[CandidateSet]:
+        """Every (pose type, expression) candidate set, e.g. to warm them up."""
+        return list(self._candidates.values())
+    
+    def shortlist(self, user_pose: np.ndarray, candidates: CandidateSet, nprobe: int = config.ANN_NPROBE) -> CandidateSet:
+        """
+        Narrow candidates to the IVF cells nearest the user pose.
+        
+        Monkeys that aren't in the ANN index (no comparable pose) are always
+        kept, so they are scored exactly as in exact search. Returns
+        `candidates` unchanged when there is no index or no usable pose.
+        """
+        if candidates.ann is None or user_pose is None or len(user_pose) < MIN_POSE_LANDMARKS:
+            return candidates
+        user = np.asarray(user_pose, dtype=np.float32)[MATCH_JOINTS]
+        query = np.concatenate([user[:, 0], user[:, 1]])
+        hits = candidates.ann_positions[candidates.ann.search(query, nprobe)]
+        if len(candidates.ann_always):
+            hits = np.union1d(hits, candidates.ann_always)
+        return candidates.subset(hits)
+    
+    def score(self, user_pose: np.ndarray, candidates: CandidateSet) -> np.ndarray:
+        """
+        Match scores (0-100) for every candidate in one broadcast.
+        
+        Same rules as the per-monkey loop: 100 - 30 * mean joint distance,
+        a random 70-85 for monkeys without pose data (drawn in candidate
+        order), then the expression boost.
+        """
+        scores = self.pose_scores(user_pose, candidates)
+        
+        poseless = np.flatnonzero(~candidates.has_pose)
+        if len(poseless):
+            scores[poseless] = [random.uniform(70, 85) for _ in poseless]
+        
+        # BOOST score if monkey matches expression (+10 bonus)
+        return np.where(candidates.boosted, np.minimum(100.0, scores + EXPRESSION_BOOST), scores)
     
-    # Hands on hips (wrists near hip level, elbows out)
-    if left_wrist_rel_y > 0.2 and right_wrist_rel_y > 0.2:
-        if abs(left_wrist_rel_x) > 0.1 and abs(right_wrist_rel_x) > 0.1:
-            return "hands_hips", debug
+    def pose_scores(self, user_pose: np.ndarray, candidates: CandidateSet) -> np.ndarray:
+        """Scores from pose distance alone: no random draws, no expression boost."""
+        user = np.asarray(user_pose, dtype=np.float32) if user_pose is not None else None
+        
+        if user is not None and len(user) >= MIN_POSE_LANDMARKS:
+            dx = candidates.joints_x - user[MATCH_JOINTS, 0]
+            dy = candidates.joints_y - user[MATCH_JOINTS, 1]
+            distances = np.sqrt(dx * dx + dy * dy).mean(axis=1, dtype=np.float64)
+            distances[~candidates.comparable] = NO_POSE_DISTANCE
+        else:
+            distances = np.full(len(candidates), NO_POSE_DISTANCE)
+        
+        # Convert distance to score (lower distance = higher score)
+        return np.maximum(0.0, 100 - distances * 30)
+
+
+def top_scores(candidates: CandidateSet, scores: np.ndarray, k: int = 3) -> List[Tuple[str, float]]:
+    """
+    The k best (id, score) pairs, scores rounded to 0.1, ties in dataset order.
     
-    # Pointing (one arm extended forward)
-    if abs(left_wrist_rel_x) > 0.25 or abs(right_wrist_rel_x) > 0.25:
-        return "pointing", debug
+    argpartition shortlists everything within 0.1 of the k-th best raw
+    score (rounding can't reorder anything further away); only that
+    shortlist is rounded and sorted.
+    """
+    if len(scores) > k:
+        kth_best = scores[np.argpartition(scores, -k)[-k:]].min()
+        shortlist = np.flatnonzero(scores >= kth_best - 0.11)
+    else:
+        shortlist = np.arange(len(scores))
+    rounded = np.round(scores[shortlist], 1)
+    best = shortlist[np.lexsort((shortlist, -rounded))[:k]]
+    return [(candidates.monkeys[i]["id"], round(float(scores[i]), 1)) for i in best]
+
+
+@dataclass(frozen=True)
+class DatasetSnapshot:
+    """One immutable version of the catalogue and its indexes."""
+    version: int
+    rows: List[Dict]
+    index: PoseIndex
+    source: str         # "binary", "json" or "missing"
+    loaded_at: float
+    
+    def info(self) -> Dict:
+        """Summary for /health and /monkeys."""
+        return {
+            "version": self.version,
+            "monkeys": len(self.rows),
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def build_snapshot(version: int) -> DatasetSnapshot:
+    """Load the dataset from disk and build its indexes."""
+    loaded = load_dataset()
+    index = PoseIndex(loaded.rows, poses=loaded.poses, pose_lengths=loaded.pose_lengths)
+    return DatasetSnapshot(version, loaded.rows, index, loaded.source, time.time())
+
+
+# The active snapshot. Readers grab the reference once per call; a reload
+# builds a complete new snapshot and swaps the reference in one assignment,
+# so in-flight matches finish on the version they started with. Built on
+# first use rather than at import, so tools that only need the helpers (or
+# a process that never matches) don't parse the dataset.
+_snapshot: Optional[DatasetSnapshot] = None
+_reload_lock = threading.Lock()
+
+
+def get_snapshot() -> DatasetSnapshot:
+    """The catalogue version new requests should use (loaded on first call)."""
+    snapshot = _snapshot
+    if snapshot is None:
+        snapshot = reload_dataset(initial=True)
+    return snapshot
+
+
+def reload_dataset(initial: bool = False) -> DatasetSnapshot:
+    """
+    Rebuild the catalogue from disk and make it active.
     
-    return "neutral", debug
+    Blocking (run it off the event loop). Concurrent reloads are serialized.
+    If loading fails the current snapshot stays active and the error is
+    raised to the caller. With `initial`, only loads if nothing has been
+    loaded yet (first get_snapshot() calls racing each other load once).
+    """
+    global _snapshot
+    with _reload_lock:
+        if initial and _snapshot is not None:
+            return _snapshot
+        snapshot = build_snapshot(version=_snapshot.version + 1 if _snapshot else 1)
+        _snapshot = snapshot
+    log.info("Loaded dataset version %d: %d monkeys from %s", snapshot.version, len(snapshot.rows), snapshot.source)
+    return snapshot
+
+
+def dataset_files_mtime() -> float:
+    """Newest modification time among the dataset's JSON and binary files."""
+    paths = [DATASET_PATH, *dataset_io.binary_paths(DATASET_PATH)]
+    return max((os.path.getmtime(p) for p in paths if os.path.exists(p)), default=0.0)
+
+
+class DatasetWatcher:
+    """Background thread that reloads the dataset when its files change."""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dataset-watcher", daemon=True)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+    
+    def _run(self):
+        seen = dataset_files_mtime()
+        while not self._stop.wait(self.interval):
+            current = dataset_files_mtime()
+            if current == seen:
+                continue
+            # Writers replace files one at a time; let them finish
+            if self._stop.wait(min(1.0, self.interval)):
+                return
+            seen = dataset_files_mtime()
+            try:
+                reload_dataset()
+            except Exception as e:
+                log.error("Dataset reload failed, keeping version %d: %s", get_snapshot().version, e)
+
+
+def warm_up_matching() -> Dict:
+    """
+    Exercise the active snapshot once before serving: classify a catalogue
+    pose and fetch every pose type's candidates (shortlisting them too when
+    an ANN index exists). The indexes themselves are built when the snapshot
+    is; this pays the first-call costs around them. Draws no random numbers,
+    so the mutation stream is unchanged.
+    """
+    snapshot = get_snapshot()
+    index = snapshot.index
+    user_pose = index.poses[0] if len(index.poses) else np.zeros((33, 2), dtype=np.float32)
+    classify_pose(user_pose)
+    for candidates in index.candidate_sets():
+        index.shortlist(user_pose, candidates)
+    return snapshot.info()
 
 
 def get_monkeys_by_pose_type(pose_type: str) -> List[Dict]:
     """Find all monkeys that match a pose type."""
-    matches = []
-    
-    # Mapping from pose types to monkey ID patterns
-    type_patterns = {
-        "arms_up": ["arms_up", "fist_pump", "waving", "victory"],
-        "arms_crossed": ["arms_crossed", "cool"],
-        "praying": ["praying", "yoga"],
-        "shrug": ["shrug", "surprised"],
-        "selfie": ["selfie", "duck_face", "head_tilt", "tongue_out", "influencer"],
-        "waving": ["waving", "peace", "happy"],
-        "peace": ["peace", "waving", "happy"],
-        "flexing": ["flexing", "gymbro", "fist_pump"],
-        "thinking": ["think", "thinker", "hand_face", "chin_up"],
-        "hands_hips": ["hands_hips", "cool", "arms_crossed"],
-        "pointing": ["pointing", "looking_side"],
-        "neutral": ["monkey1", "monkey2", "monkey3", "monkey4", "monkey5"],
-    }
-    
-    patterns = type_patterns.get(pose_type, ["monkey"])
-    
-    for monkey in MONKEY_DATASET:
-        monkey_id = monkey.get("id", "").lower()
-        for pattern in patterns:
-            if pattern in monkey_id:
-                matches.append(monkey)
-                break
-    
-    return matches
+    return list(get_snapshot().index.monkeys_for(pose_type))
 
 
 def calculate_pose_distance(user_keypoints: np.ndarray, monkey_keypoints: np.ndarray) -> float:
@@ -172,7 +424,9 @@ def find_best_match(
     session_id: str,
     confidence: float,
     partial_body: bool,
-    expression: str = "neutral"  # NEW: face expression
+    expression: str = "neutral",  # NEW: face expression
+    session: Optional[SessionContext] = None,
+    timer: Optional[StageTimer] = None
 ) -> Dict:
     """
     Find best matching monkey using pose classification + face expression.
@@ -180,21 +434,29 @@ def find_best_match(
     Now combines:
     - Pose type (arms_up, selfie, etc.)
     - Face expression (smiling, surprised, neutral)
+    
+    Entropy is staged on `session` when the caller passes its request
+    context (the caller commits); otherwise it is written straight away.
+    Pose classification is timed as "classify" on `timer` if given.
     """
-    session = get_session(session_id)
+    context = session or SessionContext(session_id)
+    snapshot = get_snapshot()  # one catalogue version for the whole call
     mutations = []
     
     # Add entropy for low confidence or partial body
     if confidence < 0.6:
-        add_entropy(session_id, ENTROPY_LOW_CONFIDENCE, "low_confidence")
+        context.add_entropy(ENTROPY_LOW_CONFIDENCE, "low_confidence")
     if partial_body:
-        add_entropy(session_id, ENTROPY_PARTIAL_BODY, "partial_body")
+        context.add_entropy(ENTROPY_PARTIAL_BODY, "partial_body")
+    if session is None:
+        context.commit()
     
     # Classify user's pose
-    pose_type, debug_info = classify_pose(user_pose)
-    print(f"[MATCH] Classified pose as: {pose_type}")
-    print(f"[MATCH] Face expression: {expression}")
-    print(f"[MATCH] Debug: {debug_info}")
+    with timer.stage("classify") if timer else nullcontext():
+        pose_type, debug_info = classify_pose(user_pose)
+    trace = sampled(log)  # one draw, so a sampled request logs all its lines
+    if trace:
+        log.debug("Classified pose as %s, face expression %s, debug %s", pose_type, expression, debug_info)
     
     # DISABLED FOR TESTING - Entropy mutations
     # if should_apply_mutation(session_id, "swap_joints"):
@@ -202,54 +464,26 @@ def find_best_match(
     #     pose_type = random.choice(wrong_types)
     #     mutations.append(f"POSE_MISCLASSIFY:{pose_type}")
     
-    # Find matching monkeys by pose type
-    matching_monkeys = get_monkeys_by_pose_type(pose_type)
-    
-    if not matching_monkeys:
-        # Fallback to all monkeys
-        matching_monkeys = MONKEY_DATASET
-    
-    # Boost monkeys that match both pose AND expression
-    expression_patterns = {
-        "smiling": ["happy", "waving", "peace", "selfie", "cool"],
-        "surprised": ["surprised", "screaming", "shrug", "looking_up"],
-        "neutral": ["think", "thinker", "cool", "pointing", "sideeye"],
-    }
-    
-    expression_boost_patterns = expression_patterns.get(expression, [])
+    # Matching monkeys by pose type, each flagged for an expression boost
+    # (narrowed by the ANN index in approximate search mode)
+    candidates = snapshot.index.shortlist(user_pose, snapshot.index.lookup(pose_type, expression))
     
     # DISABLED FOR TESTING - Dataset shuffle
     # if should_apply_mutation(session_id, "dataset_shuffle"):
-    #     random.shuffle(matching_monkeys)
+    #     candidates = random.sample(candidates, len(candidates))
     #     mutations.append("DATASET_SHUFFLE")
     
-    # Score within matching set
+    # Score within matching set (vectorized over all candidates)
     best_score = 0.0
     best_match = None
     all_scores = []
     
-    for monkey in matching_monkeys:
-        monkey_id = monkey.get("id", "").lower()
-        monkey_pose = np.array(monkey.get("pose", []))
-        
-        if len(monkey_pose) == 0:
-            score = random.uniform(70, 85)
-        else:
-            distance = calculate_pose_distance(user_pose, monkey_pose)
-            # Convert distance to score (lower distance = higher score)
-            score = max(0, 100 - (distance * 30))
-        
-        # BOOST score if monkey matches expression  
-        for pattern in expression_boost_patterns:
-            if pattern in monkey_id:
-                score = min(100, score + 10)  # +10 bonus for expression match!
-                break
-        
-        all_scores.append((monkey["id"], round(score, 1)))
-        
-        if score > best_score or best_match is None:
-            best_score = score
-            best_match = monkey
+    if len(candidates):
+        scores = snapshot.index.score(user_pose, candidates)
+        best = int(np.argmax(scores))
+        best_score = float(scores[best])
+        best_match = candidates.monkeys[best]
+        all_scores = top_scores(candidates, scores)
     
     # DISABLED FOR TESTING - Score manipulation
     displayed_score = best_score
@@ -260,7 +494,7 @@ def find_best_match(
     
     # Fallback
     if best_match is None:
-        best_match = random.choice(MONKEY_DATASET) if MONKEY_DATASET else {
+        best_match = random.choice(snapshot.rows) if snapshot.rows else {
             "id": "unknown",
             "image": "/monkeys/monkey1.jpg",
             "species": "Mystery Primate",
@@ -268,8 +502,8 @@ def find_best_match(
         displayed_score = random.uniform(75, 90)
         best_score = displayed_score
     
-    print(f"[MATCH] Selected: {best_match['id']} with score {best_score:.1f}")
-    print(f"[MATCH] Top 3: {sorted(all_scores, key=lambda x: -x[1])[:3]}")
+    if trace:
+        log.debug("Selected %s with score %.1f, top 3: %s", best_match['id'], best_score, all_scores)
     
     return {
         "monkey": best_match,
@@ -277,16 +511,47 @@ def find_best_match(
         "displayed_score": round(displayed_score, 1),
         "mutations_applied": mutations,
         "pose_type": pose_type,
-        "all_scores": sorted(all_scores, key=lambda x: -x[1])[:3]
+        "all_scores": all_scores
     }
 
 
-def productive_failure(session_id: str, error_reason: str) -> Dict:
-    """Never return errors - always find a chaotic match."""
-    add_entropy(session_id, 0.2, f"productive_failure:{error_reason}")
+def preview_match(user_pose: np.ndarray, pose_type: Optional[str] = None) -> Optional[Dict]:
+    """
+    The monkey a pose would match right now, for live guidance (/stream).
     
-    if MONKEY_DATASET:
-        monkey = random.choice(MONKEY_DATASET)
+    Unlike find_best_match: no session entropy, no face expression, and
+    monkeys without a comparable pose (scored at random there) are left
+    out, so the same pose always previews the same monkey. Returns None
+    when no candidate has a comparable pose.
+    """
+    snapshot = get_snapshot()
+    if pose_type is None:
+        pose_type, _ = classify_pose(user_pose)
+    candidates = snapshot.index.shortlist(user_pose, snapshot.index.lookup(pose_type, None))
+    if not candidates.comparable.any():
+        return None
+    scores = np.where(candidates.comparable, snapshot.index.pose_scores(user_pose, candidates), -1.0)
+    best = int(np.argmax(scores))
+    monkey = candidates.monkeys[best]
+    return {
+        "monkey_id": monkey.get("id"),
+        "monkey_image": monkey.get("image"),
+        "species": monkey.get("species"),
+        "score": round(float(scores[best]), 1),
+        "dataset_version": snapshot.version,
+    }
+
+
+def productive_failure(session_id: str, error_reason: str, session: Optional[SessionContext] = None) -> Dict:
+    """Never return errors - always find a chaotic match."""
+    context = session or SessionContext(session_id)
+    context.add_entropy(0.2, f"productive_failure:{error_reason}")
+    if session is None:
+        context.commit()
+    
+    rows = get_snapshot().rows
+    if rows:
+        monkey = random.choice(rows)
     else:
         monkey = {
             "id": "chaos",
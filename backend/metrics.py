@@ -0,0 +1,242 @@
+"""
+Metrics and Logging
+
+Prometheus-style histograms and counters for the /analyze pipeline,
+rendered in the text exposition format by GET /metrics. There is no
+client library dependency: a metric is a dict of label values to counts
+behind a lock.
+
+Every stage a request goes through (read, decode, hash, pose, plan,
+face, face_wait, queue, classify, match, session) is recorded in its StageTimer and
+observed here once the response is built. Worker processes only measure
+their stages; the API process observes them. With `uvicorn --workers N`
+each worker serves its own /metrics, as usual for Prometheus.
+
+Logging goes through the standard logging module under the "monkey"
+logger. Per-request detail is DEBUG and sampled (MONKEY_LOG_SAMPLE_RATE).
+Call sites check sampled() first, so a disabled log line costs one
+comparison and no string formatting.
+"""
+
+import bisect
+import logging
+import random
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import config
+
+# Seconds; tuned for stages from ~0.1 ms (classify) to seconds (queueing)
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    """Monotonic count per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Gauge(Metric):
+    """Current value per label set, set just before rendering."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram per label set, like prometheus_client's."""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total:.6g}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "monkey_stage_seconds",
+    "Time spent in each /analyze pipeline stage",
+    ["endpoint", "stage"],
+)
+REQUEST_SECONDS = Histogram(
+    "monkey_request_seconds",
+    "End-to-end handler time",
+    ["endpoint"],
+)
+DETECTION_CACHE = Counter(
+    "monkey_detection_cache",
+    "Detection cache lookups by result",
+    ["result"],
+)
+REJECTED_REQUESTS = Counter(
+    "monkey_rejected_requests",
+    "Requests refused before detection",
+    ["reason"],
+)
+POOL_IN_FLIGHT = Gauge(
+    "monkey_pool_in_flight",
+    "Detection jobs running or queued",
+)
+SESSIONS_RESIDENT = Gauge(
+    "monkey_sessions_resident",
+    "Sessions held by the session store (where it can tell cheaply)",
+)
+STREAM_FRAMES = Counter(
+    "monkey_stream_frames",
+    "Frames received on /stream by outcome (changed, unchanged, dropped, rejected)",
+    ["result"],
+)
+STREAMS_OPEN = Gauge(
+    "monkey_streams_open",
+    "Open /stream connections",
+)
+
+REGISTRY: List[Metric] = [
+    STAGE_SECONDS, REQUEST_SECONDS, DETECTION_CACHE, REJECTED_REQUESTS, POOL_IN_FLIGHT, SESSIONS_RESIDENT,
+    STREAM_FRAMES, STREAMS_OPEN,
+]
+
+
+def observe_stages(endpoint: str, stages: Dict[str, float], total_ms: float):
+    """Record a request's StageTimer.stages (milliseconds) and its total."""
+    for stage, elapsed_ms in stages.items():
+        STAGE_SECONDS.observe(elapsed_ms / 1000, endpoint=endpoint, stage=stage)
+    REQUEST_SECONDS.observe(total_ms / 1000, endpoint=endpoint)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ============================================================
+# Logging
+# ============================================================
+
+_sampler = random.Random()  # own stream: matching's random draws stay unchanged
+
+
+def setup_logging():
+    """Configure the "monkey" loggers from MONKEY_LOG_LEVEL (idempotent)."""
+    logger = logging.getLogger("monkey")
+    logger.setLevel(config.LOG_LEVEL.upper())
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"monkey.{name}")
+
+
+def sampled(logger: logging.Logger, level: int = logging.DEBUG) -> bool:
+    """
+    Whether to emit a per-request log line: the level must be enabled and
+    the line must win the MONKEY_LOG_SAMPLE_RATE draw. Check this before
+    building the message.
+    """
+    if not logger.isEnabledFor(level):
+        return False
+    rate = config.LOG_SAMPLE_RATE
+    return rate >= 1.0 or _sampler.random() < rate
@@ -0,0 +1,299 @@
+"""
+Detection Pipeline
+
+The blocking half of /analyze: decode the upload once, then run face and
+pose detection on the shared frame. Runs inside an InferencePool worker,
+so everything here must be picklable for the process-pool mode.
+
+MONKEY_DETECTION_MODE picks how the two detectors share a request:
+
+- "sequential" (default): pose first, then face on the pose's head ROI,
+  or not at all when the face plan says it can't matter.
+- "concurrent": face runs on the full frame in a separate thread (its
+  own detector instance) while pose runs in the worker, and the two are
+  joined before matching. Lower latency for a single request on an idle
+  multi-core host; more CPU per request, since neither the ROI nor the
+  face plan can be used before the pose is known.
+
+OpenCV and MediaPipe are imported inside the functions, on first use in
+the worker: the API process imports this module for the job functions
+but (with a process pool) never runs them.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+import multiprocessing.util
+import os
+import threading
+import time
+
+import numpy as np
+
+import config
+from detection_cache import CACHEABLE_ERRORS, DetectionCache, perceptual_hash
+from metrics import get_logger, setup_logging
+from pose_types import classify_pose
+from timing import StageTimer
+
+log = get_logger("pipeline")
+
+# Per worker process (shared by all threads of a thread pool)
+_cache = DetectionCache(config.DETECTION_CACHE_SIZE, config.DETECTION_CACHE_TTL)
+
+# Side of the blank frame each worker runs through both models at startup
+WARMUP_FRAME_SIZE = 256
+
+# Face detection threads for the concurrent mode, per worker process
+_face_executor: Optional[ThreadPoolExecutor] = None
+_face_executor_lock = threading.Lock()
+
+
+@dataclass
+class Detection:
+    """Everything the API needs from the detectors for one image."""
+    keypoints: Optional[np.ndarray]
+    confidence: float
+    pose_debug: Dict
+    expression: str = "unknown"
+    face_confidence: float = 0.0
+    face_debug: Dict = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    cache_hit: bool = False
+    skipped: Dict[str, str] = field(default_factory=dict)  # stage -> why it didn't run
+
+
+def load_models():
+    """
+    Create this worker's pose landmarker and face detector.
+    
+    Used as the pool initializer, so models are built when a worker starts
+    rather than on the first request it serves. Never raises: a missing
+    model must not break the pool, detection reports it per request instead.
+    """
+    from face_detection import get_face_detector
+    from pose_detection import get_pose_landmarker
+
+    setup_logging()  # no-op in the API process; configures spawned workers
+    try:
+        get_pose_landmarker()
+    except Exception as e:
+        log.warning("Failed to create pose landmarker: %s", e)
+    get_face_detector()
+
+
+def face_executor() -> ThreadPoolExecutor:
+    """
+    This process's face detection threads (concurrent mode), created on
+    first use. One thread per inference worker it serves, each with its
+    own face detector, so a request never waits on another's face job.
+    """
+    global _face_executor
+    with _face_executor_lock:
+        if _face_executor is None:
+            from face_detection import get_face_detector
+
+            _face_executor = ThreadPoolExecutor(
+                max_workers=config.POOL_WORKERS if config.POOL_KIND == "thread" else 1,
+                thread_name_prefix="face",
+                initializer=get_face_detector,
+            )
+            # MediaPipe can only close the face threads' detectors before
+            # concurrent.futures shuts down at interpreter exit. The API
+            # process calls shutdown_face_executor() from its lifespan; a
+            # spawned pool worker never gets there, but runs its finalizers
+            # before joining threads (atexit handlers would be too late)
+            multiprocessing.util.Finalize(None, shutdown_face_executor, exitpriority=10)
+        return _face_executor
+
+
+def shutdown_face_executor():
+    """Stop the face detection threads, if they were started."""
+    global _face_executor
+    with _face_executor_lock:
+        executor, _face_executor = _face_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def worker_identity() -> str:
+    """Which worker ran this call, e.g. "pid 123 / inference_0"."""
+    return f"pid {os.getpid()} / {threading.current_thread().name}"
+
+
+def warm_up_worker() -> dict:
+    """
+    Startup probe run once on every worker: push a blank frame through
+    both models, so MediaPipe's first-inference setup (delegates, kernel
+    caches) is paid before the worker is reported ready. The cache is
+    bypassed. Reports whether each model actually ran.
+    """
+    from face_detection import classify_face_expression
+    from frame import frame_from_rgb
+    from pose_detection import extract_pose
+
+    start = time.perf_counter()
+    frame = frame_from_rgb(np.zeros((WARMUP_FRAME_SIZE, WARMUP_FRAME_SIZE, 3), dtype=np.uint8))
+    if config.DETECTION_MODE == "concurrent":
+        face_job = face_executor().submit(classify_face_expression, frame.mp_image)
+        _, _, pose_debug = extract_pose(frame.mp_image)
+        _, _, face_debug = face_job.result()
+    else:
+        _, _, face_debug = classify_face_expression(frame.mp_image)
+        _, _, pose_debug = extract_pose(frame.mp_image)
+    # Any answer about the image (even "nothing found") means the model ran
+    model_errors = {
+        model: debug["error"]
+        for model, debug in (("pose", pose_debug), ("face", face_debug))
+        if debug.get("error") not in CACHEABLE_ERRORS
+    }
+    return {
+        "worker": worker_identity(),
+        "model_errors": model_errors,
+        "warmup_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def _from_cache(entry: tuple, timings: Dict[str, float]) -> Detection:
+    keypoints, confidence, pose_debug, expression, face_confidence, face_debug = entry
+    return Detection(
+        keypoints=None if keypoints is None else keypoints.copy(),
+        confidence=confidence,
+        pose_debug=dict(pose_debug),
+        expression=expression,
+        face_confidence=face_confidence,
+        face_debug=dict(face_debug),
+        timings=timings,
+        cache_hit=True,
+        skipped=_skipped_stages(face_debug),
+    )
+
+
+def _skipped_stages(face_debug: Dict) -> Dict[str, str]:
+    return {"face": face_debug["skipped"]} if "skipped" in face_debug else {}
+
+
+def face_skip_reason(keypoints: Optional[np.ndarray], face_plan: Optional[frozenset]) -> Optional[str]:
+    """
+    Why face detection can't change this request's outcome, or None if it
+    must run. `face_plan` is the catalogue's PoseIndex.expression_blind
+    (pose types whose candidates get no expression boost); None disables
+    skipping. Without a pose the request is a productive failure whatever
+    the face says.
+    """
+    if face_plan is None:
+        return None
+    if keypoints is None:
+        return "no_pose"
+    if not face_plan:
+        return None
+    pose_type, _ = classify_pose(keypoints)
+    return f"expression_blind:{pose_type}" if pose_type in face_plan else None
+
+
+def detect_face(frame, keypoints: Optional[np.ndarray]) -> Tuple[str, float, Dict]:
+    """
+    Face expression for `frame`, searched around the pose's head when
+    `keypoints` are given and over the whole frame otherwise. Errors are
+    reported in the debug dict, never raised.
+    """
+    from face_detection import classify_face_expression, classify_face_expression_in_roi, head_roi
+
+    try:
+        roi = head_roi(keypoints, frame.width, frame.height)
+        if roi is not None:
+            return classify_face_expression_in_roi(frame.rgb, roi)
+        return classify_face_expression(frame.mp_image)
+    except Exception as e:
+        return "unknown", 0.0, {"error": str(e)}
+
+
+def _timed_face(frame) -> Tuple[Tuple[str, float, Dict], float]:
+    start = time.perf_counter()
+    result = detect_face(frame, None)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run_detection(image_bytes: bytes, face_plan: Optional[frozenset] = None) -> Detection:
+    """
+    Decode once and run both detectors (or reuse a cached result), timing
+    each stage. Pose runs first: its head landmarks narrow face detection
+    to a small ROI, and only if there is no pose is the full frame searched.
+    With a `face_plan`, face detection is skipped when it can't affect the
+    match (see face_skip_reason). In the concurrent detection mode both
+    run at once on the full frame and `face_plan` is not used.
+    """
+    from frame import decode_frame
+    from pose_detection import extract_pose
+
+    timer = StageTimer()
+
+    try:
+        with timer.stage("decode"):
+            frame = decode_frame(image_bytes)
+    except Exception:
+        frame = None
+
+    if frame is None:
+        return Detection(
+            keypoints=None,
+            confidence=0.0,
+            pose_debug={"error": "Could not decode image", "partial": False},
+            face_debug={"error": "Could not decode image"},
+            timings=timer.stages,
+        )
+
+    # Same (or nearly the same) picture seen recently?
+    cache_key = None
+    if _cache.enabled:
+        with timer.stage("hash"):
+            cache_key = (
+                frame.width, frame.height, perceptual_hash(frame.rgb, config.DETECTION_CACHE_HASH_SIZE), face_plan,
+            )
+        cached = _cache.get(cache_key)
+        if cached is not None:
+            return _from_cache(cached, timer.stages)
+
+    if config.DETECTION_MODE == "concurrent":
+        # Face on the full frame in its own thread, pose here; join both
+        face_job = face_executor().submit(_timed_face, frame)
+        try:
+            with timer.stage("pose"):
+                keypoints, confidence, pose_debug = extract_pose(frame.mp_image)
+        finally:
+            # "face_wait" is how long face detection outlasted pose
+            with timer.stage("face_wait"):
+                (expression, face_confidence, face_debug), face_ms = face_job.result()
+        timer.add("face", face_ms)
+    else:
+        # Extract pose
+        with timer.stage("pose"):
+            keypoints, confidence, pose_debug = extract_pose(frame.mp_image)
+
+        # Would the face expression change the match at all?
+        skip_reason = None
+        if face_plan is not None:
+            with timer.stage("plan"):
+                skip_reason = face_skip_reason(keypoints, face_plan)
+
+        # Detect face expression, around the pose's head if there is one
+        if skip_reason is not None:
+            expression, face_confidence, face_debug = "unknown", 0.0, {"skipped": skip_reason}
+        else:
+            with timer.stage("face"):
+                expression, face_confidence, face_debug = detect_face(frame, keypoints)
+
+    if cache_key is not None and pose_debug.get("error") in CACHEABLE_ERRORS \
+            and face_debug.get("error") in CACHEABLE_ERRORS:
+        _cache.put(cache_key, (keypoints, confidence, pose_debug, expression, face_confidence, face_debug))
+
+    return Detection(
+        keypoints=keypoints,
+        confidence=confidence,
+        pose_debug=pose_debug,
+        expression=expression,
+        face_confidence=face_confidence,
+        face_debug=face_debug,
+        timings=timer.stages,
+        skipped=_skipped_stages(face_debug),
+    )
@@ -9,13 +9,17 @@ Note: MediaPipe 0.10.30+ uses the Tasks API instead of solutions.
 
 import cv2
 import numpy as np
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Union
 import io
+import threading
 from PIL import Image
 import mediapipe as mp
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
 
+import config
+from frame import decode_frame, frame_from_rgb
+
 # Key landmark indices for matching
 UPPER_BODY_LANDMARKS = [0, 11, 12, 13, 14, 15, 16]  # nose, shoulders, elbows, wrists
 LOWER_BODY_LANDMARKS = [23, 24, 25, 26, 27, 28]     # hips, knees, ankles
@@ -28,25 +32,40 @@ LANDMARK_NAMES = {
     27: "left_ankle", 28: "right_ankle"
 }
 
-# Global pose landmarker (initialized lazily)
-_pose_landmarker = None
+# Local model file (python download_model.py, or MONKEY_POSE_MODEL_PATH)
+MODEL_PATH = config.POSE_MODEL_PATH
+
+# One landmarker per worker thread - a MediaPipe graph must not be shared
+# across concurrent detect() calls. In the process pool each process has a
+# single worker thread, so this is also one instance per process.
+_local = threading.local()
+
+
+def create_pose_landmarker(video: bool = False):
+    """
+    Build a new pose landmarker: IMAGE mode, or VIDEO mode for a frame
+    stream (tracks the pose between frames; see extract_pose_from_video).
+    """
+    # Create options for pose detection
+    base_options = python.BaseOptions(
+        model_asset_path=MODEL_PATH
+    )
+    options = vision.PoseLandmarkerOptions(
+        base_options=base_options,
+        running_mode=vision.RunningMode.VIDEO if video else vision.RunningMode.IMAGE,
+        min_pose_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+    return vision.PoseLandmarker.create_from_options(options)
+
 
 def get_pose_landmarker():
-    """Get or create pose landmarker instance."""
-    global _pose_landmarker
-    if _pose_landmarker is None:
-        # Create options for pose detection
-        base_options = python.BaseOptions(
-            model_asset_path="pose_landmarker_lite.task"
-        )
-        options = vision.PoseLandmarkerOptions(
-            base_options=base_options,
-            running_mode=vision.RunningMode.IMAGE,
-            min_pose_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
-        _pose_landmarker = vision.PoseLandmarker.create_from_options(options)
-    return _pose_landmarker
+    """Get this thread's pose landmarker, creating it on first use."""
+    landmarker = getattr(_local, "pose_landmarker", None)
+    if landmarker is None:
+        landmarker = create_pose_landmarker()
+        _local.pose_landmarker = landmarker
+    return landmarker
 
 
 def bytes_to_image(image_bytes: bytes) -> np.ndarray:
@@ -56,55 +75,64 @@ def bytes_to_image(image_bytes: bytes) -> np.ndarray:
     return np.array(rgb_image)
 
 
-def extract_pose(image: np.ndarray) -> Tuple[Optional[np.ndarray], float, dict]:
+def pose_from_result(results) -> Tuple[Optional[np.ndarray], float, dict]:
+    """Keypoints, confidence and debug info from a PoseLandmarkerResult."""
+    if not results.pose_landmarks or len(results.pose_landmarks) == 0:
+        return None, 0.0, {"error": "No pose detected", "partial": False}
+    
+    # Get first detected pose
+    pose_landmarks = results.pose_landmarks[0]
+    
+    # Extract keypoints
+    keypoints = []
+    visibilities = []
+    
+    for landmark in pose_landmarks:
+        keypoints.append([landmark.x, landmark.y])
+        visibilities.append(landmark.visibility if hasattr(landmark, 'visibility') else 0.5)
+    
+    keypoints = np.array(keypoints)
+    avg_confidence = np.mean(visibilities)
+    
+    # Check for partial body
+    upper_visibility = np.mean([visibilities[i] for i in UPPER_BODY_LANDMARKS if i < len(visibilities)])
+    lower_visibility = np.mean([visibilities[i] for i in LOWER_BODY_LANDMARKS if i < len(visibilities)])
+    
+    debug_info = {
+        "total_landmarks": len(keypoints),
+        "avg_confidence": round(avg_confidence, 3),
+        "upper_body_confidence": round(upper_visibility, 3),
+        "lower_body_confidence": round(lower_visibility, 3),
+        "partial": lower_visibility < 0.3
+    }
+    
+    return keypoints, avg_confidence, debug_info
+
+
+def extract_pose(image: Union[np.ndarray, mp.Image]) -> Tuple[Optional[np.ndarray], float, dict]:
     """
     Extract pose keypoints from image using MediaPipe Tasks API.
     
+    Accepts an RGB array or an already-wrapped mp.Image (e.g. Frame.mp_image),
+    in which case the pixels are used as-is without another copy.
+    
     Returns:
         keypoints: Array of (x, y) normalized coordinates, shape (33, 2)
         confidence: Average visibility score (0-1)
         debug_info: Detection metadata
     """
     try:
-        # Convert to MediaPipe Image
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+        # Convert to MediaPipe Image (unless the caller already shares one)
+        if isinstance(image, mp.Image):
+            mp_image = image
+        else:
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
         
         # Get pose landmarker
         landmarker = get_pose_landmarker()
         
         # Detect pose
-        results = landmarker.detect(mp_image)
-        
-        if not results.pose_landmarks or len(results.pose_landmarks) == 0:
-            return None, 0.0, {"error": "No pose detected", "partial": False}
-        
-        # Get first detected pose
-        pose_landmarks = results.pose_landmarks[0]
-        
-        # Extract keypoints
-        keypoints = []
-        visibilities = []
-        
-        for landmark in pose_landmarks:
-            keypoints.append([landmark.x, landmark.y])
-            visibilities.append(landmark.visibility if hasattr(landmark, 'visibility') else 0.5)
-        
-        keypoints = np.array(keypoints)
-        avg_confidence = np.mean(visibilities)
-        
-        # Check for partial body
-        upper_visibility = np.mean([visibilities[i] for i in UPPER_BODY_LANDMARKS if i < len(visibilities)])
-        lower_visibility = np.mean([visibilities[i] for i in LOWER_BODY_LANDMARKS if i < len(visibilities)])
-        
-        debug_info = {
-            "total_landmarks": len(keypoints),
-            "avg_confidence": round(avg_confidence, 3),
-            "upper_body_confidence": round(upper_visibility, 3),
-            "lower_body_confidence": round(lower_visibility, 3),
-            "partial": lower_visibility < 0.3
-        }
-        
-        return keypoints, avg_confidence, debug_info
+        return pose_from_result(landmarker.detect(mp_image))
         
     except FileNotFoundError:
         # Model file not found - fall back to random matching
@@ -113,11 +141,29 @@ def extract_pose(image: np.ndarray) -> Tuple[Optional[np.ndarray], float, dict]:
         return None, 0.0, {"error": str(e), "partial": False}
 
 
+def extract_pose_from_video(landmarker, image: mp.Image, timestamp_ms: int) -> Tuple[Optional[np.ndarray], float, dict]:
+    """
+    Extract the pose from one frame of a stream. `landmarker` is the
+    stream's own VIDEO-mode landmarker (create_pose_landmarker(video=True))
+    and `timestamp_ms` must increase with every call: MediaPipe tracks the
+    pose from the previous frame and only re-runs person detection when
+    tracking is lost.
+    
+    Returns the same (keypoints, confidence, debug_info) as extract_pose.
+    """
+    try:
+        return pose_from_result(landmarker.detect_for_video(image, timestamp_ms))
+    except Exception as e:
+        return None, 0.0, {"error": str(e), "partial": False}
+
+
 def extract_pose_from_bytes(image_bytes: bytes) -> Tuple[Optional[np.ndarray], float, dict]:
     """Extract pose from image bytes (for API uploads)."""
     try:
-        image = bytes_to_image(image_bytes)
-        return extract_pose(image)
+        frame = decode_frame(image_bytes)
+        if frame is None:
+            return None, 0.0, {"error": "Could not decode image", "partial": False}
+        return extract_pose(frame.mp_image)
     except Exception as e:
         return None, 0.0, {"error": str(e), "partial": False}
 
@@ -128,7 +174,7 @@ def extract_pose_from_file(filepath: str) -> Tuple[Optional[np.ndarray], float,
         image = cv2.imread(filepath)
         if image is None:
             return None, 0.0, {"error": f"Could not read file: {filepath}"}
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        return extract_pose(image_rgb)
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+        return extract_pose(frame_from_rgb(image).mp_image)
     except Exception as e:
         return None, 0.0, {"error": str(e)}
@@ -0,0 +1,100 @@
+"""
+Pose Type Classification
+
+Buckets a user's 33 pose keypoints into a pose type (arms_up, selfie, ...)
+by arm positions. Only needs numpy, so detection workers can classify
+without importing the matcher (and its session store).
+"""
+
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+# Pose type categories based on arm positions
+def classify_pose(keypoints: np.ndarray) -> Tuple[str, Dict]:
+    """
+    Classify a pose into a category based on arm positions.
+    Returns pose type and debug info.
+    """
+    if keypoints is None or len(keypoints) < 17:
+        return "neutral", {}
+    
+    keypoints = np.array(keypoints)
+    
+    # Get key points
+    nose_y = keypoints[0][1]
+    left_shoulder = keypoints[11]
+    right_shoulder = keypoints[12]
+    left_elbow = keypoints[13]
+    right_elbow = keypoints[14]
+    left_wrist = keypoints[15]
+    right_wrist = keypoints[16]
+    
+    shoulder_y = (left_shoulder[1] + right_shoulder[1]) / 2
+    shoulder_center_x = (left_shoulder[0] + right_shoulder[0]) / 2
+    
+    # Calculate arm positions relative to shoulders
+    left_wrist_rel_y = left_wrist[1] - shoulder_y  # negative = above
+    right_wrist_rel_y = right_wrist[1] - shoulder_y
+    
+    left_wrist_rel_x = left_wrist[0] - shoulder_center_x  # positive = left
+    right_wrist_rel_x = right_wrist[0] - shoulder_center_x  # negative = right
+    
+    debug = {
+        "left_wrist_y": round(left_wrist_rel_y, 3),
+        "right_wrist_y": round(right_wrist_rel_y, 3),
+        "left_wrist_x": round(left_wrist_rel_x, 3),
+        "right_wrist_x": round(right_wrist_rel_x, 3),
+    }
+    
+    # Classification rules (check from most specific to least)
+    
+    # Both arms raised high (y < -0.1 means above shoulders)
+    if left_wrist_rel_y < -0.15 and right_wrist_rel_y < -0.15:
+        return "arms_up", debug
+    
+    # Both hands near center/chest (crossed or praying)
+    if abs(left_wrist_rel_x - right_wrist_rel_x) < 0.15 and abs(left_wrist_rel_y) < 0.15:
+        if left_wrist_rel_y < 0:
+            return "praying", debug
+        return "arms_crossed", debug
+    
+    # Shrug - both elbows out, wrists up
+    if left_wrist_rel_y < 0 and right_wrist_rel_y < 0 and abs(left_wrist_rel_x) > 0.15:
+        return "shrug", debug
+    
+    # Left arm only raised (selfie, waving)
+    if left_wrist_rel_y < -0.1 and right_wrist_rel_y > 0:
+        if left_wrist_rel_x > 0.2:  # arm extended out
+            return "selfie", debug
+        return "waving", debug
+    
+    # Right arm only raised (mirror selfie, peace)
+    if right_wrist_rel_y < -0.1 and left_wrist_rel_y > 0:
+        if right_wrist_rel_x < -0.2:
+            return "selfie", debug
+        return "peace", debug
+    
+    # Arms flexed (elbows up, wrists near shoulders)
+    left_elbow_rel_y = left_elbow[1] - shoulder_y
+    right_elbow_rel_y = right_elbow[1] - shoulder_y
+    if left_elbow_rel_y < 0 and right_elbow_rel_y < 0:
+        return "flexing", debug
+    
+    # Hand near face (thinking)
+    if (left_wrist_rel_y < 0 and abs(left_wrist_rel_x) < 0.1) or \
+       (right_wrist_rel_y < 0 and abs(right_wrist_rel_x) < 0.1):
+        if left_wrist[1] < nose_y + 0.1 or right_wrist[1] < nose_y + 0.1:
+            return "thinking", debug
+    
+    # Hands on hips (wrists near hip level, elbows out)
+    if left_wrist_rel_y > 0.2 and right_wrist_rel_y > 0.2:
+        if abs(left_wrist_rel_x) > 0.1 and abs(right_wrist_rel_x) > 0.1:
+            return "hands_hips", debug
+    
+    # Pointing (one arm extended forward)
+    if abs(left_wrist_rel_x) > 0.25 or abs(right_wrist_rel_x) > 0.25:
+        return "pointing", debug
+    
+    return "neutral", debug
@@ -0,0 +1,489 @@
+"""
+Session Storage Backends
+
+Where per-session entropy lives. With one API process the in-memory
+store is enough; with `uvicorn --workers N` or several hosts behind a load
+balancer, each worker would see its own copy of a session, so entropy
+would jump around and the collapse never triggers consistently. The
+SQLite store shares sessions between the workers of one host, the Redis
+store between hosts.
+
+Every change is expressed as a list of ops that a store applies
+atomically in one call (one round trip for Redis, one transaction for
+SQLite):
+
+    ["entropy", amount, reason]   add entropy and log it
+    ["attempt"]                   count an attempt (+ retry entropy, collapse)
+    ["reset"]                     back to zero entropy
+
+apply_ops() is the reference implementation; the Redis Lua script mirrors
+it so the rules run server-side.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, NamedTuple, Sequence
+
+import config
+
+# Entropy is rounded to this many decimals after every op, so all
+# backends (including Lua's JSON encoder) agree on threshold comparisons
+ENTROPY_DECIMALS = 6
+COLLAPSE_MESSAGE = "⚠️ SYSTEM COLLAPSE TRIGGERED ⚠️"
+RESET_MESSAGE = "SESSION_RESET"
+
+
+def _mutation_log(entries: Sequence[str] = ()) -> Deque[str]:
+    # Only the newest few are ever reported, so older entries just fall off
+    return deque(entries, maxlen=max(1, config.SESSION_MUTATION_HISTORY))
+
+
+@dataclass
+class SessionState:
+    entropy: float = 0.0
+    attempts: int = 0
+    mutations: Deque[str] = field(default_factory=_mutation_log)
+    created_at: float = field(default_factory=time.time)
+    collapsed: bool = False
+    last_seen: float = field(default_factory=time.time)
+
+    def copy(self) -> "SessionState":
+        return SessionState(
+            self.entropy, self.attempts, _mutation_log(self.mutations),
+            self.created_at, self.collapsed, self.last_seen,
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "entropy": self.entropy,
+            "attempts": self.attempts,
+            "mutations": list(self.mutations),
+            "created_at": self.created_at,
+            "collapsed": self.collapsed,
+            "last_seen": self.last_seen,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SessionState":
+        return cls(
+            entropy=float(data.get("entropy", 0.0)),
+            attempts=int(data.get("attempts", 0)),
+            mutations=_mutation_log(data.get("mutations") or ()),
+            created_at=float(data.get("created_at", time.time())),
+            collapsed=bool(data.get("collapsed", False)),
+            last_seen=float(data.get("last_seen", time.time())),
+        )
+
+
+class SessionRules(NamedTuple):
+    """The entropy rules a store needs to apply ops (see entropy.py)."""
+    retry_entropy: float
+    collapse_attempts: int
+    collapse_entropy: float
+    max_entropy: float
+
+
+def _add_entropy(state: SessionState, amount: float, reason: str, rules: SessionRules):
+    old_entropy = state.entropy
+    state.entropy = round(min(rules.max_entropy, state.entropy + amount), ENTROPY_DECIMALS)
+    state.mutations.append(f"[{reason}] +{amount:.2f} entropy ({old_entropy:.2f} → {state.entropy:.2f})")
+
+
+def apply_ops(state: SessionState, ops: List[List], rules: SessionRules) -> SessionState:
+    """Apply `ops` to `state` in place, in order."""
+    for op in ops:
+        kind = op[0]
+        if kind == "entropy":
+            _add_entropy(state, float(op[1]), str(op[2]), rules)
+        elif kind == "attempt":
+            state.attempts += 1
+            _add_entropy(state, rules.retry_entropy, "retry_attempt", rules)
+            # Check for collapse event
+            if state.attempts >= rules.collapse_attempts and not state.collapsed:
+                state.collapsed = True
+                _add_entropy(state, rules.collapse_entropy, "COLLAPSE_EVENT", rules)
+                state.mutations.append(COLLAPSE_MESSAGE)
+        elif kind == "reset":
+            state.entropy = 0.0
+            state.attempts = 0
+            state.collapsed = False
+            state.mutations.clear()
+            state.mutations.append(RESET_MESSAGE)
+        else:
+            raise ValueError(f"Unknown session op: {kind!r}")
+    return state
+
+
+def new_session_id() -> str:
+    return str(uuid.uuid4())[:8]
+
+
+class SessionStore(ABC):
+    """
+    Storage for SessionState.
+    
+    load() and apply() create unknown sessions on the fly, like the
+    original dict did for any X-Session-ID. Both return a copy: mutating
+    it changes nothing, all changes go through apply().
+    """
+
+    def __init__(self, rules: SessionRules):
+        self.rules = rules
+
+    def create(self) -> str:
+        """Create a fresh session and return its id."""
+        session_id = new_session_id()
+        self.apply(session_id, [])
+        return session_id
+
+    @abstractmethod
+    def load(self, session_id: str) -> SessionState:
+        """Current state of a session (created if unknown or expired)."""
+
+    @abstractmethod
+    def apply(self, session_id: str, ops: List[List]) -> SessionState:
+        """Atomically apply `ops` and return the resulting state."""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Backend name plus whatever counters it can report cheaply."""
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Bounded in-process session storage.
+    
+    Sessions idle for longer than `ttl` seconds expire, and once
+    `max_sessions` are resident the least recently used one is evicted.
+    Both happen lazily on access, so there is no sweeper thread. Unknown ids
+    (including made-up X-Session-ID headers) still get a fresh session, but
+    they can no longer grow memory without bound.
+    """
+
+    def __init__(self, rules: SessionRules, max_sessions: int = 10000, ttl: float = 3600):
+        super().__init__(rules)
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted_lru = 0
+        self.expired = 0
+
+    def load(self, session_id: str) -> SessionState:
+        with self._lock:
+            return self._get(session_id).copy()
+
+    def apply(self, session_id: str, ops: List[List]) -> SessionState:
+        with self._lock:
+            return apply_ops(self._get(session_id), ops, self.rules).copy()
+
+    def _get(self, session_id: str) -> SessionState:
+        now = time.time()
+        self._expire(now)
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._insert(session_id, now)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_seen = now
+        return session
+
+    def _insert(self, session_id: str, now: float) -> SessionState:
+        while len(self._sessions) >= self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted_lru += 1
+        session = SessionState(created_at=now, last_seen=now)
+        self._sessions[session_id] = session
+        self.created += 1
+        return session
+
+    def _expire(self, now: float):
+        # Oldest access first, so stop at the first live session
+        if self.ttl <= 0:
+            return
+        cutoff = now - self.ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_seen >= cutoff:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "resident": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl,
+            "created": self.created,
+            "evicted_lru": self.evicted_lru,
+            "expired": self.expired,
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite database in WAL mode, shared by every API worker
+    process on one host.
+    
+    Each apply() is a single BEGIN IMMEDIATE transaction, which takes the
+    database write lock up front, so concurrent read-modify-writes from
+    different workers serialize instead of losing updates. Expired and
+    over-limit sessions are pruned every `prune_every` writes.
+    """
+
+    def __init__(
+        self,
+        rules: SessionRules,
+        path: str,
+        max_sessions: int = 10000,
+        ttl: float = 3600,
+        prune_every: int = 256,
+    ):
+        super().__init__(rules)
+        self.path = path
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self.prune_every = max(1, prune_every)
+        self._local = threading.local()
+        self._writes = 0
+        self.evicted_lru = 0
+        self.expired = 0
+
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY, state TEXT NOT NULL, last_seen REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _read(self, db: sqlite3.Connection, session_id: str, now: float) -> SessionState:
+        row = db.execute("SELECT state, last_seen FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or (self.ttl > 0 and row[1] < now - self.ttl):
+            return SessionState(created_at=now, last_seen=now)
+        return SessionState.from_dict(json.loads(row[0]))
+
+    def load(self, session_id: str) -> SessionState:
+        return self.apply(session_id, [])
+
+    def apply(self, session_id: str, ops: List[List]) -> SessionState:
+        now = time.time()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            state = apply_ops(self._read(db, session_id, now), ops, self.rules)
+            state.last_seen = now
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, last_seen) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state.to_dict()), now),
+            )
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune(db, now)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return state
+
+    def _prune(self, db: sqlite3.Connection, now: float):
+        if self.ttl > 0:
+            self.expired += db.execute(
+                "DELETE FROM sessions WHERE last_seen < ?", (now - self.ttl,)
+            ).rowcount
+        overflow = db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+        if overflow > 0:
+            self.evicted_lru += db.execute(
+                "DELETE FROM sessions WHERE id IN"
+                " (SELECT id FROM sessions ORDER BY last_seen LIMIT ?)",
+                (overflow,),
+            ).rowcount
+
+    def stats(self) -> dict:
+        resident = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "resident": resident,
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl,
+            # Counters are per worker process
+            "evicted_lru": self.evicted_lru,
+            "expired": self.expired,
+        }
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+# KEYS[1] = session key
+# ARGV = ops JSON, now, ttl, history, retry, collapse attempts,
+#        collapse entropy, max entropy, entropy decimals,
+#        collapse message, reset message
+# Mirrors apply_ops(); returns the new state as JSON.
+_REDIS_APPLY = """
+local raw = redis.call('GET', KEYS[1])
+local now = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local history = tonumber(ARGV[4])
+local retry = tonumber(ARGV[5])
+local collapse_attempts = tonumber(ARGV[6])
+local collapse_entropy = tonumber(ARGV[7])
+local max_entropy = tonumber(ARGV[8])
+local scale = 10 ^ tonumber(ARGV[9])
+
+local state
+if raw then
+    state = cjson.decode(raw)
+else
+    state = {entropy = 0, attempts = 0, mutations = {}, created_at = now, collapsed = false}
+end
+
+local function log(entry)
+    table.insert(state.mutations, entry)
+    while #state.mutations > history do
+        table.remove(state.mutations, 1)
+    end
+end
+
+local function add_entropy(amount, reason)
+    local old = state.entropy
+    local new = math.min(max_entropy, old + amount)
+    state.entropy = math.floor(new * scale + 0.5) / scale
+    log(string.format('[%s] +%.2f entropy (%.2f \\226\\134\\146 %.2f)', reason, amount, old, state.entropy))
+end
+
+for _, op in ipairs(cjson.decode(ARGV[1])) do
+    local kind = op[1]
+    if kind == 'entropy' then
+        add_entropy(tonumber(op[2]), tostring(op[3]))
+    elseif kind == 'attempt' then
+        state.attempts = state.attempts + 1
+        add_entropy(retry, 'retry_attempt')
+        if state.attempts >= collapse_attempts and not state.collapsed then
+            state.collapsed = true
+            add_entropy(collapse_entropy, 'COLLAPSE_EVENT')
+            log(ARGV[10])
+        end
+    elseif kind == 'reset' then
+        state.entropy = 0
+        state.attempts = 0
+        state.collapsed = false
+        state.mutations = {}
+        log(ARGV[11])
+    else
+        return redis.error_reply('unknown session op: ' .. tostring(kind))
+    end
+end
+
+state.last_seen = now
+-- cjson turns an empty table into {}; keep "mutations" a list
+local encoded = cjson.encode(state)
+if #state.mutations == 0 then
+    encoded = string.gsub(encoded, '"mutations":{}', '"mutations":[]')
+end
+if ttl > 0 then
+    redis.call('SET', KEYS[1], encoded, 'EX', ttl)
+else
+    redis.call('SET', KEYS[1], encoded)
+end
+return encoded
+"""
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions in Redis (or anything speaking its protocol), shared across
+    hosts.
+    
+    The entropy rules run server-side in a Lua script, so every apply() is
+    one atomic EVALSHA round trip with no client-side locking. Sessions
+    expire through Redis key TTLs; cap total size with the server's
+    maxmemory policy (allkeys-lru).
+    """
+
+    def __init__(
+        self,
+        rules: SessionRules,
+        url: str = "redis://localhost:6379/0",
+        ttl: float = 3600,
+        prefix: str = "monkey:session:",
+        client=None,
+    ):
+        super().__init__(rules)
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError(
+                    "MONKEY_SESSION_BACKEND=redis needs the redis package (pip install redis)"
+                ) from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.url = url
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self._script = client.register_script(_REDIS_APPLY)
+
+    def load(self, session_id: str) -> SessionState:
+        return self.apply(session_id, [])
+
+    def apply(self, session_id: str, ops: List[List]) -> SessionState:
+        encoded = self._script(
+            keys=[self.prefix + session_id],
+            args=[
+                json.dumps(ops),
+                time.time(),
+                self.ttl,
+                max(1, config.SESSION_MUTATION_HISTORY),
+                self.rules.retry_entropy,
+                self.rules.collapse_attempts,
+                self.rules.collapse_entropy,
+                self.rules.max_entropy,
+                ENTROPY_DECIMALS,
+                COLLAPSE_MESSAGE,
+                RESET_MESSAGE,
+            ],
+        )
+        return SessionState.from_dict(json.loads(encoded))
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "url": self.url, "ttl_seconds": self.ttl}
+
+    def close(self):
+        self.client.close()
+
+
+def create_store(rules: SessionRules) -> SessionStore:
+    """The store selected by MONKEY_SESSION_BACKEND."""
+    backend = config.SESSION_BACKEND
+    if backend == "memory":
+        return MemorySessionStore(rules, config.SESSION_MAX, config.SESSION_TTL)
+    if backend == "sqlite":
+        return SQLiteSessionStore(rules, config.SESSION_SQLITE_PATH, config.SESSION_MAX, config.SESSION_TTL)
+    if backend == "redis":
+        return RedisSessionStore(rules, config.SESSION_REDIS_URL, config.SESSION_TTL)
+    raise ValueError(f"Unknown session backend: {backend!r} (expected memory, sqlite or redis)")
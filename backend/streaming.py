@@ -0,0 +1,226 @@
+"""
+Live Pose Streaming
+
+Real-time pose guidance for the live camera feed over a WebSocket
+(/stream). The client sends camera frames, one JPEG/PNG/WebP image per
+binary message, and gets an event whenever the guidance changes: pose
+found or lost, a new pose type, or a different monkey in the match
+preview. Frames that change nothing send nothing.
+
+Every connection owns a VIDEO-mode pose landmarker. After the first
+frame MediaPipe tracks the person from frame to frame instead of running
+the person detector again, which is much cheaper than IMAGE-mode
+detection. Frames are handled one at a time: a frame arriving while the
+previous one is still being processed is dropped, so a slow host lowers
+the guidance rate instead of building a backlog.
+
+The keypoints are smoothed over frames (PoseTracker) before they are
+classified, and a new pose type must hold for a few frames before it is
+shown, so jitter around a pose-type boundary doesn't flicker. The match
+preview only re-runs when the shown pose type changes or the smoothed
+pose moves by more than MONKEY_STREAM_REMATCH_DISTANCE.
+
+Streams run on their own threads in the API process, whatever
+MONKEY_POOL_KIND is: a tracking landmarker has to see all of its
+stream's frames in order, so it can't move between pool workers.
+Nothing is written to the session store; a streamed frame is not an
+attempt.
+"""
+
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import config
+from matching import MATCH_JOINTS, get_snapshot, preview_match
+from pose_types import classify_pose
+from timing import StageTimer
+from uploads import UploadRejected, check_header
+
+
+class PoseTracker:
+    """
+    Incremental guidance state for one stream: an exponentially smoothed
+    keypoint array, its pose type and the last match preview. A different
+    pose type replaces the shown one after `hold_frames` frames in a row.
+
+    update() takes each frame's detection and returns an event only when
+    something the client shows has changed.
+    """
+
+    def __init__(
+        self,
+        smoothing: float = config.STREAM_SMOOTHING,
+        rematch_distance: float = config.STREAM_REMATCH_DISTANCE,
+        hold_frames: int = config.STREAM_HOLD_FRAMES,
+    ):
+        self.smoothing = min(1.0, max(0.01, smoothing))
+        self.rematch_distance = rematch_distance
+        self.hold_frames = max(1, hold_frames)
+        self.smoothed: Optional[np.ndarray] = None
+        self.pose_type: Optional[str] = None
+        self.matched_pose: Optional[np.ndarray] = None  # smoothed keypoints at the last match
+        self.match: Optional[Dict] = None
+        self.matches = 0
+        self.events = 0
+        self._last_event: Optional[tuple] = None
+        self._challenger: Optional[str] = None  # pose type waiting to replace pose_type
+        self._challenger_frames = 0
+
+    def _settle(self, pose_type: str) -> str:
+        """The pose type to show, given this frame's classification."""
+        if self.matched_pose is None or pose_type == self.pose_type:
+            self._challenger, self._challenger_frames = None, 0
+            return pose_type
+        if pose_type == self._challenger:
+            self._challenger_frames += 1
+        else:
+            self._challenger, self._challenger_frames = pose_type, 1
+        if self._challenger_frames < self.hold_frames:
+            return self.pose_type
+        self._challenger, self._challenger_frames = None, 0
+        return pose_type
+
+    def _needs_match(self) -> bool:
+        if self.matched_pose is None or self.match is None:
+            return True
+        if self.match["dataset_version"] != get_snapshot().version:
+            return True
+        moved = np.linalg.norm(self.smoothed[MATCH_JOINTS] - self.matched_pose[MATCH_JOINTS], axis=1).mean()
+        return moved > self.rematch_distance
+
+    def update(
+        self,
+        keypoints: Optional[np.ndarray],
+        confidence: float,
+        pose_debug: Dict,
+        timer: Optional[StageTimer] = None,
+    ) -> Optional[Dict]:
+        """
+        Fold one frame in. Returns the event to send ({"pose_detected",
+        "pose_type", "match", ...}) or None if the guidance is unchanged.
+        """
+        timer = timer or StageTimer()
+        if keypoints is None:
+            # Start afresh when the person comes back, rather than blending
+            # the new pose with a stale one
+            self.smoothed = self.matched_pose = None
+        else:
+            with timer.stage("smooth"):
+                keypoints = np.asarray(keypoints, dtype=np.float64)
+                if self.smoothed is None:
+                    self.smoothed = keypoints.copy()
+                else:
+                    self.smoothed += self.smoothing * (keypoints - self.smoothed)
+            with timer.stage("classify"):
+                pose_type = self._settle(classify_pose(self.smoothed)[0])
+            if pose_type != self.pose_type or self._needs_match():
+                with timer.stage("match"):
+                    self.match = preview_match(self.smoothed, pose_type)
+                self.matched_pose = self.smoothed.copy()
+                self.pose_type = pose_type
+                self.matches += 1
+
+        detected = self.smoothed is not None
+        state = (
+            detected,
+            self.pose_type if detected else None,
+            self.match["monkey_id"] if detected and self.match else None,
+        )
+        if state == self._last_event:
+            return None
+        self._last_event = state
+        self.events += 1
+
+        event = {
+            "pose_detected": detected,
+            "pose_type": state[1],
+            "confidence": round(float(confidence), 3),
+            "partial": bool(pose_debug.get("partial", False)),
+        }
+        if detected:
+            event["match"] = self.match
+        else:
+            event["error"] = pose_debug.get("error")
+        return event
+
+
+class PoseStream:
+    """
+    One connection's tracking landmarker, PoseTracker and frame counters.
+
+    Not thread-safe: the endpoint hands it one frame at a time.
+    """
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id
+        self.landmarker = None
+        self.tracker = PoseTracker()
+        self.started = time.monotonic()
+        self.last_timestamp_ms = -1
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    def open(self):
+        """Create the VIDEO-mode landmarker (blocking; raises if the model can't be loaded)."""
+        from pose_detection import MODEL_PATH, create_pose_landmarker
+
+        if not os.path.exists(MODEL_PATH):
+            raise FileNotFoundError("Pose model not found (run: python download_model.py)")
+        self.landmarker = create_pose_landmarker(video=True)
+
+    def close(self):
+        if self.landmarker is not None:
+            self.landmarker.close()
+            self.landmarker = None
+
+    def _timestamp_ms(self) -> int:
+        # detect_for_video rejects timestamps that don't increase
+        now = int((time.monotonic() - self.started) * 1000)
+        self.last_timestamp_ms = max(now, self.last_timestamp_ms + 1)
+        return self.last_timestamp_ms
+
+    def process(self, data: bytes, frame_number: int) -> Tuple[Optional[dict], Dict[str, float]]:
+        """
+        Track the pose in one frame and update the guidance. Returns the
+        message for the client, if any ({"type": "pose", ...} when the
+        guidance changed, {"type": "error", ...} for a frame that isn't a
+        usable image, None otherwise) and the stage timings.
+        """
+        from frame import decode_frame
+        from pose_detection import extract_pose_from_video
+
+        timer = StageTimer()
+        try:
+            if len(data) > config.UPLOAD_MAX_BYTES:
+                raise UploadRejected(413, "upload_too_large", f"{len(data)} bytes exceeds {config.UPLOAD_MAX_BYTES}")
+            check_header(data)
+            with timer.stage("decode"):
+                frame = decode_frame(data)
+            if frame is None:
+                raise UploadRejected(415, "unsupported_media_type", "Could not decode image")
+        except UploadRejected as e:
+            return {"type": "error", "frame": frame_number, "error": e.error, "detail": e.detail}, timer.stages
+
+        with timer.stage("pose"):
+            keypoints, confidence, pose_debug = extract_pose_from_video(
+                self.landmarker, frame.mp_image, self._timestamp_ms(),
+            )
+        self.processed += 1
+
+        event = self.tracker.update(keypoints, confidence, pose_debug, timer)
+        if event is None:
+            return None, timer.stages
+        return {"type": "pose", "frame": frame_number, **event}, timer.stages
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "matches": self.tracker.matches,
+            "events": self.tracker.events,
+        }
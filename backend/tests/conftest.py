@@ -0,0 +1,6 @@
+"""Backend modules are flat (run from backend/), so tests import them the same way."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,22 @@
+"""/admin/reload-dataset is closed unless MONKEY_ADMIN_TOKEN is set."""
+
+from fastapi.testclient import TestClient
+
+import config
+import main
+
+
+def test_reload_disabled_without_token(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "")
+    with TestClient(main.app) as client:
+        response = client.post("/admin/reload-dataset")
+    assert response.status_code == 404
+
+
+def test_reload_requires_matching_token(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "secret")
+    with TestClient(main.app) as client:
+        assert client.post("/admin/reload-dataset", headers={"X-Admin-Token": "wrong"}).status_code == 403
+        response = client.post("/admin/reload-dataset", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["dataset"]["version"] > response.json()["previous_version"]
@@ -0,0 +1,70 @@
+"""/analyze/batch answers upload-limit rejections like /analyze: no attempt, no entropy."""
+
+from fastapi.testclient import TestClient
+
+import main
+from benchmark import synthetic_jpeg
+
+
+def test_rejected_file_costs_no_attempt():
+    files = [
+        ("images", ("a.gif", b"GIF89a" + b"\x00" * 100, "image/gif")),
+        ("images", ("b.jpg", synthetic_jpeg(64, 48), "image/jpeg")),
+    ]
+    with TestClient(main.app) as client:
+        body = client.post("/analyze/batch", files=files, headers={"X-Session-ID": "batch-rejects"}).json()
+    rejected, analysed = body["results"]
+    assert rejected == {"success": False, "error": "unsupported_media_type", "detail": rejected["detail"]}
+    assert analysed["attempt"] == 1
+    assert body["session"]["attempts"] == 1
+
+
+def test_uploads_are_read_one_window_at_a_time(monkeypatch):
+    import threading
+
+    lock = threading.Lock()
+    live = peak = 0
+    read_upload, run_detection = main.read_upload, main.run_detection
+
+    async def counting_read(upload):
+        nonlocal live, peak
+        data = await read_upload(upload)
+        with lock:
+            live += 1
+            peak = max(peak, live)
+        return data
+
+    def counting_detection(data, **kwargs):
+        nonlocal live
+        try:
+            return run_detection(data, **kwargs)
+        finally:
+            with lock:
+                live -= 1
+
+    monkeypatch.setattr(main, "read_upload", counting_read)
+    monkeypatch.setattr(main, "run_detection", counting_detection)
+    files = [("images", (f"{i}.jpg", synthetic_jpeg(64 + i, 48), "image/jpeg")) for i in range(6)]
+    with TestClient(main.app) as client:
+        body = client.post("/analyze/batch", files=files).json()
+        workers = main.detection_pool.workers
+    assert body["count"] == 6
+    assert peak <= workers
+
+
+def test_batch_total_is_capped(monkeypatch):
+    import config
+    from uploads import MULTIPART_OVERHEAD, upload_limits
+
+    assert upload_limits()["/analyze/batch"] == config.BATCH_MAX_BYTES + MULTIPART_OVERHEAD
+
+    jpeg = synthetic_jpeg(64, 48)
+    monkeypatch.setattr(config, "BATCH_MAX_BYTES", len(jpeg) * 2 - 1)
+    files = [("images", (f"{i}.jpg", jpeg, "image/jpeg")) for i in range(2)]
+    with TestClient(main.app) as client:
+        response = client.post("/analyze/batch", files=files, headers={"X-Session-ID": "batch-total"})
+        session = client.get("/session/batch-total").json()
+    assert response.status_code == 413
+    assert response.json()["error"] == "upload_too_large"
+    assert response.json()["max_bytes"] == len(jpeg) * 2 - 1
+    assert session.get("attempts", 0) == 0
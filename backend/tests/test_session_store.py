@@ -0,0 +1,42 @@
+"""The Redis store's Lua script applies ops exactly like apply_ops() does in memory."""
+
+import pytest
+
+from entropy import COLLAPSE_ATTEMPTS, COLLAPSE_ENTROPY, ENTROPY_RETRY, MAX_ENTROPY
+from session_store import COLLAPSE_MESSAGE, RESET_MESSAGE, MemorySessionStore, RedisSessionStore, SessionRules
+
+fakeredis = pytest.importorskip("fakeredis")
+
+RULES = SessionRules(ENTROPY_RETRY, COLLAPSE_ATTEMPTS, COLLAPSE_ENTROPY, MAX_ENTROPY)
+
+# Each step is applied as one batch; covers rounding, the max-entropy
+# clamp, collapse (once), reset and a second collapse after it
+STEPS = [
+    [],
+    [["attempt"]],
+    [["entropy", 0.15, "low_confidence"], ["entropy", 0.1, "partial_body"]],
+    [["entropy", 0.123456789, "mutation"]],
+    [["attempt"], ["attempt"]],
+    [["attempt"], ["entropy", 0.1, "partial_body"]],
+    [["attempt"]],
+    [["attempt"], ["entropy", 0.9, "mutation"]],
+    [["reset"]],
+    [["attempt"]] * 5,
+    [["reset"], ["attempt"]],
+]
+
+
+def snapshot(state):
+    return state.entropy, state.attempts, state.collapsed, list(state.mutations)
+
+
+def test_redis_script_matches_apply_ops():
+    memory = MemorySessionStore(RULES)
+    redis = RedisSessionStore(RULES, client=fakeredis.FakeRedis())
+    seen = []
+    for ops in STEPS:
+        expected = snapshot(memory.apply("s", ops))
+        assert snapshot(redis.apply("s", ops)) == expected
+        seen.extend(expected[3])
+    assert COLLAPSE_MESSAGE in seen and RESET_MESSAGE in seen
+    assert snapshot(redis.load("s")) == snapshot(memory.load("s"))
@@ -0,0 +1,57 @@
+"""Upload limits: format/size checks from the header, before decoding."""
+
+import asyncio
+import io
+import struct
+
+import cv2
+import numpy as np
+import pytest
+from starlette.datastructures import UploadFile
+
+import config
+from image_header import probe_image_header
+from uploads import PROBE_BYTES, UploadRejected, check_header, read_upload
+
+
+def jpeg_with_metadata(width: int = 640, height: int = 480, app1_segments: int = 3) -> bytes:
+    """A JPEG with large APP1 segments (like XMP / depth maps) between SOI and the frame header."""
+    ok, encoded = cv2.imencode(".jpg", np.full((height, width, 3), 128, dtype=np.uint8))
+    assert ok
+    jpeg = encoded.tobytes()
+    payload = b"http://ns.adobe.com/xap/1.0/\x00" + b"x" * (65533 - 29)
+    segment = b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+    return jpeg[:2] + segment * app1_segments + jpeg[2:]
+
+
+def read(data: bytes, known_size: bool = True) -> bytearray:
+    upload = UploadFile(io.BytesIO(data), size=len(data) if known_size else None)
+    return asyncio.run(read_upload(upload))
+
+
+def test_frame_header_past_probe_window_is_a_jpeg():
+    data = jpeg_with_metadata()
+    assert probe_image_header(data[:PROBE_BYTES]) is None
+    assert check_header(data[:PROBE_BYTES]) is None
+    assert probe_image_header(data).width == 640
+
+
+@pytest.mark.parametrize("known_size", [True, False])
+def test_read_upload_accepts_late_frame_header(known_size):
+    data = jpeg_with_metadata()
+    assert bytes(read(data, known_size)) == data
+    assert cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).shape == (480, 640, 3)
+
+
+@pytest.mark.parametrize("known_size", [True, False])
+def test_late_frame_header_still_checks_pixels(known_size, monkeypatch):
+    monkeypatch.setattr(config, "UPLOAD_MAX_PIXELS", 1000)
+    with pytest.raises(UploadRejected) as rejected:
+        read(jpeg_with_metadata(), known_size)
+    assert rejected.value.status_code == 413
+
+
+def test_wrong_signature_is_unsupported():
+    with pytest.raises(UploadRejected) as rejected:
+        read(b"GIF89a" + b"\x00" * 1000)
+    assert rejected.value.status_code == 415
@@ -0,0 +1,70 @@
+"""InferencePool.shutdown() doesn't wait out a warm-up that can't finish."""
+
+import threading
+import time
+
+from workers import InferencePool
+
+
+def test_shutdown_stops_warm_up():
+    pool = InferencePool("thread", workers=2, queue_size=0)
+    release = threading.Event()
+    pool.submit(release.wait)  # one worker busy, so the warm-up barrier can't fill
+
+    results = []
+    warm_up = threading.Thread(target=lambda: results.append(pool.warm_up(lambda: "ok", timeout=30)))
+    warm_up.start()
+    time.sleep(0.2)
+
+    started = time.monotonic()
+    release.set()
+    pool.shutdown()
+    warm_up.join(5)
+    assert not warm_up.is_alive()
+    assert time.monotonic() - started < 5
+
+
+def test_shutdown_stops_warm_up_with_queued_probes():
+    pool = InferencePool("thread", workers=1, queue_size=0)
+    release = threading.Event()
+    pool.submit(release.wait)  # the only worker is busy: the probe stays queued
+
+    results = []
+    warm_up = threading.Thread(target=lambda: results.append(pool.warm_up(lambda: "ok", timeout=30)))
+    warm_up.start()
+    time.sleep(0.2)
+
+    pool.shutdown(wait=False)  # cancels the queued probe
+    warm_up.join(5)
+    release.set()
+    assert not warm_up.is_alive()
+    assert results == [[]]
+
+
+def test_map_prepares_items_inside_the_window():
+    import asyncio
+
+    pool = InferencePool("thread", workers=2, queue_size=0)
+    lock = threading.Lock()
+    live = peak = 0
+
+    async def prepare(item):
+        nonlocal live, peak
+        if item == 3:
+            return None  # skipped, never submitted
+        with lock:
+            live += 1
+            peak = max(peak, live)
+        return item
+
+    def job(item):
+        nonlocal live
+        time.sleep(0.01)
+        with lock:
+            live -= 1
+        return item * 10
+
+    results = asyncio.run(pool.map(job, list(range(8)), window=2, prepare=prepare))
+    pool.shutdown()
+    assert results == [0, 10, 20, None, 40, 50, 60, 70]
+    assert peak <= 2
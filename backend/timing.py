@@ -0,0 +1,47 @@
+"""
+Per-Stage Timing
+
+Lightweight wall-clock spans for the /analyze pipeline, reported in
+milliseconds so the pool can be sized against the <3s capture-to-result
+budget from the PRD.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageTimer:
+    """Accumulates elapsed time per named stage."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block under `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, elapsed_ms: float):
+        """Record an externally measured duration."""
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    def merge(self, stages: Dict[str, float]):
+        """Fold in timings measured elsewhere (e.g. inside a worker)."""
+        for name, elapsed_ms in stages.items():
+            self.add(name, elapsed_ms)
+
+    def elapsed_ms(self) -> float:
+        """Wall-clock time since the timer was created."""
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        """Stage timings rounded for API responses, e.g. {"decode_ms": 12.3}."""
+        timings = {f"{name}_ms": round(elapsed, 2) for name, elapsed in self.stages.items()}
+        timings["total_ms"] = round(self.elapsed_ms(), 2)
+        return timings
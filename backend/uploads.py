@@ -0,0 +1,198 @@
+"""
+Upload Limits
+
+Keeps oversized or bogus uploads from ever reaching a worker:
+
+- UploadLimitMiddleware answers 413 from the Content-Length header before
+  the multipart body is parsed, and counts streamed bytes for requests
+  without one.
+- read_upload() copies an UploadFile's spooled data into one bytearray,
+  checking the image header (format and pixel size) from the first chunk.
+  That happens before the rest is read or anything is decoded. A JPEG
+  whose frame header sits behind large metadata segments (XMP, ICC,
+  depth maps) only has its size checked once more has been read. Decoders
+  wrap the bytearray with np.frombuffer, so no further copies are made.
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+
+import config
+import metrics
+from image_header import ImageHeader, probe_image_header, sniff_format
+
+# First read, large enough for a JPEG's EXIF/APP segments before the SOF
+PROBE_BYTES = 128 * 1024
+# Allowance for multipart boundaries and part headers per request
+MULTIPART_OVERHEAD = 64 * 1024
+SUPPORTED_FORMATS = ("jpeg", "png", "webp")
+
+CHAOS_MESSAGES = {
+    413: "This specimen is too powerful for our instruments.",
+    415: "Our instruments only recognise photographs of primates.",
+}
+
+
+class UploadRejected(Exception):
+    """An upload refused before decoding; carries the HTTP status to send."""
+
+    def __init__(self, status_code: int, error: str, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.error = error
+        self.detail = detail
+
+    def response(self) -> JSONResponse:
+        return rejection_response(self.status_code, self.error, self.detail)
+
+
+def rejection_response(status_code: int, error: str, detail: str, max_bytes: Optional[int] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "success": False,
+            "error": error,
+            "detail": detail,
+            "chaos_message": CHAOS_MESSAGES.get(status_code),
+            "max_bytes": max_bytes or config.UPLOAD_MAX_BYTES,
+            "max_pixels": config.UPLOAD_MAX_PIXELS,
+        },
+    )
+
+
+def check_header(data) -> Optional[ImageHeader]:
+    """
+    Raise UploadRejected unless `data` starts like a supported, sanely
+    sized image. Returns None when the signature is fine but the size
+    isn't in `data` yet; check again with more of the file, or let the
+    decoder decide once it is all read.
+    """
+    header = probe_image_header(data)
+    if header is None:
+        if sniff_format(data) not in SUPPORTED_FORMATS:
+            raise UploadRejected(415, "unsupported_media_type", "Expected a JPEG, PNG or WebP image")
+        return None
+    if header.format not in SUPPORTED_FORMATS:
+        raise UploadRejected(415, "unsupported_media_type", "Expected a JPEG, PNG or WebP image")
+    if config.UPLOAD_MAX_PIXELS > 0 and header.width * header.height > config.UPLOAD_MAX_PIXELS:
+        raise UploadRejected(
+            413, "image_too_large",
+            f"{header.width}x{header.height} exceeds {config.UPLOAD_MAX_PIXELS} pixels",
+        )
+    return header
+
+
+def _too_many_bytes(size: int) -> UploadRejected:
+    return UploadRejected(413, "upload_too_large", f"{size} bytes exceeds {config.UPLOAD_MAX_BYTES}")
+
+
+async def read_upload(upload: UploadFile) -> bytearray:
+    """
+    Read an upload into a single bytearray, enforcing the byte, format and
+    pixel limits. The header is checked after the first PROBE_BYTES, so a
+    rejected upload is never read in full, unless its size only shows up
+    further in (then it is checked as more arrives, up to the byte limit).
+    """
+    max_bytes = config.UPLOAD_MAX_BYTES
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_many_bytes(upload.size)
+
+    if upload.size is not None:
+        # Size known: one allocation, the spooled file is read straight into it
+        buffer = bytearray(upload.size)
+        with memoryview(buffer) as view:
+            probed = await asyncio.to_thread(upload.file.readinto, view[:PROBE_BYTES]) or 0
+            header = check_header(view[:probed])
+            filled = probed + (await asyncio.to_thread(upload.file.readinto, view[probed:]) or 0)
+            if header is None:
+                # Frame header past the probe window: check the whole file
+                check_header(view[:filled])
+        del buffer[filled:]
+        return buffer
+
+    buffer = bytearray(await upload.read(PROBE_BYTES))
+    header = check_header(buffer)
+    while True:
+        chunk = await upload.read(PROBE_BYTES)
+        if not chunk:
+            return buffer
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise _too_many_bytes(len(buffer))
+        if header is None:
+            header = check_header(buffer)
+
+
+class BodyTooLarge(Exception):
+    """Raised from receive() once a streamed body passes its limit."""
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware capping request bodies per path. Requests that declare
+    a larger Content-Length get 413 without their body being read. Bodies
+    without one are counted as they stream in; past the limit, receive()
+    raises, so form parsing fails before the endpoint runs, and the app's
+    error response is replaced by the 413.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        rejection = rejection_response(413, "upload_too_large", f"Request body exceeds {limit} bytes")
+        headers = dict(scope.get("headers") or [])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            metrics.REJECTED_REQUESTS.inc(reason="upload_too_large")
+            await rejection(scope, receive, send)
+            return
+
+        received = 0
+        over_limit = False
+        replaced: Optional[bool] = None
+
+        async def limited_receive():
+            nonlocal received, over_limit
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    if not over_limit:
+                        metrics.REJECTED_REQUESTS.inc(reason="upload_too_large")
+                    over_limit = True
+                    raise BodyTooLarge(f"{received} bytes")
+            return message
+
+        async def guarded_send(message):
+            nonlocal replaced
+            if message["type"] == "http.response.start":
+                replaced = over_limit
+                if replaced:
+                    await rejection(scope, receive, send)
+                    return
+            if not replaced:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except BodyTooLarge:
+            if replaced is None:
+                await rejection(scope, receive, send)
+
+
+def upload_limits() -> Dict[str, int]:
+    """Body limits for the upload endpoints."""
+    return {
+        "/analyze": config.UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD,
+        "/analyze/batch": config.BATCH_MAX_BYTES + MULTIPART_OVERHEAD,
+    }
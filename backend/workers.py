@@ -0,0 +1,215 @@
+"""
+Bounded Inference Worker Pool
+
+Runs blocking detection work (decode + MediaPipe) off the asyncio event
+loop, so one slow upload can't stall /health or other requests.
+
+The pool admits at most `workers + queue_size` jobs at a time. Anything
+beyond that is refused immediately with PoolSaturated, which the API turns
+into a 503 so clients back off instead of piling up.
+"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, List, Optional
+
+import config
+
+
+class PoolSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class InferencePool:
+    """Thread or process pool with a bounded admission queue."""
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        workers: int = 2,
+        queue_size: int = 8,
+        initializer: Optional[Callable] = None,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool kind: {kind!r} (expected 'thread' or 'process')")
+
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.capacity = self.workers + self.queue_size
+        self.initializer = initializer
+
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._barrier = None  # the running warm-up's barrier, so shutdown() can break it
+        self._executor = self._create_executor()
+
+    @classmethod
+    def from_config(cls, initializer: Optional[Callable] = None) -> "InferencePool":
+        return cls(config.POOL_KIND, config.POOL_WORKERS, config.POOL_QUEUE_SIZE, initializer)
+
+    def _create_executor(self) -> Executor:
+        if self.kind == "process":
+            # spawn, not fork: forking a process that already runs MediaPipe
+            # graphs and an event loop is not safe
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer,
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="inference",
+            initializer=self.initializer,
+        )
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue `fn(*args)` or raise PoolSaturated if the queue is full."""
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated(f"{self.capacity} jobs already in flight")
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    async def run(self, fn: Callable, *args):
+        """Await `fn(*args)` on the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    async def map(
+        self,
+        fn: Callable,
+        items: List,
+        window: Optional[int] = None,
+        prepare: Optional[Callable[[Any], Awaitable]] = None,
+    ) -> List:
+        """
+        Run `fn` over `items` concurrently, returning results in input order.
+        
+        At most `window` items are in flight at once. Only the first
+        admission may raise PoolSaturated; once a batch is accepted, later
+        items wait for a free slot instead of failing half-way through.
+        
+        With `prepare`, each item becomes fn's argument through
+        `await prepare(item)` inside the window, so e.g. an upload is only
+        read once a slot is free, and let go when its job is done. Items
+        prepared to None are skipped; their result is None.
+        """
+        if not items:
+            return []
+        gate = asyncio.Semaphore(max(1, window or self.capacity))
+        admitted = False
+
+        async def run_item(item):
+            nonlocal admitted
+            async with gate:
+                arg = item if prepare is None else await prepare(item)
+                if arg is None and prepare is not None:
+                    return None
+                if admitted:
+                    future = await self._submit_when_free(fn, arg)
+                else:
+                    future = self.submit(fn, arg)
+                    admitted = True
+                del arg
+                return await asyncio.wrap_future(future)
+
+        tasks = [asyncio.ensure_future(run_item(item)) for item in items]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # Refused (or cancelled): don't leave the rest reading and queueing
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def _submit_when_free(self, fn: Callable, *args) -> Future:
+        while True:
+            try:
+                return self.submit(fn, *args)
+            except PoolSaturated:
+                await asyncio.sleep(0.01)
+
+    def warm_up(self, probe: Callable, timeout: float = 60.0) -> List:
+        """
+        Start every worker now instead of on first use.
+        
+        Submits one probe per worker; each probe waits on a barrier until all
+        of them are running, so every worker is forced to start (running the
+        initializer first) and none can steal another's probe. Returns the
+        probe results. Blocks - call it from a thread, not the event loop;
+        shutdown() makes it return early.
+        """
+        if self.kind == "process":
+            # A Manager barrier proxy can be pickled to worker processes
+            with multiprocessing.get_context("spawn").Manager() as manager:
+                return self._run_probes(probe, manager.Barrier(self.workers), timeout)
+        return self._run_probes(probe, threading.Barrier(self.workers), timeout)
+
+    def _run_probes(self, probe: Callable, barrier, timeout: float) -> List:
+        with self._lock:
+            if self._stopping.is_set():
+                return []
+            self._barrier = barrier
+            futures = [
+                self._executor.submit(_probe_after_barrier, probe, barrier, timeout)
+                for _ in range(self.workers)
+            ]
+        # Poll in short slices: shutdown() aborts the barrier, releasing the
+        # probes at once, and cancels queued ones - which wait() never counts
+        # as done. The probes still finish before a process pool's Manager
+        # closes
+        deadline = time.monotonic() + timeout
+        while True:
+            pending = [f for f in futures if not f.done()]
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            wait(pending, timeout=min(0.1, remaining))
+        self._barrier = None
+        return [f.result() for f in futures if f.done() and not f.cancelled() and f.exception() is None]
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+        }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            self._stopping.set()
+            barrier = self._barrier
+        if barrier is not None:
+            # Release probes still waiting for the rest of a warm-up
+            try:
+                barrier.abort()
+            except Exception:
+                pass  # the warm-up's Manager may already be gone
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _probe_after_barrier(probe: Callable, barrier, timeout: float):
+    """Hold this worker until every worker has picked up a probe."""
+    try:
+        barrier.wait(timeout)
+    except threading.BrokenBarrierError:
+        pass
+    return probe()